@@ -1,12 +1,20 @@
 import asyncio
+import concurrent.futures
 import datetime
+import json
 import os
+import time
 import uuid
 from asyncio import AbstractEventLoop
+from concurrent.futures import ThreadPoolExecutor
 
 import importlib
 import sys
+import threading
 from grpclib.client import Channel
+import execution_plan
+import state_store
+from aws_context import AwsContext
 from model import SecurityReportTestResult, SecurityReportIngestionServiceStub, SecurityReportContext, SecurityReport, \
     SecurityReportTestResultResult
 from model.helper import struct_from_dict
@@ -51,82 +59,578 @@ def _to_model(log_message, execution_id, provider, service, start_time, end_time
 )
 
 
+def _encoded_field_size(message) -> int:
+    # Serialized size of a message once embedded as a length-delimited field (tag + length varint + payload)
+    payload_size = len(bytes(message))
+    length_prefix_size = 1
+    while payload_size >= 128 ** length_prefix_size:
+        length_prefix_size += 1
+    return 1 + length_prefix_size + payload_size
+
+
+def _chunk_test_results(test_results, base_size, max_bytes, max_results):
+    chunk = []
+    chunk_size = base_size
+    for test_result in test_results:
+        test_result_size = _encoded_field_size(test_result)
+        if chunk and (chunk_size + test_result_size > max_bytes or len(chunk) >= max_results):
+            yield chunk
+            chunk = []
+            chunk_size = base_size
+        chunk.append(test_result)
+        chunk_size += test_result_size
+    if chunk:
+        yield chunk
+
+
+async def _gather_scans(scans):
+    # Every scan is finished before the first failure is raised, the executor would otherwise block the loop
+    # waiting for worker threads that are themselves waiting for the loop
+    for scan_result in await asyncio.gather(*scans, return_exceptions=True):
+        if isinstance(scan_result, Exception):
+            raise scan_result
+
+
+class _TesterResults:
+    def __init__(self):
+        self.count = 0
+        self.batches_valid = True
+        self.interrupted = False
+
+
+class _Checkpoint:
+    # Progress of an execution kept across the invocations interrupted by their deadline. Jobs are identified by
+    # the id of their shard, the cursor of a job counts its results already shipped per item and test.
+    # Updated by the worker threads and saved while they run, hence the lock
+    def __init__(self, state=None):
+        state = state or {}
+        self.resumed = bool(state)
+        self.completed = set(state.get("completed", []))
+        self.failed = set(state.get("failed", []))
+        self.cursors = dict(state.get("cursors", {}))
+        self.interrupted = False
+        self.progressed = False
+        self.lock = threading.Lock()
+
+    def set_cursor(self, job_id, counts):
+        with self.lock:
+            self.cursors[job_id] = dict(counts)
+            self.progressed = True
+
+    def fail(self, job_id):
+        with self.lock:
+            self.failed.add(job_id)
+
+    def complete(self, job_id, failed=False):
+        with self.lock:
+            if failed:
+                self.failed.add(job_id)
+            self.completed.add(job_id)
+            self.cursors.pop(job_id, None)
+            self.progressed = True
+
+    def to_state(self) -> dict:
+        with self.lock:
+            return {"completed": sorted(self.completed), "failed": sorted(self.failed),
+                    "cursors": {job_id: dict(counts) for job_id, counts in self.cursors.items()}}
+
+
 class AutoPostureEvaluator:
     def __init__(self):
         if not os.environ.get('PRIVATE_KEY'):
             raise Exception("Missing the PRIVATE_KEY environment variable. CANNOT CONTINUE")
 
         # Configuration for grpc endpoint
-        endpoint = os.environ.get("CORALOGIX_ENDPOINT_HOST")  # eg.: ng-api-grpc.dev-shared.coralogix.net
-        port = os.environ.get("CORALOGIX_ENDPOINT_PORT", "443")
-        self.channel = Channel(host=endpoint, port=int(port), ssl=True)
-        self.client = SecurityReportIngestionServiceStub(channel=self.channel)
+        self.endpoint = os.environ.get("CORALOGIX_ENDPOINT_HOST")  # eg.: ng-api-grpc.dev-shared.coralogix.net
+        self.port = int(os.environ.get("CORALOGIX_ENDPOINT_PORT", "443"))
+        # A warm Lambda container may have been frozen long enough for the connection to be silently dropped
+        self.channel_max_idle_seconds = int(os.environ.get("AUTOPOSTURE_CHANNEL_MAX_IDLE_SECONDS", "240"))
+        self._connect()
         self.private_key = os.environ.get('PRIVATE_KEY')
         self.context = SecurityReportContext(
             private_key=self.private_key,
             application_name=os.environ.get('APPLICATION_NAME', 'NO_APP_NAME'),
             subsystem_name=os.environ.get('SUBSYSTEM_NAME', 'NO_SUB_NAME'),
             computer_name="CoralogixServerlessLambda")
+        # Testers are I/O bound, so they are executed side by side on a thread pool
+        self.max_workers = int(os.environ.get("AUTOPOSTURE_MAX_WORKERS", "4"))
+        # Number of finished reports allowed to wait for the sender before testers are held back
+        self.report_queue_size = int(os.environ.get("AUTOPOSTURE_REPORT_QUEUE_SIZE", "2"))
+        # Reports are split to stay below the gRPC message size limit (4MB by default)
+        self.max_report_bytes = int(os.environ.get("AUTOPOSTURE_MAX_REPORT_BYTES", str(3 * 1024 * 1024)))
+        self.max_report_results = int(os.environ.get("AUTOPOSTURE_MAX_REPORT_RESULTS", "1000"))
+        self.max_inflight_reports = int(os.environ.get("AUTOPOSTURE_MAX_INFLIGHT_REPORTS", "4"))
+        # One boto3 session, client pool and caller identity shared by every tester
+        self.aws_context = AwsContext()
+        # Comma separated region names or "all" for every region enabled in the account, the default region otherwise
+        self.regions_setting = os.environ.get("AUTOPOSTURE_REGIONS", "").strip()
+        # Comma separated account ids or role arns scanned through assumed roles, the Lambda account otherwise
+        self.accounts_setting = os.environ.get("AUTOPOSTURE_ACCOUNTS", "").strip()
+        self.assume_role_name = os.environ.get("AUTOPOSTURE_ASSUME_ROLE_NAME", "OrganizationAccountAccessRole")
+        self.assume_role_duration = int(os.environ.get("AUTOPOSTURE_ASSUME_ROLE_DURATION_SECONDS", "3600"))
+        # Accounts scanned at the same time, their testers share the tester thread pool
+        self.account_max_workers = int(os.environ.get("AUTOPOSTURE_ACCOUNT_MAX_WORKERS", "4"))
+        # Resource shards planned for each shardable tester when the scan is split across invocations
+        self.resource_shards = int(os.environ.get("AUTOPOSTURE_RESOURCE_SHARDS", "1"))
+        self.state_store = state_store.get_state_store(self.aws_context)
+        self.aws_context.state_store = self.state_store
+        # Time left for reports to drain and the checkpoint to be saved once the deadline stops the testers
+        self.deadline_margin_seconds = int(os.environ.get("AUTOPOSTURE_DEADLINE_MARGIN_SECONDS", "60"))
+        self.deadline = None
+        # The checkpoint is also saved while the scan runs, so a hard timeout loses at most this much progress
+        self.checkpoint_interval_seconds = int(os.environ.get("AUTOPOSTURE_CHECKPOINT_INTERVAL_SECONDS", "10"))
+        self.checkpoint = _Checkpoint()
+        self.checkpoint_key = None
+        self.checkpoint_saved_at = None
+        self.checkpoint_save_lock = threading.Lock()
         self.tests = []
+        self.tester_names = []
         for tester_module in testers_module_names:
             if "Tester" in sys.modules[tester_module].__dict__:
                 self.tests.append(sys.modules[tester_module].__dict__["Tester"])
+                self.tester_names.append(tester_module)
+
+    def _connect(self):
+        self.channel = Channel(host=self.endpoint, port=self.port, ssl=True)
+        self.client = SecurityReportIngestionServiceStub(channel=self.channel)
+        self.channel_last_used = time.monotonic()
+        self.channel_broken = False
+
+    def ensure_channel(self):
+        if self.channel_broken or time.monotonic() - self.channel_last_used > self.channel_max_idle_seconds:
+            print("DEBUG: Reconnecting the stale gRPC channel to " + str(self.endpoint))
+            self.channel.close()
+            self._connect()
+
+    def close(self):
+        self.channel.close()
+
+    def run_tests(self, execution_id=None, remaining_seconds=None, function_name=None, resume=True):
+        # An execution_id resumes the scan from the checkpoint saved when its last invocation ran out of time.
+        # Without resume, the scan starts under that id unless a checkpoint was left by a killed attempt
+        if execution_id is None:
+            execution_id = str(uuid.uuid4())
+            checkpoint_key = execution_plan.get_checkpoint_key(execution_id)
+            checkpoint = _Checkpoint()
+        else:
+            checkpoint_key = execution_plan.get_checkpoint_key(execution_id)
+            checkpoint = self._load_checkpoint(execution_id, checkpoint_key, resume)
+        checkpoint = self._run_until_deadline(execution_id, None, checkpoint_key, checkpoint, remaining_seconds)
+        if checkpoint.interrupted:
+            self._resume_later(function_name, execution_id, {"execution_id": execution_id}, checkpoint)
+
+    def _load_checkpoint(self, execution_id, checkpoint_key, required) -> _Checkpoint:
+        state = self.state_store.get(checkpoint_key)
+        # Scanning again from the start would ship every result of the execution a second time
+        if state is None and required:
+            raise Exception("No checkpoint of the execution " + execution_id + " was found in the state store, "
+                            "it cannot be resumed")
+        return _Checkpoint(state)
+
+    def _run_until_deadline(self, execution_id, shards, checkpoint_key, checkpoint, remaining_seconds) -> _Checkpoint:
+        self.checkpoint = checkpoint
+        self.checkpoint_key = checkpoint_key
+        self.checkpoint_saved_at = None
+        self.deadline = None
+        if remaining_seconds is not None:
+            # A margin longer than a short timeout would stop the testers before they start
+            margin_seconds = min(self.deadline_margin_seconds, remaining_seconds / 4)
+            self.deadline = time.monotonic() + remaining_seconds - margin_seconds
+        self.ensure_channel()
+        loop: AbstractEventLoop = asyncio.get_event_loop()
+        loop.run_until_complete(self._run_pipeline(loop, execution_id, shards))
+        if self.checkpoint.interrupted:
+            self.state_store.put(checkpoint_key, self.checkpoint.to_state())
+        elif self.checkpoint.resumed or self.checkpoint_saved_at is not None:
+            self.state_store.delete(checkpoint_key)
+        return self.checkpoint
+
+    def _save_checkpoint(self):
+        # Saved while the scan runs, so an invocation killed by its hard timeout still leaves its progress behind.
+        # A single save at a time, an older state can never overwrite a newer one
+        if not self.checkpoint_save_lock.acquire(blocking=False):
+            return
+        try:
+            if self.checkpoint_saved_at is not None and \
+                    time.monotonic() - self.checkpoint_saved_at < self.checkpoint_interval_seconds:
+                return
+            self.state_store.put(self.checkpoint_key, self.checkpoint.to_state())
+            self.checkpoint_saved_at = time.monotonic()
+        except Exception as ex:
+            print("WARN: The checkpoint could not be saved: " + str(ex))
+        finally:
+            self.checkpoint_save_lock.release()
 
-    def run_tests(self):
+    def _is_past_deadline(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def _resume_later(self, function_name, execution_id, event, checkpoint):
+        # The next invocation most likely runs in another container, which only sees a shared store
+        if function_name is not None and not self.state_store.shared:
+            print("WARN: The execution " + execution_id + " was interrupted by its deadline but its checkpoint is "
+                  "local to this container, set AUTOPOSTURE_STATE_STORE to an s3:// location to resume it in a new "
+                  "invocation")
+            return
+        # An invocation that made no progress would only be interrupted again
+        if function_name is None or not checkpoint.progressed:
+            print("WARN: The execution " + execution_id + " was interrupted by its deadline, invoke the function "
+                  "again with the same execution_id to resume it")
+            return
+        print("DEBUG: The execution " + execution_id + " was interrupted by its deadline, resuming it in a new "
+              "invocation")
+        self._invoke_async(function_name, event)
+
+    def start_execution(self, function_name) -> dict:
+        # Coordinator: plans the scan and hands every shard to its own asynchronous invocation of the function
+        self._require_shared_state_store()
         execution_id = str(uuid.uuid4())
+        plan = self.get_execution_plan()
+        self.state_store.put(execution_plan.get_plan_key(execution_id), {"started": time.time(), "shards": plan})
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(lambda shard: self._invoke_async(function_name, {"execution_id": execution_id,
+                                                                               "shard": shard}), plan))
+        print("DEBUG: Started the execution " + execution_id + " with " + str(len(plan)) + " shards")
+        return {"execution_id": execution_id, "shards": len(plan)}
+
+    def _invoke_async(self, function_name, event):
+        self.aws_context.client('lambda').invoke(FunctionName=function_name, InvocationType='Event',
+                                                 Payload=json.dumps(event))
+
+    def get_execution_plan(self) -> list:
+        role_arns = self._get_accounts()
+        with ThreadPoolExecutor(max_workers=self.account_max_workers) as executor:
+            account_contexts = list(executor.map(self._get_account_context, role_arns))
+        accounts = [(role_arn, aws_context.regions) for role_arn, aws_context in zip(role_arns, account_contexts)
+                    if aws_context is not None]
+        return execution_plan.build_execution_plan(zip(self.tester_names, self.tests), accounts,
+                                                   self.resource_shards)
+
+    def run_shard(self, execution_id, shard, remaining_seconds=None, function_name=None, resume=False):
+        # A shard retried by Lambda picks up where its failed invocation stopped, when it left a checkpoint.
+        # A shard resumed after its deadline must find one
+        checkpoint_key = execution_plan.get_checkpoint_key(execution_id, shard)
+        checkpoint = self._load_checkpoint(execution_id, checkpoint_key, resume)
+        checkpoint = self._run_until_deadline(execution_id, [shard], checkpoint_key, checkpoint, remaining_seconds)
+        if checkpoint.interrupted:
+            self._resume_later(function_name, execution_id,
+                               {"execution_id": execution_id, "shard": shard, "resume": True}, checkpoint)
+            return
+        # Recorded for the coordinator, a shard with a crashed tester is reported as failed
+        # and a shard only ever has one marker, a retry replaces the outcome of the previous attempt
+        shard_status, stale_status = ("failed", "completed") if checkpoint.failed else ("completed", "failed")
+        self.state_store.put(execution_plan.get_shard_status_key(execution_id, shard_status, shard),
+                             {"finished": time.time(), "shard": shard})
+        self.state_store.delete(execution_plan.get_shard_status_key(execution_id, stale_status, shard))
+
+    def _require_shared_state_store(self):
+        # The shards run in other containers, the coordinator would never see what they record in a local store
+        if not self.state_store.shared:
+            raise Exception("A sharded execution needs a state store shared by every invocation of the function, "
+                            "set AUTOPOSTURE_STATE_STORE to an s3:// location")
+
+    def get_execution_status(self, execution_id) -> dict:
+        self._require_shared_state_store()
+        plan = self.state_store.get(execution_plan.get_plan_key(execution_id))
+        if plan is None:
+            raise Exception("The execution " + execution_id + " was not found in the state store")
+        status = {"execution_id": execution_id, "shards": len(plan["shards"])}
+        for shard_status in ("completed", "failed"):
+            status[shard_status] = len(self.state_store.list_keys(
+                execution_plan.get_shard_status_prefix(execution_id, shard_status)))
+        status["pending"] = status["shards"] - status["completed"] - status["failed"]
+        return status
+
+    def _get_accounts(self) -> list:
+        # Role arns to assume, None stands for the account of the Lambda credentials
+        if not self.accounts_setting:
+            return [None]
+        partition = self.aws_context.account_arn.split(':')[1]
+        accounts = []
+        for account in self.accounts_setting.split(','):
+            account = account.strip()
+            if account.startswith("arn:"):
+                accounts.append(account)
+            elif account:
+                accounts.append("arn:" + partition + ":iam::" + account + ":role/" + self.assume_role_name)
+        return accounts
+
+    def _get_account_context(self, role_arn):
+        # None when the account cannot be accessed, it is then skipped
+        try:
+            if role_arn is None:
+                aws_context = self.aws_context
+            else:
+                aws_context = self.aws_context.for_role(role_arn, "autoposture-evaluator", self.assume_role_duration)
+            aws_context.regions = self._get_regions(aws_context)
+        except Exception as ex:
+            print("WARN: The account " + str(role_arn) + " could not be accessed. SKIPPED: " + str(ex))
+            return None
+        return aws_context
+
+    def _get_regions(self, aws_context) -> list:
+        if not self.regions_setting:
+            return [aws_context.region_name]
+        if self.regions_setting.lower() == "all":
+            response = aws_context.client('ec2').describe_regions()
+            return sorted(region['RegionName'] for region in response['Regions'])
+        return [region.strip() for region in self.regions_setting.split(',') if region.strip()]
+
+    def _get_scan_jobs(self, regions) -> list:
+        # Regional testers are fanned out to every region, global ones are scanned once per account
+        jobs = []
         for i in range(0, len(self.tests)):
-            cur_test_start_timestamp = datetime.datetime.now()
-            tester = self.tests[i]
-            try:
-                cur_tester = tester()
-                tester_result = cur_tester.run_tests()
-                cur_test_end_timestamp = datetime.datetime.now()
-            except Exception as exTesterException:
-                print("WARN: The tester " + str(testers_module_names[i]) +
-                      " has crashed with the following exception during 'run_tests()'. SKIPPED: " +
-                      str(exTesterException))
+            if self.tests[i].scope == "global":
+                jobs.append((i, None, 0, 1))
+            elif self.tests[i].scope == "regional":
+                jobs.extend((i, region, 0, 1) for region in regions)
+        return jobs
+
+    def _get_shard_jobs(self, shards):
+        # The jobs of planned shards, grouped by account like the jobs of a whole scan
+        external_jobs = []
+        jobs_by_account = {}
+        for shard in shards:
+            if shard["tester"] not in self.tester_names:
+                raise Exception("The tester " + str(shard["tester"]) + " of the shard is not available")
+            i = self.tester_names.index(shard["tester"])
+            job = (i, shard["region"], shard["shard_index"], shard["shard_count"])
+            if self.tests[i].scope == "external":
+                external_jobs.append(job)
+            else:
+                jobs_by_account.setdefault(shard["account"], []).append(job)
+        return external_jobs, list(jobs_by_account.items())
+
+    async def _run_pipeline(self, loop, execution_id, shards=None):
+        # Jobs are (tester index, region, shard index, shard count), a whole scan plans those of each account once
+        # its regions are known
+        if shards is None:
+            external_jobs = [(i, None, 0, 1) for i in range(0, len(self.tests)) if self.tests[i].scope == "external"]
+            account_jobs = [(role_arn, None) for role_arn in self._get_accounts()]
+        else:
+            external_jobs, account_jobs = self._get_shard_jobs(shards)
+        # Testers produce reports on worker threads while a single sender posts them over the channel
+        reports = asyncio.Queue(maxsize=self.report_queue_size)
+        sender = asyncio.ensure_future(self._drain_reports(reports))
+        accounts = asyncio.Semaphore(self.account_max_workers)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                # Testers outside of AWS are scanned once, whatever the accounts
+                scans = [loop.run_in_executor(executor, self._scan_tester, self.aws_context, None, job, execution_id,
+                                              reports, loop)
+                         for job in external_jobs]
+                scans.extend(self._scan_account(loop, executor, accounts, role_arn, jobs, execution_id, reports)
+                             for role_arn, jobs in account_jobs)
+                await _gather_scans(scans)
+            await reports.put(None)
+            await sender
+        finally:
+            # Not left behind on the loop when the scans failed, the reports it still holds are given up
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+
+    async def _scan_account(self, loop, executor, accounts, role_arn, jobs, execution_id, reports):
+        async with accounts:
+            if self._is_past_deadline():
+                self.checkpoint.interrupted = True
+                return
+            aws_context = await loop.run_in_executor(executor, self._get_account_context, role_arn)
+            if aws_context is None:
+                self.checkpoint.fail(str(role_arn))
+                return
+            if jobs is None:
+                jobs = self._get_scan_jobs(aws_context.regions)
+            await _gather_scans([loop.run_in_executor(executor, self._scan_tester, aws_context, role_arn, job,
+                                                      execution_id, reports, loop)
+                                 for job in jobs])
+
+    def _scan_tester(self, account_context, role_arn, job, execution_id, reports, loop):
+        i, region, shard_index, shard_count = job
+        job_id = execution_plan.get_shard_id(execution_plan.get_shard(
+            self.tester_names[i], None if self.tests[i].scope == "external" else role_arn, region, shard_index,
+            shard_count))
+        if job_id in self.checkpoint.completed:
+            return
+        # No new tester is started past the deadline
+        if self._is_past_deadline():
+            self.checkpoint.interrupted = True
+            return
+        cur_test_start_timestamp = datetime.datetime.now()
+        base_size = len(bytes(SecurityReport(context=self.context)))
+        tester_results = _TesterResults()
+        chunk_index = 0
+        # Results shipped by the previous invocations of the execution. The cursor only moves past the results
+        # the sender has posted, a resume sends the others again
+        shipped_results = execution_plan.ShippedResults(self.checkpoint.cursors.get(job_id))
+        sent_results = execution_plan.ShippedResults(self.checkpoint.cursors.get(job_id))
+        sent_chunks = []
+        delivered = True
+        job_name = str(self.tester_names[i]) + ("" if region is None else " in " + region)
+        try:
+            if account_context is not self.aws_context and self.tests[i].scope != "external":
+                job_name += " of account " + str(account_context.account_id)
+            aws_context = account_context if region is None else account_context.for_region(region)
+            if shard_count > 1:
+                job_name += " (shard " + str(shard_index + 1) + "/" + str(shard_count) + ")"
+                aws_context = aws_context.for_shard(shard_index, shard_count)
+            cur_tester = self.tests[i](aws_context)
+            test_results = self._iter_test_results(cur_tester, execution_id, cur_test_start_timestamp,
+                                                   tester_results, region, shipped_results)
+            # Results are converted and shipped batch by batch, only the chunk being filled is kept in memory
+            for chunk in _chunk_test_results(test_results, base_size, self.max_report_bytes,
+                                             self.max_report_results):
+                report = SecurityReport(context=self.context, test_results=chunk)
+                sent = concurrent.futures.Future()
+                # Blocks the worker while the queue is full, so finished scans cannot pile up in memory
+                asyncio.run_coroutine_threadsafe(reports.put((job_name, chunk_index, report, sent)), loop).result()
+                chunk_index += 1
+                sent_chunks.append(([(test_result.item, test_result.name) for test_result in chunk], sent))
+                delivered = self._acknowledge_chunks(job_id, sent_chunks, sent_results) and delivered
+        except Exception as exTesterException:
+            print("WARN: The tester " + job_name +
+                  " has crashed with the following exception during 'run_tests()'. SKIPPED" +
+                  (" the results after chunk " + str(chunk_index) if chunk_index else "") + ": " +
+                  str(exTesterException))
+            self._acknowledge_chunks(job_id, sent_chunks, sent_results, True)
+            self._complete_job(job_id, True)
+            return
+        delivered = self._acknowledge_chunks(job_id, sent_chunks, sent_results, True) and delivered
+        # The rest of the tester is left to the next invocation, from the results posted so far
+        if tester_results.interrupted:
+            print("DEBUG: The deadline interrupted the tester " + job_name + " after " +
+                  str(sent_results.total()) + " results")
+            self.checkpoint.interrupted = True
+            return
+        # The sender already reported the lost reports, the job is recorded as failed
+        self._complete_job(job_id, not delivered)
+        # A resource shard can be empty and unchanged resources may be left out on purpose
+        skipped_results = cur_tester.fingerprints is not None and cur_tester.fingerprints.skipped
+        if tester_results.count == 0 and tester_results.batches_valid and shard_count == 1 and not skipped_results:
+            print("The result object from the tester " + cur_tester.declare_tested_service() +
+                  " does not match the required standard (Empty array).")
+
+    def _acknowledge_chunks(self, job_id, sent_chunks, sent_results, wait=False) -> bool:
+        # Moves the cursor of the job past its chunks the sender is done with, False when one of them was lost
+        if wait:
+            concurrent.futures.wait([sent for _, sent in sent_chunks])
+        done_chunks = [sent_chunk for sent_chunk in sent_chunks if sent_chunk[1].done()]
+        if not done_chunks:
+            return True
+        sent_chunks[:] = [sent_chunk for sent_chunk in sent_chunks if not sent_chunk[1].done()]
+        delivered = True
+        for result_keys, sent in done_chunks:
+            if not sent.result():
+                delivered = False
                 continue
+            for item, test_name in result_keys:
+                sent_results.add(item, test_name)
+        self.checkpoint.set_cursor(job_id, sent_results.counts)
+        self._save_checkpoint()
+        return delivered
+
+    def _complete_job(self, job_id, failed=False):
+        self.checkpoint.complete(job_id, failed)
+        self._save_checkpoint()
 
-            error_template = "The result object from the tester " + cur_tester.declare_tested_service() + \
-                             " does not match the required standard"
+    def _iter_test_results(self, cur_tester, execution_id, cur_test_start_timestamp, tester_results, region=None,
+                           shipped_results=None):
+        error_template = "The result object from the tester " + cur_tester.declare_tested_service() + \
+                         " does not match the required standard"
+        for tester_result in cur_tester.iter_tests():
+            cur_test_end_timestamp = datetime.datetime.now()
             if tester_result is None:
                 print(error_template + " (ResultIsNone).")
+                tester_results.batches_valid = False
                 continue
             if not isinstance(tester_result, list):
                 print(error_template + " (NotArray).")
+                tester_results.batches_valid = False
                 continue
-            if not tester_result:
-                print(error_template + " (Empty array).")
-                continue
-            else:
-                for result_obj in tester_result:
-                    if "timestamp" not in result_obj or "item" not in result_obj or "item_type" \
-                            not in result_obj or "test_result" not in result_obj:
-                        print(error_template + " (FieldsMissing). CANNOT CONTINUE.")
-                        continue
-                    if result_obj["item"] is None:
-                        print(error_template + " (ItemIsNone). CANNOT CONTINUE.")
-                        continue
-                    if not isinstance(result_obj["timestamp"], float):
-                        print(error_template + " (ItemDateIsNotFloat). CANNOT CONTINUE.")
-                        continue
-                    if len(str(int(result_obj["timestamp"]))) != 10:
-                        print(error_template + " (ItemDateIsNotTenDigitsIntPart). CANNOT CONTINUE.")
-                        continue
-            security_report_test_result_list = list(map(lambda x: _to_model(x,
-                                                                            execution_id,
-                                                                            cur_tester.declare_tested_provider(),
-                                                                            cur_tester.declare_tested_service(),
-                                                                            cur_test_start_timestamp,
-                                                                            cur_test_end_timestamp), tester_result))
-            report = SecurityReport(context=self.context, test_results=security_report_test_result_list)
-            print("DEBUG: Sent " + str(len(security_report_test_result_list)) + " events for " +
-                  str(testers_module_names[i]))
-            loop: AbstractEventLoop = asyncio.get_event_loop()
-            try:
-                loop.run_until_complete(
-                    self.client.post_security_report(api_key=self.private_key, security_report=report))
-            except Exception as ex:
-                print("ERROR: Failed to send " + str(len(security_report_test_result_list)) + " for tester " +
-                      str(testers_module_names[i]) + " events due to the following exception: " + str(ex))
-        self.channel.close()
+            for result_obj in tester_result:
+                if "timestamp" not in result_obj or "item" not in result_obj or "item_type" \
+                        not in result_obj or "test_result" not in result_obj:
+                    print(error_template + " (FieldsMissing). CANNOT CONTINUE.")
+                    continue
+                if result_obj["item"] is None:
+                    print(error_template + " (ItemIsNone). CANNOT CONTINUE.")
+                    continue
+                if not isinstance(result_obj["timestamp"], float):
+                    print(error_template + " (ItemDateIsNotFloat). CANNOT CONTINUE.")
+                    continue
+                if len(str(int(result_obj["timestamp"]))) != 10:
+                    print(error_template + " (ItemDateIsNotTenDigitsIntPart). CANNOT CONTINUE.")
+                    continue
+            new_results = False
+            for result_obj in tester_result:
+                tester_results.count += 1
+                if shipped_results is not None and \
+                        shipped_results.is_shipped(result_obj["item"], result_obj["test_name"]):
+                    continue
+                new_results = True
+                if region is not None:
+                    result_obj["region"] = region
+                yield _to_model(result_obj,
+                                execution_id,
+                                cur_tester.declare_tested_provider(),
+                                cur_tester.declare_tested_service(),
+                                cur_test_start_timestamp,
+                                cur_test_end_timestamp)
+            # The rest of the tester is left to the next invocation, a batch can take longer than the margin.
+            # Never before new results, a resumed tester would otherwise stop again before its cursor
+            if new_results and self._is_past_deadline():
+                tester_results.interrupted = True
+                return
+
+    async def _drain_reports(self, reports):
+        # Once the sender has failed the queue is still emptied, the workers blocked on it would wait forever
+        try:
+            await self._send_reports(reports)
+        except Exception as ex:
+            print("ERROR: The report sender has failed, the remaining reports are dropped: " + str(ex))
+            while True:
+                queued_report = await reports.get()
+                if queued_report is None:
+                    break
+                job_name, chunk_index, report, sent = queued_report
+                sent.set_result(False)
+
+    async def _send_reports(self, reports):
+        inflight = asyncio.Semaphore(self.max_inflight_reports)
+        pending = set()
+        queued_report = None
+        try:
+            while True:
+                queued_report = await reports.get()
+                if queued_report is None:
+                    break
+                await inflight.acquire()
+                task = asyncio.ensure_future(self._send_report(*queued_report))
+                queued_report = None
+                task.add_done_callback(lambda _: inflight.release())
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending)
+        finally:
+            # A report taken from the queue but not handed to a task is given up, its worker is told so
+            if queued_report is not None and not queued_report[3].done():
+                queued_report[3].set_result(False)
+            for task in list(pending):
+                task.cancel()
+
+    async def _send_report(self, job_name, chunk_index, report, sent):
+        # sent tells the worker of the job whether the report was posted
+        chunk_description = " (chunk " + str(chunk_index + 1) + ")"
+        try:
+            await self.client.post_security_report(api_key=self.private_key, security_report=report)
+            self.channel_last_used = time.monotonic()
+            sent.set_result(True)
+            print("DEBUG: Sent " + str(len(report.test_results)) + " events for " + job_name + chunk_description)
+        except Exception as ex:
+            self.channel_broken = True
+            print("ERROR: Failed to send " + str(len(report.test_results)) + " for tester " + job_name +
+                  chunk_description +
+                  " events due to the following exception: " + str(ex))
+        finally:
+            # Also when the sender is cancelled, the worker of the job waits for it
+            if not sent.done():
+                sent.set_result(False)
@@ -0,0 +1,106 @@
+import copy
+import threading
+import boto3
+import botocore.credentials
+import botocore.session
+import execution_plan
+
+
+class AwsContext:
+    def __init__(self, session=None, region_name=None):
+        self.session = session if session is not None else boto3.session.Session()
+        self.region_name = region_name or self.session.region_name
+        # Every region covered by the scan, set by the evaluator for testers that look across regions
+        self.regions = [self.region_name]
+        # Resource shard scanned by the shardable testers, the whole account by default
+        self.shard_index = 0
+        self.shard_count = 1
+        # State kept between scans by the testers, set by the evaluator
+        self.state_store = None
+        self._clients = {}
+        self._resources = {}
+        self._caller_identity = None
+        # Assumed role contexts by role arn, kept with their refreshable credentials across warm invocations
+        self._role_contexts = {}
+        # boto3 sessions are not thread safe, clients are created one at a time and then shared
+        self._lock = threading.RLock()
+
+    def for_region(self, region_name) -> "AwsContext":
+        # A regional view sharing the session, the client pool and the caller identity of this context
+        with self._lock:
+            # Resolved before the copy so that the regional views do not call STS again
+            self.caller_identity
+            regional_context = copy.copy(self)
+        regional_context.region_name = region_name
+        return regional_context
+
+    def for_shard(self, shard_index, shard_count) -> "AwsContext":
+        shard_context = self.for_region(self.region_name)
+        shard_context.shard_index = shard_index
+        shard_context.shard_count = shard_count
+        return shard_context
+
+    def in_shard(self, resource_key) -> bool:
+        return self.shard_count == 1 or \
+            execution_plan.get_resource_shard(resource_key, self.shard_count) == self.shard_index
+
+    def for_role(self, role_arn, session_name, duration_seconds=3600) -> "AwsContext":
+        # A context in another account, its credentials are refreshed from STS before they expire
+        with self._lock:
+            role_context = self._role_contexts.get(role_arn)
+        if role_context is not None:
+            return role_context
+        # The role is assumed outside of the lock, so accounts are set up side by side
+        credentials = botocore.credentials.RefreshableCredentials.create_from_metadata(
+            metadata=self._assume_role(role_arn, session_name, duration_seconds),
+            refresh_using=lambda: self._assume_role(role_arn, session_name, duration_seconds),
+            method='sts-assume-role')
+        botocore_session = botocore.session.get_session()
+        botocore_session._credentials = credentials
+        role_context = AwsContext(boto3.session.Session(botocore_session=botocore_session), self.region_name)
+        role_context.state_store = self.state_store
+        with self._lock:
+            return self._role_contexts.setdefault(role_arn, role_context)
+
+    def _assume_role(self, role_arn, session_name, duration_seconds) -> dict:
+        response = self.client('sts').assume_role(RoleArn=role_arn, RoleSessionName=session_name,
+                                                  DurationSeconds=duration_seconds)
+        return {
+            'access_key': response['Credentials']['AccessKeyId'],
+            'secret_key': response['Credentials']['SecretAccessKey'],
+            'token': response['Credentials']['SessionToken'],
+            'expiry_time': response['Credentials']['Expiration'].isoformat()
+        }
+
+    def client(self, service_name, region_name=None):
+        key = (service_name, region_name or self.region_name)
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = self.session.client(service_name, region_name=key[1])
+            return self._clients[key]
+
+    def resource(self, service_name, region_name=None):
+        key = (service_name, region_name or self.region_name)
+        with self._lock:
+            if key not in self._resources:
+                self._resources[key] = self.session.resource(service_name, region_name=key[1])
+            return self._resources[key]
+
+    @property
+    def caller_identity(self) -> dict:
+        with self._lock:
+            if self._caller_identity is None:
+                self._caller_identity = self.client('sts').get_caller_identity()
+            return self._caller_identity
+
+    @property
+    def user_id(self) -> str:
+        return self.caller_identity.get('UserId')
+
+    @property
+    def account_arn(self) -> str:
+        return self.caller_identity.get('Arn')
+
+    @property
+    def account_id(self) -> str:
+        return self.caller_identity.get('Account')
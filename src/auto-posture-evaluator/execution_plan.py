@@ -0,0 +1,87 @@
+import hashlib
+import json
+import zlib
+
+
+def get_resource_shard(resource_key, shard_count) -> int:
+    # crc32 gives every invocation the same answer, unlike hash() which is salted per process
+    return zlib.crc32(resource_key.encode('utf-8')) % shard_count
+
+
+def get_shard_id(shard) -> str:
+    return hashlib.sha256(json.dumps(shard, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+
+
+def get_shard(tester_name, role_arn, region, shard_index, shard_count) -> dict:
+    return {
+        "tester": tester_name,
+        "account": role_arn,
+        "region": region,
+        "shard_index": shard_index,
+        "shard_count": shard_count
+    }
+
+
+def get_checkpoint_key(execution_id, shard=None) -> str:
+    if shard is None:
+        return "executions/" + execution_id + "/checkpoint.json"
+    return "executions/" + execution_id + "/checkpoints/" + get_shard_id(shard) + ".json"
+
+
+def get_plan_key(execution_id) -> str:
+    return "executions/" + execution_id + "/plan.json"
+
+
+def get_shard_status_prefix(execution_id, status) -> str:
+    return "executions/" + execution_id + "/" + status + "/"
+
+
+def get_shard_status_key(execution_id, status, shard) -> str:
+    return get_shard_status_prefix(execution_id, status) + get_shard_id(shard) + ".json"
+
+
+class ShippedResults:
+    # Results of a job already shipped, counted per item and test. A resumed job skips them whatever order its tester
+    # yields them in this time, as long as the same result still comes out
+    def __init__(self, counts=None):
+        self.counts = dict(counts or {})
+        # Only the results shipped before this run are skipped, a tester may yield the same result twice
+        self._previous_counts = dict(self.counts)
+        self._skipped = {}
+
+    @staticmethod
+    def _get_key(item, test_name) -> str:
+        return json.dumps([str(item), str(test_name)])
+
+    def is_shipped(self, item, test_name) -> bool:
+        key = self._get_key(item, test_name)
+        skipped = self._skipped.get(key, 0)
+        if skipped >= self._previous_counts.get(key, 0):
+            return False
+        self._skipped[key] = skipped + 1
+        return True
+
+    def add(self, item, test_name):
+        key = self._get_key(item, test_name)
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+
+def build_execution_plan(testers, accounts, resource_shards) -> list:
+    # testers are (module name, Tester class) pairs and accounts are (role arn or None, regions) pairs.
+    # The same inputs always give the same shards in the same order, so a shard keeps its id across retries
+    plan = []
+    for tester_name, tester in sorted(testers, key=lambda named_tester: named_tester[0]):
+        shard_count = resource_shards if tester.shardable else 1
+        if tester.scope == "external":
+            targets = [(None, None)]
+        elif tester.scope == "global":
+            targets = [(role_arn, None) for role_arn, regions in accounts]
+        else:
+            targets = [(role_arn, region) for role_arn, regions in accounts for region in regions]
+        for role_arn, region in targets:
+            for shard_index in range(shard_count):
+                plan.append(get_shard(tester_name, role_arn, region, shard_index, shard_count))
+    return plan
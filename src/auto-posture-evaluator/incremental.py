@@ -0,0 +1,49 @@
+import hashlib
+import json
+import os
+import time
+
+
+def get_fingerprint(configuration) -> str:
+    # Stable across invocations: keys are sorted and the values boto3 parses (dates) are hashed as their text
+    return hashlib.sha256(json.dumps(configuration, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class ResourceFingerprints:
+    # Results of the previous scan by resource, kept in the state store with the fingerprint of the configuration
+    # they were evaluated from. AUTOPOSTURE_INCREMENTAL selects what happens to a resource whose configuration is
+    # unchanged: "reemit" sends its previous results again, "skip" sends nothing, "off" (default) evaluates it anyway
+    def __init__(self, aws_context, service):
+        self.mode = os.environ.get('AUTOPOSTURE_INCREMENTAL', 'off').lower()
+        self.state_store = aws_context.state_store
+        self.enabled = self.mode in ('reemit', 'skip') and self.state_store is not None
+        self.key = "fingerprints/" + str(aws_context.account_id) + "/" + aws_context.region_name + "/" + service + \
+                   "/" + str(aws_context.shard_index) + "-" + str(aws_context.shard_count) + ".json"
+        self.previous = {}
+        self.current = {}
+        # Unchanged resources for which nothing was sent
+        self.skipped = 0
+        if self.enabled:
+            self.previous = (self.state_store.get(self.key) or {}).get("resources", {})
+
+    def evaluate(self, resource_key, configuration, evaluate) -> list:
+        if not self.enabled:
+            return evaluate()
+        fingerprint = get_fingerprint(configuration)
+        previous = self.previous.get(resource_key)
+        if previous is not None and previous["fingerprint"] == fingerprint:
+            self.current[resource_key] = previous
+            if self.mode == 'skip':
+                self.skipped += 1
+                return []
+            return [dict(result, timestamp=time.time()) for result in previous["results"]]
+        results = evaluate()
+        # Stored as JSON, before the evaluator adds its own fields to the results
+        self.current[resource_key] = {"fingerprint": fingerprint,
+                                      "results": json.loads(json.dumps(results, default=str))}
+        return results
+
+    def save(self):
+        # Called once every resource was seen, the resources deleted since the previous scan are dropped
+        if self.enabled:
+            self.state_store.put(self.key, {"saved": time.time(), "resources": self.current})
@@ -1,4 +1,13 @@
 class TesterInterface:
+    # "regional" testers are run once per scanned region with a regional AwsContext,
+    # "global" testers are run once per scanned account, "external" testers (outside of AWS) once per scan
+    scope = "regional"
+    # Shardable testers only scan the resources for which aws_context.in_shard() is true,
+    # so the execution plan can split them into several resource shards
+    shardable = False
+    # Testers that reuse the results of unchanged resources keep their incremental.ResourceFingerprints here
+    fingerprints = None
+
     def declare_tested_service(self) -> str:
         pass
 
@@ -7,3 +16,26 @@ class TesterInterface:
 
     def run_tests(self) -> list:
         pass
+
+    def iter_tests(self):
+        # Streaming testers override this to yield their results in batches (lists) as they are produced,
+        # so the evaluator can ship them without holding the whole scan in memory
+        yield self.run_tests()
+
+
+class StateStoreInterface:
+    # JSON values kept between invocations, keys are "/" separated paths.
+    # A shared store is seen by every invocation of the function, whichever container runs it
+    shared = False
+
+    def get(self, key):
+        pass
+
+    def put(self, key, value):
+        pass
+
+    def list_keys(self, prefix) -> list:
+        pass
+
+    def delete(self, key):
+        pass
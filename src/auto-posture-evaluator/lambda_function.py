@@ -1,7 +1,38 @@
 import auto_posture_evaluator
 
+# Created on the first invocation and kept for the lifetime of the container, so warm invocations
+# reuse the gRPC channel, the AWS client pool and the cached caller identity
+evaluator = None
+
+
+def _get_evaluator():
+    global evaluator
+    if evaluator is None:
+        evaluator = auto_posture_evaluator.AutoPostureEvaluator()
+    return evaluator
+
+
 def lambda_handler(event, context):
-    tester = auto_posture_evaluator.AutoPostureEvaluator()
-    tester.run_tests()
+    event = event or {}
+    # Scans stop before the Lambda timeout and continue in a new invocation of the function
+    remaining_seconds = None if context is None else context.get_remaining_time_in_millis() / 1000.0
+    function_name = None if context is None else context.invoked_function_arn
+    # A sharded scan is started by a coordinator invocation, which invokes the function again for every shard
+    if event.get("action") == "start_execution":
+        return _get_evaluator().start_execution(function_name)
+    if event.get("action") == "get_execution_status":
+        return _get_evaluator().get_execution_status(event["execution_id"])
+    if "shard" in event:
+        _get_evaluator().run_shard(event["execution_id"], event["shard"], remaining_seconds, function_name,
+                                   event.get("resume", False))
+        return
+    # A first invocation runs under its request id, which Lambda keeps when it retries the invocation after a
+    # timeout, so the retry resumes from the checkpoint saved along the way
+    if "execution_id" in event or context is None:
+        _get_evaluator().run_tests(event.get("execution_id"), remaining_seconds, function_name)
+        return
+    _get_evaluator().run_tests(context.aws_request_id, remaining_seconds, function_name, False)
+
 
-auto_posture_evaluator.AutoPostureEvaluator().run_tests()
+if __name__ == "__main__":
+    lambda_handler({}, None)
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import requests
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+class ReferenceDataCache:
+    # Slow changing reference data (catalogs, supported versions) shared by the testers. Entries are kept in memory
+    # and persisted under the cache directory, so warm invocations and new containers on the same host skip the
+    # network until the entry expires. An expired entry is revalidated, and kept as the last good copy when the
+    # source cannot be reached. Returned data is shared and must not be modified by the callers.
+    def __init__(self, cache_dir=None, ttl=None):
+        self.cache_dir = cache_dir or os.environ.get('AUTOPOSTURE_CACHE_DIR', '/tmp/autoposture-cache')
+        self.ttl = ttl if ttl is not None else int(os.environ.get('AUTOPOSTURE_REFERENCE_DATA_TTL', '86400'))
+        self._entries = {}
+        # One lock per entry, a slow source only holds back the testers waiting for that same entry
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, fetch, ttl=None):
+        with self._get_key_lock(key):
+            entry = self._load_entry(key)
+            if entry is not None and not self._is_expired(entry, ttl):
+                return entry['data']
+            try:
+                data = fetch()
+            except Exception as ex:
+                if entry is None:
+                    raise
+                print("WARN: Could not refresh the reference data " + key + ", using the last good copy - " + str(ex))
+                return entry['data']
+            self._save_entry(key, {'fetched_at': time.time(), 'data': data})
+            return data
+
+    def get_url(self, url, ttl=None, timeout=10):
+        with self._get_key_lock(url):
+            entry = self._load_entry(url)
+            if entry is not None and not self._is_expired(entry, ttl):
+                return entry['data']
+            headers = {}
+            if entry is not None and entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry is not None and entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+            try:
+                response = requests.get(url, headers=headers, timeout=timeout)
+                if response.status_code == 304 and entry is not None:
+                    entry = dict(entry, fetched_at=time.time())
+                else:
+                    response.raise_for_status()
+                    entry = {
+                        'fetched_at': time.time(),
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified'),
+                        'data': response.json()
+                    }
+            except (requests.exceptions.RequestException, ValueError) as ex:
+                if entry is None:
+                    raise
+                print("WARN: Could not revalidate the reference data " + url + ", using the last good copy - " + str(ex))
+                return entry['data']
+            self._save_entry(url, entry)
+            return entry['data']
+
+    def _get_key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _is_expired(self, entry, ttl) -> bool:
+        ttl = self.ttl if ttl is None else ttl
+        return time.time() - entry['fetched_at'] > ttl
+
+    def _get_entry_path(self, key) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+    def _load_entry(self, key):
+        if key not in self._entries:
+            try:
+                with open(self._get_entry_path(key), 'r') as entry_file:
+                    self._entries[key] = json.load(entry_file)
+            except FileNotFoundError:
+                return None
+            except (OSError, ValueError) as ex:
+                print("WARN: Ignoring the unreadable reference data cache entry for " + key + " - " + str(ex))
+                return None
+        return self._entries[key]
+
+    def _save_entry(self, key, entry):
+        self._entries[key] = entry
+        path = self._get_entry_path(key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Written aside and renamed so a concurrent reader never sees a partial file
+            temp_path = path + '.' + str(os.getpid()) + '.tmp'
+            with open(temp_path, 'w') as entry_file:
+                json.dump(entry, entry_file)
+            os.replace(temp_path, path)
+        except (OSError, TypeError) as ex:
+            print("WARN: Could not persist the reference data cache entry for " + key + " - " + str(ex))
+
+
+def default_cache() -> ReferenceDataCache:
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ReferenceDataCache()
+        return _default_cache
@@ -0,0 +1,81 @@
+import json
+import os
+import botocore.exceptions
+import interfaces
+
+
+class LocalFileStateStore(interfaces.StateStoreInterface):
+    # Keys are JSON files under the state directory, only seen by the invocations of the container that wrote them
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+
+    def get(self, key):
+        try:
+            with open(os.path.join(self.state_dir, key), 'r') as state_file:
+                return json.load(state_file)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, value):
+        path = os.path.join(self.state_dir, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside and renamed so a concurrent reader never sees a partial file
+        temp_path = path + '.' + str(os.getpid()) + '.tmp'
+        with open(temp_path, 'w') as state_file:
+            json.dump(value, state_file)
+        os.replace(temp_path, path)
+
+    def list_keys(self, prefix) -> list:
+        try:
+            names = os.listdir(os.path.join(self.state_dir, prefix))
+        except FileNotFoundError:
+            return []
+        return sorted(prefix + name for name in names if not name.endswith('.tmp'))
+
+    def delete(self, key):
+        try:
+            os.remove(os.path.join(self.state_dir, key))
+        except FileNotFoundError:
+            pass
+
+
+class S3StateStore(interfaces.StateStoreInterface):
+    # Keys are JSON objects under the prefix, shared by every invocation of the function
+    shared = True
+
+    def __init__(self, aws_context, bucket, prefix=''):
+        self.aws_s3_client = aws_context.client('s3')
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+
+    def get(self, key):
+        try:
+            response = self.aws_s3_client.get_object(Bucket=self.bucket, Key=self.prefix + key)
+        except botocore.exceptions.ClientError as ex:
+            if ex.response['Error']['Code'] == 'NoSuchKey':
+                return None
+            raise
+        return json.loads(response['Body'].read())
+
+    def put(self, key, value):
+        self.aws_s3_client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=json.dumps(value).encode('utf-8'),
+                                      ContentType='application/json')
+
+    def list_keys(self, prefix) -> list:
+        keys = []
+        for page in self.aws_s3_client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket,
+                                                                                Prefix=self.prefix + prefix):
+            keys.extend(state_object['Key'][len(self.prefix):] for state_object in page.get('Contents', []))
+        return keys
+
+    def delete(self, key):
+        self.aws_s3_client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+
+def get_state_store(aws_context) -> interfaces.StateStoreInterface:
+    # "s3://bucket/prefix" keeps the state in S3, any other value is a local directory
+    location = os.environ.get('AUTOPOSTURE_STATE_STORE', '/tmp/autoposture-state')
+    if location.startswith('s3://'):
+        bucket, _, prefix = location[len('s3://'):].partition('/')
+        return S3StateStore(aws_context, bucket, prefix)
+    return LocalFileStateStore(location)
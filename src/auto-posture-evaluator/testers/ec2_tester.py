@@ -1,19 +1,99 @@
 import time
+from bisect import bisect_left, bisect_right
 from typing import Dict, List, Set
-import boto3
 import botocore.exceptions
 import interfaces
 
+# Ports checked by every inbound access test, protocols set to None match a rule of any protocol
+_INBOUND_PORT_CHECKS = {
+    "ec2_inbound_http_access_restricted": [(80, ("tcp",))],
+    "ec2_inbound_https_access_restricted": [(443, ("tcp",))],
+    "ec2_inbound_mongodb_access_restricted": [(27017, ("tcp",))],
+    "ec2_inbound_mysql_access_restricted": [(3306, ("tcp",))],
+    "ec2_inbound_mssql_access_restricted": [(1433, ("tcp",))],
+    "ec2_inbound_ssh_access_restricted": [(22, ("tcp",))],
+    "ec2_inbound_rdp_access_restricted": [(3389, ("tcp",))],
+    "ec2_inbound_postgresql_access_restricted": [(5432, ("tcp",))],
+    "ec2_inbound_tcp_netbios_access_restricted": [(137, ("tcp",)), (139, ("tcp",))],
+    "ec2_inbound_dns_access_restricted": [(53, ("tcp", "udp"))],
+    "ec2_inbound_telnet_access_restricted": [(23, ("tcp",))],
+    "ec2_inbound_cifs_access_restricted": [(137, ("udp",)), (138, ("udp",)), (139, ("tcp",)), (445, ("tcp",)),
+                                           (3020, ("tcp",))],
+    "ec2_inbound_elasticsearch_access_restricted": [(9200, ("tcp",)), (9300, ("tcp",))],
+    "ec2_inbound_smtp_access_restricted": [(25, ("tcp",)), (587, ("tcp",))],
+    "ec2_inbound_rpc_access_restricted": [(135, ("tcp",))],
+    "ec2_inbound_ftp_access_restricted": [(20, ("tcp",)), (21, ("tcp",))],
+    "ec2_inbound_udp_netbios_access_restricted": [(137, ("udp",)), (138, ("udp",))],
+    "ec2_inbound_oracle_access_restricted": [(1521, ("tcp",)), (2483, None), (2484, None)]
+}
+
+
+class _InboundPortIndex:
+    # The inbound rules are compiled once: every rule range is matched against the sorted list of checked
+    # ports with a binary search, so all the port checks are answered with set lookups
+    def __init__(self, inbound_permissions, ports):
+        self.ports = sorted(set(ports))
+        self.all_traffic = set()
+        self.by_protocol = {}
+        self.by_port = {}
+        for permission in inbound_permissions:
+            group_id = permission['GroupId']
+            protocol = permission['IpProtocol']
+            if protocol == "-1":
+                self.all_traffic.add(group_id)
+                continue
+            self.by_protocol.setdefault(protocol, set()).add(group_id)
+            if permission.get('FromPort') is None or permission.get('ToPort') is None:
+                continue
+            first = bisect_left(self.ports, permission['FromPort'])
+            last = bisect_right(self.ports, permission['ToPort'])
+            for port in self.ports[first:last]:
+                self.by_port.setdefault((protocol, port), set()).add(group_id)
+
+    def groups_exposing_port(self, port, protocols=None) -> Set:
+        groups = set(self.all_traffic)
+        for protocol in (protocols if protocols is not None else self.by_protocol.keys()):
+            groups.update(self.by_port.get((protocol, port), set()))
+        return groups
+
+    def groups_using_protocol(self, protocol) -> Set:
+        return self.all_traffic.union(self.by_protocol.get(protocol, set()))
+
+
+class _SecurityGroupInventory:
+    # Security groups and VPCs are described once per run and every check reads the plain response dicts,
+    # rules are flattened with the id of the group they belong to
+    def __init__(self, security_groups, vpcs):
+        self.vpc_ids = set(vpc['VpcId'] for vpc in vpcs)
+        self.by_id = {}
+        self.default_by_vpc = {}
+        self.inbound_rules = []
+        self.outbound_rules = []
+        for security_group in security_groups:
+            group_id = security_group['GroupId']
+            vpc_id = security_group.get('VpcId')
+            self.by_id[group_id] = security_group
+            if security_group['GroupName'] == "default":
+                self.default_by_vpc[vpc_id] = security_group
+            for rule in security_group.get('IpPermissions', []):
+                self.inbound_rules.append(dict(rule, GroupId=group_id))
+            for rule in security_group.get('IpPermissionsEgress', []):
+                self.outbound_rules.append(dict(rule, GroupId=group_id))
+
+    @property
+    def group_ids(self) -> Set:
+        return set(self.by_id.keys())
+
+
 class Tester(interfaces.TesterInterface):
-    def __init__(self) -> None:
-        self.aws_ec2_client = boto3.client('ec2')
-        self.aws_ec2_resource = boto3.resource('ec2')
-        self.user_id = boto3.client('sts').get_caller_identity().get('UserId')
-        self.account_arn = boto3.client('sts').get_caller_identity().get('Arn')
-        self.account_id = boto3.client('sts').get_caller_identity().get('Account')
-        self.security_groups = self.aws_ec2_resource.security_groups.all()
-        self.vpcs = self.aws_ec2_client.describe_vpcs()['Vpcs']
-        self.set_security_group = self._get_all_security_group_ids(self.security_groups)
+    def __init__(self, aws_context) -> None:
+        self.aws_context = aws_context
+        self.aws_ec2_client = aws_context.client('ec2')
+        self.user_id = aws_context.user_id
+        self.account_arn = aws_context.account_arn
+        self.account_id = aws_context.account_id
+        self.inventory = self._get_security_group_inventory()
+        self.set_security_group = self.inventory.group_ids
 
     def declare_tested_service(self) -> str:
         return 'ec2'
@@ -22,74 +102,54 @@ class Tester(interfaces.TesterInterface):
         return 'aws'
 
     def run_tests(self) -> list:
-        all_inbound_permissions = self._get_all_inbound_permissions_by_security_groups(self.security_groups)
-        all_outbound_permissions = self._get_all_outbound_permissions_by_security_groups(self.security_groups)
-
-        return \
-            self.get_inbound_http_access(all_inbound_permissions) + \
-            self.get_inbound_https_access(all_inbound_permissions) + \
-            self.get_inbound_mongodb_access(all_inbound_permissions) + \
-            self.get_inbound_mysql_access(all_inbound_permissions) + \
-            self.get_inbound_mssql_access(all_inbound_permissions) + \
-            self.get_inbound_ssh_access(all_inbound_permissions) + \
-            self.get_inbound_rdp_access(all_inbound_permissions) + \
-            self.get_inbound_dns_access(all_inbound_permissions) + \
-            self.get_inbound_telnet_access(all_inbound_permissions) + \
-            self.get_inbound_rpc_access(all_inbound_permissions) + \
-            self.get_inbound_icmp_access(all_inbound_permissions) + \
-            self.get_security_group_allows_ingress_from_anywhere(all_inbound_permissions) + \
-            self.get_vpc_default_security_group_restrict_traffic() + \
-            self.get_outbound_access_to_all_ports(all_outbound_permissions) + \
-            self.get_inbound_oracle_access(all_inbound_permissions) + \
-            self.get_inbound_ftp_access(all_inbound_permissions) + \
-            self.get_inbound_smtp_access(all_inbound_permissions) + \
-            self.get_inbound_elasticsearch_access(all_inbound_permissions) + \
-            self.get_inbound_tcp_netbios_access(all_inbound_permissions) + \
-            self.get_inbound_udp_netbios(all_inbound_permissions) + \
-            self.get_inbound_cifs_access(all_inbound_permissions)
-            
-    def _get_all_security_group_ids(self, instances) -> Set:
-        return set(list(map(lambda i: i.id, list(instances))))
-
-    def _get_all_inbound_permissions(self, instances):
-        all_inbound_permissions = []
-        for instance in instances:
-            security_groups = instance.security_groups
-            for security_group in security_groups:
-                inbound_permissions = self.aws_ec2_resource.SecurityGroup(security_group['GroupId']).ip_permissions
-                for i in inbound_permissions:
-                    i['instance'] = instance
-                    i['security_group'] = security_group
-                    all_inbound_permissions.append(i)
-        return all_inbound_permissions
-
-    def _get_all_inbound_permissions_by_security_groups(self, security_groups) -> List[Dict]:
-        inbound_rules = []
-        for security_group in security_groups:
-            rules = security_group.ip_permissions
-            for rule in rules:
-                rule['security_group'] = security_group
-                inbound_rules.append(rule)
-        return inbound_rules
-    
-    def _get_all_outbound_permissions_by_security_groups(self, security_groups) -> List[Dict]:
-        outbound_rules = []
-        for security_group in security_groups:
-            rules = security_group.ip_permissions_egress
-            for rule in rules:
-                rule['security_group'] = security_group
-                outbound_rules.append(rule)
-        return outbound_rules
-
-    def _get_inbound_port_access(self, all_inbound_permissions, target_port, test_name, protocol="tcp") -> List[Dict]:
+        return [result for batch in self.iter_tests() for result in batch]
+
+    def iter_tests(self):
+        all_inbound_permissions = self.inventory.inbound_rules
+        all_outbound_permissions = self.inventory.outbound_rules
+        port_index = self._get_inbound_port_index(all_inbound_permissions)
+
+        yield self.get_inbound_http_access(port_index)
+        yield self.get_inbound_https_access(port_index)
+        yield self.get_inbound_mongodb_access(port_index)
+        yield self.get_inbound_mysql_access(port_index)
+        yield self.get_inbound_mssql_access(port_index)
+        yield self.get_inbound_ssh_access(port_index)
+        yield self.get_inbound_rdp_access(port_index)
+        yield self.get_inbound_dns_access(port_index)
+        yield self.get_inbound_telnet_access(port_index)
+        yield self.get_inbound_rpc_access(port_index)
+        yield self.get_inbound_icmp_access(port_index)
+        yield self.get_security_group_allows_ingress_from_anywhere(all_inbound_permissions)
+        yield self.get_vpc_default_security_group_restrict_traffic()
+        yield self.get_outbound_access_to_all_ports(all_outbound_permissions)
+        yield self.get_inbound_oracle_access(port_index)
+        yield self.get_inbound_ftp_access(port_index)
+        yield self.get_inbound_smtp_access(port_index)
+        yield self.get_inbound_elasticsearch_access(port_index)
+        yield self.get_inbound_tcp_netbios_access(port_index)
+        yield self.get_inbound_udp_netbios(port_index)
+        yield self.get_inbound_cifs_access(port_index)
+
+    def _get_security_group_inventory(self) -> _SecurityGroupInventory:
+        security_groups = []
+        for page in self.aws_ec2_client.get_paginator('describe_security_groups').paginate():
+            security_groups.extend(page['SecurityGroups'])
+        vpcs = []
+        for page in self.aws_ec2_client.get_paginator('describe_vpcs').paginate():
+            vpcs.extend(page['Vpcs'])
+        return _SecurityGroupInventory(security_groups, vpcs)
+
+    def _get_inbound_port_index(self, all_inbound_permissions) -> _InboundPortIndex:
+        ports = [port for port_checks in _INBOUND_PORT_CHECKS.values() for port, _ in port_checks]
+        return _InboundPortIndex(all_inbound_permissions, ports)
+
+    def _append_security_group_test_results(self, test_name, instances_with_issue) -> List[Dict]:
         result = []
-        instances = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: (permission['IpProtocol'] == "-1") or ((permission['FromPort'] <= target_port and permission['ToPort'] >= target_port) and permission['IpProtocol'] == protocol), all_inbound_permissions))))
-        instances_with_issue = set(instances)
         instances_with_no_issue = self.set_security_group.difference(instances_with_issue)
-
         for i in instances_with_issue:
             result.append({
-               "user": self.user_id,
+                "user": self.user_id,
                 "account_arn": self.account_arn,
                 "account": self.account_id,
                 "timestamp": time.time(),
@@ -97,11 +157,11 @@ class Tester(interfaces.TesterInterface):
                 "item_type": "ec2_security_group",
                 "test_name": test_name,
                 "test_result": "issue_found"
-                })
-        
+            })
+
         for i in instances_with_no_issue:
             result.append({
-               "user": self.user_id,
+                "user": self.user_id,
                 "account_arn": self.account_arn,
                 "account": self.account_id,
                 "timestamp": time.time(),
@@ -112,328 +172,87 @@ class Tester(interfaces.TesterInterface):
             })
         return result
 
-    def get_inbound_http_access(self, all_inbound_permissions) -> List:
+    def _get_inbound_port_access(self, port_index, test_name) -> List[Dict]:
+        instances_with_issue = set()
+        for target_port, protocols in _INBOUND_PORT_CHECKS[test_name]:
+            instances_with_issue.update(port_index.groups_exposing_port(target_port, protocols))
+        return self._append_security_group_test_results(test_name, instances_with_issue)
+
+    def get_inbound_http_access(self, port_index) -> List:
         test_name = "ec2_inbound_http_access_restricted"
-        return self._get_inbound_port_access(all_inbound_permissions, 80, test_name)
+        return self._get_inbound_port_access(port_index, test_name)
 
-    def get_inbound_https_access(self, all_inbound_permissions) -> List:
+    def get_inbound_https_access(self, port_index) -> List:
         test_name = "ec2_inbound_https_access_restricted"
-        return self._get_inbound_port_access(all_inbound_permissions, 443, test_name)
-    
-    def get_inbound_mongodb_access(self, all_inbound_permissions) -> List:
+        return self._get_inbound_port_access(port_index, test_name)
+
+    def get_inbound_mongodb_access(self, port_index) -> List:
         test_name = "ec2_inbound_mongodb_access_restricted"
-        return self._get_inbound_port_access(all_inbound_permissions, 27017, test_name)
-    
-    def get_inbound_mysql_access(self, all_inbound_permissions) -> List:
+        return self._get_inbound_port_access(port_index, test_name)
+
+    def get_inbound_mysql_access(self, port_index) -> List:
         test_name = "ec2_inbound_mysql_access_restricted"
-        return self._get_inbound_port_access(all_inbound_permissions, 3306, test_name)
-    
-    def get_inbound_mssql_access(self, all_inbound_permissions) -> List:
+        return self._get_inbound_port_access(port_index, test_name)
+
+    def get_inbound_mssql_access(self, port_index) -> List:
         test_name = "ec2_inbound_mssql_access_restricted"
-        return self._get_inbound_port_access(all_inbound_permissions, 1433, test_name)
+        return self._get_inbound_port_access(port_index, test_name)
 
-    def get_inbound_ssh_access(self, all_inbound_permissions) -> List:
+    def get_inbound_ssh_access(self, port_index) -> List:
         test_name = "ec2_inbound_ssh_access_restricted"
-        return self._get_inbound_port_access(all_inbound_permissions, 22, test_name)
+        return self._get_inbound_port_access(port_index, test_name)
 
-    def get_inbound_rdp_access(self, all_inbound_permissions) -> List:
+    def get_inbound_rdp_access(self, port_index) -> List:
         test_name = "ec2_inbound_rdp_access_restricted"
-        return self._get_inbound_port_access(all_inbound_permissions, 3389, test_name)
-    
-    def get_inbound_postgresql_access(self, all_inbound_permissions) -> List:
+        return self._get_inbound_port_access(port_index, test_name)
+
+    def get_inbound_postgresql_access(self, port_index) -> List:
         test_name = "ec2_inbound_postgresql_access_restricted"
-        return self._get_inbound_port_access(all_inbound_permissions, 5432, test_name)
+        return self._get_inbound_port_access(port_index, test_name)
 
-    def get_inbound_tcp_netbios_access(self, all_inbound_permissions):
+    def get_inbound_tcp_netbios_access(self, port_index):
         test_name = "ec2_inbound_tcp_netbios_access_restricted"
-        result = []
-        instances = []
-        NAMERESPORT = 137
-        SESSIONPORT = 139
-        instancse_137 = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: (permission['IpProtocol'] == '-1') or ((permission['FromPort'] <= NAMERESPORT and permission['ToPort'] >= NAMERESPORT) and permission['IpProtocol'] == 'tcp'), all_inbound_permissions))))
-        instances.extend(instancse_137)
-        instancse_139 = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: (permission['IpProtocol'] == '-1') or ((permission['FromPort'] <= SESSIONPORT and permission['ToPort'] >= SESSIONPORT) and permission['IpProtocol'] == 'tcp'), all_inbound_permissions))))
-        instances.extend(instancse_139)
-        
-        instances_with_issue = set(instances)
-        instances_with_no_issue = self.set_security_group.difference(instances_with_issue)
+        return self._get_inbound_port_access(port_index, test_name)
 
-        for i in instances_with_issue:
-            result.append({
-                "user": self.user_id,
-                "account_arn": self.account_arn,
-                "account": self.account_id,
-                "timestamp": time.time(),
-                "item": i,
-                "item_type": "ec2_security_group",
-                "test_name": test_name,
-                "test_result": "issue_found"
-            })
-
-        for i in instances_with_no_issue:
-            result.append({
-                "user": self.user_id,
-                "account_arn": self.account_arn,
-                "account": self.account_id,
-                "timestamp": time.time(),
-                "item": i,
-                "item_type": "ec2_security_group",
-                "test_name": test_name,
-                "test_result": "no_issue_found"
-            })
-        
-        return result
-
-    def get_inbound_dns_access(self, all_inbound_permissions):
+    def get_inbound_dns_access(self, port_index):
         test_name = "ec2_inbound_dns_access_restricted"
-        result = []
-        target_port = 53
-        instances = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: (permission['IpProtocol'] == "-1") or ((permission['FromPort'] <= target_port and permission['ToPort'] >= target_port) and (permission['IpProtocol'] == "tcp" or permission['IpProtocol'] == "udp")), all_inbound_permissions))))
-        instances_with_issue = set(instances)
-        instances_with_no_issue = self.set_security_group.difference(instances_with_issue)
-        for i in instances_with_issue:
-            result.append({
-               "user": self.user_id,
-                "account_arn": self.account_arn,
-                "account": self.account_id,
-                "timestamp": time.time(),
-                "item": i,
-                "item_type": "ec2_security_group",
-                "test_name": test_name,
-                "test_result": "issue_found"
-            })
-
-        for i in instances_with_no_issue:    
-            result.append({
-                "user": self.user_id,
-                "account_arn": self.account_arn,
-                "account": self.account_id,
-                "timestamp": time.time(),
-                "item": i,
-                "item_type": "ec2_security_group",
-                "test_name": test_name,
-                "test_result": "no_issue_found"
-            })
-        return result
+        return self._get_inbound_port_access(port_index, test_name)
 
-    def get_inbound_telnet_access(self, all_inbound_permissions):
+    def get_inbound_telnet_access(self, port_index):
         test_name = "ec2_inbound_telnet_access_restricted"
-        return self._get_inbound_port_access(all_inbound_permissions, 23, test_name)
+        return self._get_inbound_port_access(port_index, test_name)
 
-    def get_inbound_cifs_access(self, all_inbound_permissions):
+    def get_inbound_cifs_access(self, port_index):
         test_name = "ec2_inbound_cifs_access_restricted"
-        result = []
-        instances = []
-        PORT137 = 137
-        PORT138 = 138
-        PORT139 = 139
-        PORT445 = 445
-        PORT3020 = 3020
-        
-        instancse_137 = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: (permission['IpProtocol'] == '-1') or ((permission['FromPort'] <= PORT137 and permission['ToPort'] >= PORT137) and permission['IpProtocol'] == 'udp'), all_inbound_permissions))))
-        instances.extend(instancse_137)
-        instancse_138 = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: (permission['IpProtocol'] == '-1') or ((permission['FromPort'] <= PORT138 and permission['ToPort'] >= PORT138) and permission['IpProtocol'] == 'udp'), all_inbound_permissions))))
-        instances.extend(instancse_138)
-        instancse_139 = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: (permission['IpProtocol'] == '-1') or ((permission['FromPort'] <= PORT139 and permission['ToPort'] >= PORT139) and permission['IpProtocol'] == 'tcp'), all_inbound_permissions))))
-        instances.extend(instancse_139)
-        instancse_445 = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: (permission['IpProtocol'] == '-1') or ((permission['FromPort'] <= PORT445 and permission['ToPort'] >= PORT445) and permission['IpProtocol'] == 'tcp'), all_inbound_permissions))))
-        instances.extend(instancse_445)
-        instancse_3020 = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: (permission['IpProtocol'] == '-1') or ((permission['FromPort'] <= PORT3020 and permission['ToPort'] >= PORT3020) and permission['IpProtocol'] == 'tcp'), all_inbound_permissions))))
-        instances.extend(instancse_3020)
-
-        instances_with_issue = set(instances)
-        instances_with_no_issue = self.set_security_group.difference(instances_with_issue)
+        return self._get_inbound_port_access(port_index, test_name)
 
-        for i in instances_with_issue:
-            result.append({
-                "user": self.user_id,
-                "account_arn": self.account_arn,
-                "account": self.account_id,
-                "timestamp": time.time(),
-                "item": i,
-                "item_type": "ec2_security_group",
-                "test_name": test_name,
-                "test_result": "issue_found"
-            })
-        
-        for i in instances_with_no_issue:
-            result.append({
-                "user": self.user_id,
-                "account_arn": self.account_arn,
-                "account": self.account_id,
-                "timestamp": time.time(),
-                "item": i,
-                "item_type": "ec2_security_group",
-                "test_name": test_name,
-                "test_result": "no_issue_found"
-            })
-        
-        return result
-    
-    def get_inbound_elasticsearch_access(self, all_inbound_permissions):
+    def get_inbound_elasticsearch_access(self, port_index):
         test_name = "ec2_inbound_elasticsearch_access_restricted"
-        results = []
-        instances = []
-        PORT9200 = 9200
-        PORT9300 = 9300
-        instances_9200 = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: (permission['IpProtocol'] == '-1') or ((permission['FromPort'] <= PORT9200 and permission['ToPort'] >= PORT9200) and permission['IpProtocol'] == 'tcp'), all_inbound_permissions))))
-        instances.extend(instances_9200)
-        instances_9300 = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: (permission['IpProtocol'] == '-1') or ((permission['FromPort'] <= PORT9300 and permission['ToPort'] >= PORT9300) and permission['IpProtocol'] == 'tcp'), all_inbound_permissions))))
-        instances.extend(instances_9300)
-
-        instances_with_issue = set(instances)
-        instances_with_no_issue = self.set_security_group.difference(instances_with_issue)
+        return self._get_inbound_port_access(port_index, test_name)
 
-        for i in instances_with_issue:
-            results.append({
-                "user": self.user_id,
-                "account_arn": self.account_arn,
-                "account": self.account_id,
-                "timestamp": time.time(),
-                "item": i,
-                "item_type": "ec2_security_group",
-                "test_name": test_name,
-                "test_result": "issue_found"
-            })
-        
-        for i in instances_with_no_issue:
-            results.append({
-                "user": self.user_id,
-                "account_arn": self.account_arn,
-                "account": self.account_id,
-                "timestamp": time.time(),
-                "item": i,
-                "item_type": "ec2_security_group",
-                "test_name": test_name,
-                "test_result": "no_issue_found"
-            })
-    
-        return results
-    
-    def get_inbound_smtp_access(self, all_inbound_permissions):
+    def get_inbound_smtp_access(self, port_index):
         test_name = "ec2_inbound_smtp_access_restricted"
-        result = []
-        PORT25 = 25
-        PORT587 = 587
-        instances = []
-        instances_25 = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: (permission['IpProtocol'] == '-1') or ((permission['FromPort'] <= PORT25 and permission['ToPort'] >= PORT25) and permission['IpProtocol'] == 'tcp'), all_inbound_permissions))))
-        instances.extend(instances_25)
-        instances_587 = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: (permission['IpProtocol'] == '-1') or ((permission['FromPort'] <= PORT587 and permission['ToPort'] >= PORT587) and permission['IpProtocol'] == 'tcp'), all_inbound_permissions))))
-        instances.extend(instances_587)
-        
-        instances_with_issue = set(instances)
-        instances_with_no_issue = self.set_security_group.difference(instances_with_issue)
+        return self._get_inbound_port_access(port_index, test_name)
 
-        for i in instances_with_issue:
-            result.append({
-                "user": self.user_id,
-                "account_arn": self.account_arn,
-                "account": self.account_id,
-                "timestamp": time.time(),
-                "item": i,
-                "item_type": "ec2_security_group",
-                "test_name": test_name,
-                "test_result": "issue_found"
-            })
-        
-        for i in instances_with_no_issue:
-            result.append({
-                "user": self.user_id,
-                "account_arn": self.account_arn,
-                "account": self.account_id,
-                "timestamp": time.time(),
-                "item": i,
-                "item_type": "ec2_security_group",
-                "test_name": test_name,
-                "test_result": "no_issue_found"
-            })
-        
-        return result
-
-    def get_inbound_rpc_access(self, all_inbound_permissions):
+    def get_inbound_rpc_access(self, port_index):
         test_name = "ec2_inbound_rpc_access_restricted"
-        return self._get_inbound_port_access(all_inbound_permissions, 135, test_name)
+        return self._get_inbound_port_access(port_index, test_name)
 
-    def get_inbound_ftp_access(self, all_inbound_permissions):
+    def get_inbound_ftp_access(self, port_index):
         test_name = "ec2_inbound_ftp_access_restricted"
-        result = []
-        instances = []
-        DATAPORT = 20
-        COMMANDPORT = 21
-        instances_20 = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: (permission['IpProtocol'] == '-1') or ((permission['FromPort'] <= DATAPORT and permission['ToPort'] >= DATAPORT) and permission['IpProtocol'] == 'tcp'), all_inbound_permissions))))
-        instances.extend(instances_20)
-        instances_21 = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: (permission['IpProtocol'] == '-1') or ((permission['FromPort'] <= COMMANDPORT and permission['ToPort'] >= COMMANDPORT) and permission['IpProtocol'] == 'tcp'), all_inbound_permissions))))
-        instances.extend(instances_21)
-
-        instances_with_issue = set(instances)
-        instances_with_no_issue = self.set_security_group.difference(instances_with_issue)
-        
-        for i in instances_with_issue:
-            result.append({
-                "user": self.user_id,
-                "account_arn": self.account_arn,
-                "account": self.account_id,
-                "timestamp": time.time(),
-                "item": i,
-                "item_type": "ec2_security_group",
-                "test_name": test_name,
-                "test_result": "issue_found"
-            })
-        
-        for i in instances_with_no_issue:
-            result.append({
-                "user": self.user_id,
-                "account_arn": self.account_arn,
-                "account": self.account_id,
-                "timestamp": time.time(),
-                "item": i,
-                "item_type": "ec2_security_group",
-                "test_name": test_name,
-                "test_result": "no_issue_found"
-            })
-        
-        return result
+        return self._get_inbound_port_access(port_index, test_name)
 
-    def get_inbound_udp_netbios(self, all_inbound_permissions):
+    def get_inbound_udp_netbios(self, port_index):
         test_name = "ec2_inbound_udp_netbios_access_restricted"
-        result = []
-        instances = []
-        NAMERESPORT = 137
-        DATAGRAMPORT = 138
-        
-        instancse_137 = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: (permission['IpProtocol'] == '-1') or ((permission['FromPort'] <= NAMERESPORT and permission['ToPort'] >= NAMERESPORT) and permission['IpProtocol'] == 'udp'), all_inbound_permissions))))
-        instances.extend(instancse_137)
-        instancse_138 = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: (permission['IpProtocol'] == '-1') or ((permission['FromPort'] <= DATAGRAMPORT and permission['ToPort'] >= DATAGRAMPORT) and permission['IpProtocol'] == 'udp'), all_inbound_permissions))))
-        instances.extend(instancse_138)
-        
-        instances_with_issue = set(instances)
-        instances_with_no_issue = self.set_security_group.difference(instances_with_issue)
+        return self._get_inbound_port_access(port_index, test_name)
 
-        for i in instances_with_issue:
-            result.append({
-                "user": self.user_id,
-                "account_arn": self.account_arn,
-                "account": self.account_id,
-                "timestamp": time.time(),
-                "item": i,
-                "item_type": "ec2_security_group",
-                "test_name": test_name,
-                "test_result": "issue_found"
-            })
-        
-        for i in instances_with_no_issue:
-            result.append({
-                "user": self.user_id,
-                "account_arn": self.account_arn,
-                "account": self.account_id,
-                "timestamp": time.time(),
-                "item": i,
-                "item_type": "ec2_security_group",
-                "test_name": test_name,
-                "test_result": "no_issue_found"
-            })
-        
-        return result
+    def get_inbound_oracle_access(self, port_index):
+        test_name = "ec2_inbound_oracle_access_restricted"
+        return self._get_inbound_port_access(port_index, test_name)
+
+    def get_inbound_icmp_access(self, port_index):
+        test_name = "ec2_inbound_icmp_access_restricted"
+        return self._append_security_group_test_results(test_name, port_index.groups_using_protocol("icmp"))
 
     def get_outbound_access_to_all_ports(self, all_outbound_permissions):
         test_name = "ec2_outbound_access_to_all_ports_restricted"
@@ -442,7 +261,7 @@ class Tester(interfaces.TesterInterface):
 
         for outbound_permission in all_outbound_permissions:
             if outbound_permission['IpProtocol'] == '-1':
-                security_groups.append(outbound_permission['security_group'].id)
+                security_groups.append(outbound_permission['GroupId'])
         
         security_groups_with_issues = set(security_groups)
         security_groups_with_no_issues = self.set_security_group.difference(security_groups_with_issues)
@@ -476,22 +295,17 @@ class Tester(interfaces.TesterInterface):
         test_name = "vpc_default_security_group_restrict_all_traffic"
         result = []
         
-        all_vpcs = []
-        for vpc in self.vpcs:
-            all_vpcs.append(vpc['VpcId'])
-        all_vpcs = set(all_vpcs)
+        all_vpcs = self.inventory.vpc_ids
 
         vpcs_with_issue = []
-        security_groups = self.security_groups
-        for security_group in security_groups:
-            if security_group.group_name == "default":
-                ingress_rules = security_group.ip_permissions
-                egress_rules = security_group.ip_permissions_egress
-                ingress_results = list(filter(lambda rule: (rule['IpProtocol'] == "-1") or (rule['FromPort'] >= 0 and rule['ToPort'] <= 65535), ingress_rules))
-                egress_results = list(filter(lambda rule: (rule['IpProtocol'] == "-1") or (rule['FromPort'] >= 0 and rule['ToPort'] <= 65535), egress_rules))
-
-                if len(ingress_results) != 0 or len(egress_results) != 0:
-                    vpcs_with_issue.append(security_group.vpc_id)
+        for vpc_id, security_group in self.inventory.default_by_vpc.items():
+            ingress_rules = security_group.get('IpPermissions', [])
+            egress_rules = security_group.get('IpPermissionsEgress', [])
+            ingress_results = list(filter(lambda rule: (rule['IpProtocol'] == "-1") or (rule['FromPort'] >= 0 and rule['ToPort'] <= 65535), ingress_rules))
+            egress_results = list(filter(lambda rule: (rule['IpProtocol'] == "-1") or (rule['FromPort'] >= 0 and rule['ToPort'] <= 65535), egress_rules))
+
+            if len(ingress_results) != 0 or len(egress_results) != 0:
+                vpcs_with_issue.append(vpc_id)
         
         vpcs_with_issue = set(vpcs_with_issue)
         vpcs_with_no_issue = all_vpcs.difference(vpcs_with_issue)
@@ -521,82 +335,6 @@ class Tester(interfaces.TesterInterface):
             })
         return result
     
-    def get_inbound_oracle_access(self, all_inbound_permissions):
-        test_name = "ec2_inbound_oracle_access_restricted"
-        PORT1521 = 1521
-        PORT2483 = 2483
-        PORT2484 = 2484
-
-        result = []
-        instances = []
-
-        instances_1521 = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: (permission['IpProtocol'] =='-1') or (permission['FromPort'] <= PORT1521 and permission['ToPort'] >= PORT1521 and permission['IpProtocol'] == 'tcp'), all_inbound_permissions))))
-        instances.extend(instances_1521)
-        instances_2483 = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: (permission['IpProtocol'] =='-1') or (permission['FromPort'] <= PORT2483 and permission['ToPort'] >= PORT2483), all_inbound_permissions))))
-        instances.extend(instances_2483)
-        instances_2484 = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: (permission['IpProtocol'] =='-1') or (permission['FromPort'] <= PORT2484 and permission['ToPort'] >= PORT2484), all_inbound_permissions))))
-        instances.extend(instances_2484)
-
-        instances_with_issue = set(instances)
-        instances_with_no_issue = self.set_security_group.difference(instances_with_issue)
-
-        for i in instances_with_issue:
-            result.append({
-                "user": self.user_id,
-                "account_arn": self.account_arn,
-                "account": self.account_id,
-                "timestamp": time.time(),
-                "item": i,
-                "item_type": "ec2_security_group",
-                "test_name": test_name,
-                "test_result": "issue_found"
-            })
-
-        for i in instances_with_no_issue:
-            result.append({
-                "user": self.user_id,
-                "account_arn": self.account_arn,
-                "account": self.account_id,
-                "timestamp": time.time(),
-                "item": i,
-                "item_type": "ec2_security_group",
-                "test_name": test_name,
-                "test_result": "no_issue_found"
-            })
-        
-        return result
-
-    def get_inbound_icmp_access(self, all_inbound_permissions):
-        test_name = "ec2_inbound_icmp_access_restricted"
-        result = []
-        instances = list(map(lambda i: i['security_group'].id, list(filter(lambda permission: permission['IpProtocol'] == "icmp" or permission['IpProtocol'] == "-1", all_inbound_permissions))))
-        instances_with_issue = set(instances)
-        instances_with_no_issue = self.set_security_group.difference(instances_with_issue)
-        for i in instances_with_issue:
-            result.append({
-                "user": self.user_id,
-                "account_arn": self.account_arn,
-                "account": self.account_id,
-                "timestamp": time.time(),
-                "item": i,
-                "item_type": "ec2_security_group",
-                "test_name": test_name,
-                "test_result": "issue_found"
-            })
-        for i in instances_with_no_issue:
-            result.append({
-                "user": self.user_id,
-                "account_arn": self.account_arn,
-                "account": self.account_id,
-                "timestamp": time.time(),
-                "item": i,
-                "item_type": "ec2_security_group",
-                "test_name": test_name,
-                "test_result": "no_issue_found"
-            })
-
-        return result
-
     def get_security_group_allows_ingress_from_anywhere(self, all_inbound_permissions):
         test_name = "security_group_allows_ingress_to_remote_administration_ports_from_anywhere"
         result = []
@@ -605,11 +343,11 @@ class Tester(interfaces.TesterInterface):
         RDPPORT = 3389
         for i in all_inbound_permissions:
             if i['IpProtocol'] == "-1" and len(i['IpRanges']) == 0:
-                security_groups.append(i['security_group'].id)
+                security_groups.append(i['GroupId'])
             elif (i['FromPort'] <= SSHPORT and i['ToPort'] >= SSHPORT) or (i['FromPort'] <= RDPPORT and i['ToPort'] >= RDPPORT):
                 for ip in i['IpRanges']:
                     if ip['CidrIp'] == '0.0.0.0/0':
-                        security_groups.append(i['security_group'].id)
+                        security_groups.append(i['GroupId'])
             else:
                 continue
         security_groups_with_issue = set(security_groups)
@@ -1,6 +1,8 @@
+import os
 import time
-import boto3
+import incremental
 import interfaces
+import reference_data
 
 
 def _return_default_port_on_elasticache_engines(cluster_type):
@@ -13,13 +15,16 @@ def _return_default_port_on_elasticache_engines(cluster_type):
 
 
 class Tester(interfaces.TesterInterface):
-    def __init__(self):
-        self.aws_elasticache_client = boto3.client('elasticache')
+    def __init__(self, aws_context):
+        self.aws_context = aws_context
+        self.aws_elasticache_client = aws_context.client('elasticache')
         self.cache = {}
-        self.user_id = boto3.client('sts').get_caller_identity().get('UserId')
-        self.account_arn = boto3.client('sts').get_caller_identity().get('Arn')
-        self.account_id = boto3.client('sts').get_caller_identity().get('Account')
-        self.elasticache_clusters = self.aws_elasticache_client.describe_cache_clusters(ShowCacheNodeInfo=True)
+        self.user_id = aws_context.user_id
+        self.account_arn = aws_context.account_arn
+        self.account_id = aws_context.account_id
+        self.engine_versions_ttl = int(os.environ.get('AUTOPOSTURE_ELASTICACHE_ENGINE_VERSIONS_TTL', '3600'))
+        self.configuration_endpoint_ports = self._get_configuration_endpoint_ports()
+        self.fingerprints = incremental.ResourceFingerprints(aws_context, 'elasticache')
 
     def declare_tested_service(self) -> str:
         return 'elasticache'
@@ -28,9 +33,32 @@ class Tester(interfaces.TesterInterface):
         return 'aws'
 
     def run_tests(self) -> list:
-        return self.detect_elasticache_cluster_not_using_default_port() + \
-               self.detect_elasticache_cluster_using_vpc() + \
-               self.detect_elasticache_cluster_using_latest_engine_version()
+        return [result for batch in self.iter_tests() for result in batch]
+
+    def iter_tests(self):
+        # Clusters are streamed page by page and every check is evaluated in the same pass
+        paginator = self.aws_elasticache_client.get_paginator('describe_cache_clusters')
+        for page in paginator.paginate(ShowCacheNodeInfo=True):
+            result = []
+            for elasticache in page['CacheClusters']:
+                result.extend(self.fingerprints.evaluate(elasticache['CacheClusterId'],
+                                                         self._get_cluster_configuration(elasticache),
+                                                         lambda: self._evaluate_cluster(elasticache)))
+            yield result
+        self.fingerprints.save()
+
+    def _get_cluster_configuration(self, elasticache) -> dict:
+        # Everything the checks read, the port of the replication group and the latest engine version included
+        return {
+            "cluster": elasticache,
+            "configuration_endpoint_port": self.configuration_endpoint_ports.get(elasticache.get('ReplicationGroupId')),
+            "latest_engine_version": self._return_latest_version_for_given_engine(elasticache['Engine'])
+        }
+
+    def _evaluate_cluster(self, elasticache) -> list:
+        return [self.detect_elasticache_cluster_not_using_default_port(elasticache),
+                self.detect_elasticache_cluster_using_vpc(elasticache),
+                self.detect_elasticache_cluster_using_latest_engine_version(elasticache)]
 
     def _append_elasticache_test_result(self, elasticache, test_name, issue_status):
         return {
@@ -44,54 +72,59 @@ class Tester(interfaces.TesterInterface):
             "test_result": issue_status
         }
 
+    def _get_configuration_endpoint_ports(self):
+        # Nodes of cluster mode enabled replication groups have no endpoint of their own
+        ports = {}
+        for page in self.aws_elasticache_client.get_paginator('describe_replication_groups').paginate():
+            for replication_group in page['ReplicationGroups']:
+                if 'ConfigurationEndpoint' in replication_group:
+                    ports[replication_group['ReplicationGroupId']] = replication_group['ConfigurationEndpoint']['Port']
+        return ports
+
     def _return_latest_version_for_given_engine(self, engine_type):
-        versions = self.aws_elasticache_client.describe_cache_engine_versions(
-            DefaultOnly=False,
-            Engine=engine_type,
-            MaxRecords=100,
-        )
-        return versions['CacheEngineVersions'][-1]
+        if engine_type not in self.cache:
+            catalog_key = 'elasticache_latest_engine_version/' + self.aws_elasticache_client.meta.region_name + '/' + engine_type
+            self.cache[engine_type] = reference_data.default_cache().get(
+                catalog_key, lambda: self._describe_latest_engine_version(engine_type), ttl=self.engine_versions_ttl)
+        return self.cache[engine_type]
+
+    def _describe_latest_engine_version(self, engine_type):
+        versions = []
+        paginator = self.aws_elasticache_client.get_paginator('describe_cache_engine_versions')
+        for page in paginator.paginate(DefaultOnly=False, Engine=engine_type, PaginationConfig={'PageSize': 100}):
+            versions.extend(page['CacheEngineVersions'])
+        return versions[-1]
 
     def _return_cluster_using_default_port(self, engine_type, elasticache):
         engine_default_port = _return_default_port_on_elasticache_engines(engine_type)
-        for node in elasticache['CacheNodes']:
-            if node['Endpoint']['Port'] == engine_default_port:
+        for node in elasticache.get('CacheNodes', []):
+            if 'Endpoint' in node:
+                port = node['Endpoint']['Port']
+            else:
+                port = self.configuration_endpoint_ports.get(elasticache.get('ReplicationGroupId'))
+            if port == engine_default_port:
                 return True
         return False
 
-    def detect_elasticache_cluster_not_using_default_port(self):
+    def detect_elasticache_cluster_not_using_default_port(self, elasticache):
         test_name = "elasticache_cluster_not_using_default_port"
-        result = []
-        for elasticache in self.elasticache_clusters['CacheClusters']:
-            if self._return_cluster_using_default_port(elasticache['Engine'], elasticache):
-                result.append(self._append_elasticache_test_result(elasticache, test_name, "issue_found"))
-            else:
-                result.append(self._append_elasticache_test_result(elasticache, test_name, "no_issue_found"))
-
-        return result
+        if self._return_cluster_using_default_port(elasticache['Engine'], elasticache):
+            return self._append_elasticache_test_result(elasticache, test_name, "issue_found")
+        else:
+            return self._append_elasticache_test_result(elasticache, test_name, "no_issue_found")
 
-    def detect_elasticache_cluster_using_vpc(self):
+    def detect_elasticache_cluster_using_vpc(self, elasticache):
         test_name = "elasticache_cluster_using_vpc"
-        result = []
-        for elasticache in self.elasticache_clusters['CacheClusters']:
-            if 'CacheSubnetGroupName' in elasticache and elasticache['CacheSubnetGroupName']:
-                result.append(self._append_elasticache_test_result(elasticache, test_name, "no_issue_found"))
-            else:
-                result.append(self._append_elasticache_test_result(elasticache, test_name, "issue_found"))
-        return result
+        if 'CacheSubnetGroupName' in elasticache and elasticache['CacheSubnetGroupName']:
+            return self._append_elasticache_test_result(elasticache, test_name, "no_issue_found")
+        else:
+            return self._append_elasticache_test_result(elasticache, test_name, "issue_found")
 
-    def detect_elasticache_cluster_using_latest_engine_version(self):
+    def detect_elasticache_cluster_using_latest_engine_version(self, elasticache):
         test_name = "elasticache_cluster_using_latest_engine_version"
-        result = []
-        for elasticache in self.elasticache_clusters['CacheClusters']:
-            if self._return_latest_version_for_given_engine(elasticache['Engine'])[
-                        'CacheEngineVersionDescription'].split(
-                        ' ')[-1] != elasticache[
-                        'EngineVersion'] and self._return_latest_version_for_given_engine(elasticache['Engine'])[
-                        'EngineVersion'] != elasticache[
-                        'EngineVersion']:
-                result.append(self._append_elasticache_test_result(elasticache, test_name, "issue_found"))
-            else:
-                result.append(self._append_elasticache_test_result(elasticache, test_name, "no_issue_found"))
-        return result
-
+        latest_version = self._return_latest_version_for_given_engine(elasticache['Engine'])
+        if latest_version['CacheEngineVersionDescription'].split(' ')[-1] != elasticache['EngineVersion'] and \
+                latest_version['EngineVersion'] != elasticache['EngineVersion']:
+            return self._append_elasticache_test_result(elasticache, test_name, "issue_found")
+        else:
+            return self._append_elasticache_test_result(elasticache, test_name, "no_issue_found")
@@ -1,21 +1,31 @@
+import os
 import time
-import boto3
+from concurrent.futures import ThreadPoolExecutor
+import botocore.exceptions
+import incremental
 import interfaces
 import json
 
+# describe_domains and describe_elasticsearch_domains accept up to 5 domain names per call
+_DESCRIBE_DOMAINS_BATCH_SIZE = 5
+
 
 def _format_string_to_json(text):
     return json.loads(text)
 
 
 class Tester(interfaces.TesterInterface):
-    def __init__(self):
-        self.aws_elastic_search_client = boto3.client('es')
+    def __init__(self, aws_context):
+        self.aws_context = aws_context
+        self.aws_elastic_search_client, self.describe_domains = self._get_domains_client()
         self.cache = {}
-        self.user_id = boto3.client('sts').get_caller_identity().get('UserId')
-        self.account_arn = boto3.client('sts').get_caller_identity().get('Arn')
-        self.account_id = boto3.client('sts').get_caller_identity().get('Account')
+        self.user_id = aws_context.user_id
+        self.account_arn = aws_context.account_arn
+        self.account_id = aws_context.account_id
+        self.max_workers = int(os.environ.get('AUTOPOSTURE_ES_MAX_WORKERS', '8'))
         self.elastic_search_domain_names = self.aws_elastic_search_client.list_domain_names()
+        self._describe_all_domains()
+        self.fingerprints = incremental.ResourceFingerprints(aws_context, 'elastic_search')
 
     def declare_tested_service(self) -> str:
         return 'elastic_search'
@@ -24,11 +34,46 @@ class Tester(interfaces.TesterInterface):
         return 'aws'
 
     def run_tests(self) -> list:
-        return self.detect_elastic_search_cluster_using_vpc() + \
-               self.detect_elastic_search_cluster_encryption_enabled() + \
-               self.detect_elastic_search_cluster_using_kms_cmk() + \
-               self.detect_elastic_search_cluster_using_latest_engine_version() + \
-               self.detect_elastic_search_domain_not_publicly_accessible()
+        return [result for batch in self.iter_tests() for result in batch]
+
+    def iter_tests(self):
+        # Domains are evaluated one at a time, so the results of an unchanged domain can be reused
+        for elastic_search, domain_status in self._iter_domain_statuses():
+            yield self.fingerprints.evaluate(elastic_search['DomainName'], domain_status,
+                                             lambda: self._evaluate_domains([(elastic_search, domain_status)]))
+        self.fingerprints.save()
+
+    def _evaluate_domains(self, domains) -> list:
+        return self.detect_elastic_search_cluster_using_vpc(domains) + \
+            self.detect_elastic_search_cluster_encryption_enabled(domains) + \
+            self.detect_elastic_search_cluster_using_kms_cmk(domains) + \
+            self.detect_elastic_search_cluster_using_latest_engine_version(domains) + \
+            self.detect_elastic_search_domain_not_publicly_accessible(domains)
+
+    def _get_domains_client(self):
+        # The OpenSearch API covers both engines, botocore versions that predate it only know the es API
+        try:
+            client = self.aws_context.client('opensearch')
+            return client, client.describe_domains
+        except botocore.exceptions.UnknownServiceError:
+            client = self.aws_context.client('es')
+            return client, client.describe_elasticsearch_domains
+
+    def _describe_all_domains(self):
+        domain_names = [domain['DomainName'] for domain in self.elastic_search_domain_names['DomainNames']]
+        batches = [domain_names[i:i + _DESCRIBE_DOMAINS_BATCH_SIZE]
+                   for i in range(0, len(domain_names), _DESCRIBE_DOMAINS_BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for response in executor.map(lambda batch: self.describe_domains(DomainNames=batch), batches):
+                for domain_status in response['DomainStatusList']:
+                    self.cache[domain_status['DomainName']] = domain_status
+
+    def _iter_domain_statuses(self):
+        # Domains deleted between the listing and the describe phase are left out of the results
+        for elastic_search in self.elastic_search_domain_names['DomainNames']:
+            domain_status = self.cache.get(elastic_search['DomainName'])
+            if domain_status is not None:
+                yield elastic_search, domain_status
 
     def _append_elastic_search_test_result(self, elastic_search, test_name, issue_status):
         return {
@@ -58,17 +103,15 @@ class Tester(interfaces.TesterInterface):
                 break
         return is_exposed
 
-    def detect_elastic_search_cluster_using_latest_engine_version(self):
+    def detect_elastic_search_cluster_using_latest_engine_version(self, domains=None):
         test_name = "elastic_search_cluster_using_latest_engine_version"
         result = []
-        for elastic_search in self.elastic_search_domain_names['DomainNames']:
-            domain_description = self.aws_elastic_search_client.describe_elasticsearch_domain(
-                DomainName=elastic_search['DomainName'])
+        for elastic_search, domain_status in self._iter_domain_statuses() if domains is None else domains:
             try:
-                if domain_description['DomainStatus']['ServiceSoftwareOptions']['CurrentVersion'] == \
-                        domain_description['DomainStatus']['ServiceSoftwareOptions']['NewVersion'] or (
-                        domain_description['DomainStatus']['ServiceSoftwareOptions']['NewVersion'] == '' and
-                        domain_description['DomainStatus']['ServiceSoftwareOptions']['UpdateAvailable'] == False):
+                if domain_status['ServiceSoftwareOptions']['CurrentVersion'] == \
+                        domain_status['ServiceSoftwareOptions']['NewVersion'] or (
+                        domain_status['ServiceSoftwareOptions']['NewVersion'] == '' and
+                        domain_status['ServiceSoftwareOptions']['UpdateAvailable'] == False):
                     result.append(
                         self._append_elastic_search_test_result(elastic_search, test_name, "no_issue_found"))
                 else:
@@ -77,16 +120,14 @@ class Tester(interfaces.TesterInterface):
                 raise Exception("Elastic Search Using Latest Engine Version - Key error: ", e)
         return result
 
-    def detect_elastic_search_cluster_using_vpc(self):
+    def detect_elastic_search_cluster_using_vpc(self, domains=None):
         test_name = "elastic_search_cluster_using_vpc"
         result = []
-        for elastic_search in self.elastic_search_domain_names['DomainNames']:
-            domain_description = self.aws_elastic_search_client.describe_elasticsearch_domain(
-                DomainName=elastic_search['DomainName'])
+        for elastic_search, domain_status in self._iter_domain_statuses() if domains is None else domains:
             try:
-                if 'VPCOptions' in domain_description['DomainStatus'] and \
-                        domain_description['DomainStatus']['VPCOptions']['VPCId'] and len(
-                    domain_description['DomainStatus']['VPCOptions']['SubnetIds']):
+                if 'VPCOptions' in domain_status and \
+                        domain_status['VPCOptions']['VPCId'] and len(
+                    domain_status['VPCOptions']['SubnetIds']):
                     result.append(self._append_elastic_search_test_result(elastic_search, test_name, "no_issue_found"))
                 else:
                     result.append(self._append_elastic_search_test_result(elastic_search, test_name, "issue_found"))
@@ -94,14 +135,12 @@ class Tester(interfaces.TesterInterface):
                 raise Exception("Elastic Search Using Vpc - Key error", e)
         return result
 
-    def detect_elastic_search_cluster_encryption_enabled(self):
+    def detect_elastic_search_cluster_encryption_enabled(self, domains=None):
         test_name = "elastic_search_cluster_encryption_enabled"
         result = []
-        for elastic_search in self.elastic_search_domain_names['DomainNames']:
-            domain_description = self.aws_elastic_search_client.describe_elasticsearch_domain(
-                DomainName=elastic_search['DomainName'])
+        for elastic_search, domain_status in self._iter_domain_statuses() if domains is None else domains:
             try:
-                if domain_description['DomainStatus']['EncryptionAtRestOptions']['Enabled']:
+                if domain_status['EncryptionAtRestOptions']['Enabled']:
                     result.append(self._append_elastic_search_test_result(elastic_search, test_name, "no_issue_found"))
                 else:
                     result.append(self._append_elastic_search_test_result(elastic_search, test_name, "issue_found"))
@@ -109,15 +148,13 @@ class Tester(interfaces.TesterInterface):
                 raise Exception("Elastic Search Encryption Enabled - Key error")
         return result
 
-    def detect_elastic_search_cluster_using_kms_cmk(self):
+    def detect_elastic_search_cluster_using_kms_cmk(self, domains=None):
         test_name = "elastic_search_cluster_using_kms_cmk"
         result = []
-        for elastic_search in self.elastic_search_domain_names['DomainNames']:
-            domain_description = self.aws_elastic_search_client.describe_elasticsearch_domain(
-                DomainName=elastic_search['DomainName'])
+        for elastic_search, domain_status in self._iter_domain_statuses() if domains is None else domains:
             try:
-                if domain_description['DomainStatus']['EncryptionAtRestOptions']['Enabled'] == True and \
-                        domain_description['DomainStatus']['EncryptionAtRestOptions'][
+                if domain_status['EncryptionAtRestOptions']['Enabled'] == True and \
+                        domain_status['EncryptionAtRestOptions'][
                             'KmsKeyId'] != '(Default) aws/es':
                     result.append(self._append_elastic_search_test_result(elastic_search, test_name, "no_issue_found"))
                 else:
@@ -126,13 +163,11 @@ class Tester(interfaces.TesterInterface):
                 raise Exception("Elastic Search Using KMS CMK - Key error")
         return result
 
-    def detect_elastic_search_domain_not_publicly_accessible(self):
+    def detect_elastic_search_domain_not_publicly_accessible(self, domains=None):
         test_name = "elastic_search_domain_not_publicly_accessible"
         result = []
-        for elastic_search in self.elastic_search_domain_names['DomainNames']:
-            domain_description = self.aws_elastic_search_client.describe_elasticsearch_domain(
-                DomainName=elastic_search['DomainName'])
-            if self._check_es_domain_not_publicly_accessible(domain_description['DomainStatus']['AccessPolicies']):
+        for elastic_search, domain_status in self._iter_domain_statuses() if domains is None else domains:
+            if self._check_es_domain_not_publicly_accessible(domain_status['AccessPolicies']):
                 result.append(self._append_elastic_search_test_result(elastic_search, test_name, "issue_found"))
             else:
                 result.append(self._append_elastic_search_test_result(elastic_search, test_name, "no_issue_found"))
@@ -1,24 +1,51 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import time
 from typing import Dict, List
 import interfaces
-import boto3
 import jmespath
+import reference_data
+
+
+class _ElbFlowLogIndex:
+    # The network interfaces owned by load balancers and all the flow logs are listed once, every load balancer
+    # is then answered with dictionary lookups on the interface description and the flow log resource id
+    def __init__(self, network_interfaces, flow_logs):
+        self.interfaces_by_description = {}
+        for interface in network_interfaces:
+            self.interfaces_by_description.setdefault(interface.get('Description'), []).append(interface['NetworkInterfaceId'])
+        self.flow_logs_by_resource = {}
+        for flow_log in flow_logs:
+            self.flow_logs_by_resource.setdefault(flow_log.get('ResourceId'), []).append(flow_log)
+
+    def interface_ids(self, description) -> List:
+        return self.interfaces_by_description.get(description, [])
+
+    def has_flow_logs(self, resource_id) -> bool:
+        return len(self.flow_logs_by_resource.get(resource_id, [])) > 0
+
 
 class Tester(interfaces.TesterInterface):
-    def __init__(self) -> None:
-        self.user_id = boto3.client('sts').get_caller_identity().get('UserId')
-        self.account_arn = boto3.client('sts').get_caller_identity().get('Arn')
-        self.account_id = boto3.client('sts').get_caller_identity().get('Account')
-        self.aws_elbs_client = boto3.client('elb')
-        self.aws_elbsv2_client = boto3.client('elbv2')
+    def __init__(self, aws_context) -> None:
+        self.aws_context = aws_context
+        self.user_id = aws_context.user_id
+        self.account_arn = aws_context.account_arn
+        self.account_id = aws_context.account_id
+        self.aws_elbs_client = aws_context.client('elb')
+        self.aws_elbsv2_client = aws_context.client('elbv2')
+        self.max_workers = int(os.environ.get('AUTOPOSTURE_ELB_MAX_WORKERS', '16'))
         self.elbs = self._get_all_elb()
         self.elbsv2 = self._get_all_elbv2()
+        self.elb_attributes = self._get_all_elb_attributes()
+        self.elbv2_listeners, self.elbv2_attributes = self._get_all_elbv2_details()
+        self.ssl_policies = self._get_ssl_policies()
+        self.ssl_protocol_versions = {}
+        self.flow_log_index = None
         self.cipher_suites = self._get_cipher_suite_details()
         self.latest_security_policies = self._get_aws_latest_security_policies()
-        self.aws_acm_client = boto3.client('acm')
-        self.aws_iam_client = boto3.client('iam')
+        self.aws_acm_client = aws_context.client('acm')
+        self.aws_iam_client = aws_context.client('iam')
         self.ssl_certificate_age = os.environ.get('AUTOPOSTURE_ALB_SSL_CERTIFICATE_AGE')
 
     def declare_tested_service(self) -> str:
@@ -28,32 +55,108 @@ class Tester(interfaces.TesterInterface):
         return "aws"
 
     def run_tests(self) -> list:
-        
-        return \
-            self.get_elbv2_internet_facing() + \
-            self.get_elbv2_generating_access_log() + \
-            self.get_alb_using_secure_listener() + \
-            self.get_elb_generating_access_log() + \
-            self.get_elb_listeners_using_tls() + \
-            self.get_elb_listeners_securely_configured() + \
-            self.get_elb_has_secure_ssl_protocol() + \
-            self.get_elb_security_policy_secure_ciphers() + \
-            self.get_elbv2_using_latest_security_policy() + \
-            self.get_elbv2_has_deletion_protection() + \
-            self.get_elbv2_allows_https_traffic_only() + \
-            self.get_alb_using_tls12_or_higher() + \
-            self.get_nlb_using_tls12_or_higher() + \
-            self.get_elb_internet_facing() + \
-            self.get_nlb_support_insecure_negotiation_policy() + \
-            self.get_alb_certificate_should_be_renewed()
-    
+        return [result for batch in self.iter_tests() for result in batch]
+
+    def iter_tests(self):
+        yield self.get_elbv2_internet_facing()
+        yield self.get_elbv2_generating_access_log()
+        yield self.get_alb_using_secure_listener()
+        yield self.get_elb_generating_access_log()
+        yield self.get_elb_listeners_using_tls()
+        yield self.get_elb_listeners_securely_configured()
+        yield self.get_elb_has_secure_ssl_protocol()
+        yield self.get_elb_security_policy_secure_ciphers()
+        yield self.get_elbv2_using_latest_security_policy()
+        yield self.get_elbv2_has_deletion_protection()
+        yield self.get_elbv2_allows_https_traffic_only()
+        yield self.get_alb_using_tls12_or_higher()
+        yield self.get_nlb_using_tls12_or_higher()
+        yield self.get_elb_internet_facing()
+        yield self.get_nlb_support_insecure_negotiation_policy()
+        yield self.get_alb_certificate_should_be_renewed()
+
     def _get_all_elbv2(self) -> List:
-        elbs = self.aws_elbsv2_client.describe_load_balancers()
-        return elbs['LoadBalancers']
+        elbs = []
+        for page in self.aws_elbsv2_client.get_paginator('describe_load_balancers').paginate():
+            elbs.extend(page['LoadBalancers'])
+        return elbs
     
     def _get_all_elb(self) -> List:
-        elbs = self.aws_elbs_client.describe_load_balancers()
-        return elbs['LoadBalancerDescriptions']
+        elbs = []
+        for page in self.aws_elbs_client.get_paginator('describe_load_balancers').paginate():
+            elbs.extend(page['LoadBalancerDescriptions'])
+        return elbs
+
+    def _get_all_elb_attributes(self) -> Dict:
+        elb_names = [elb['LoadBalancerName'] for elb in self.elbs]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(zip(elb_names, executor.map(self._get_elb_attributes, elb_names)))
+
+    def _get_elb_attributes(self, load_balancer_name) -> Dict:
+        response = self.aws_elbs_client.describe_load_balancer_attributes(LoadBalancerName=load_balancer_name)
+        return response['LoadBalancerAttributes']
+
+    def _get_all_elbv2_details(self):
+        # Listeners and attributes are fetched once per load balancer and shared by all the elbv2 checks
+        elb_arns = [elb['LoadBalancerArn'] for elb in self.elbsv2]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            listeners = dict(zip(elb_arns, executor.map(self._get_elbv2_listeners, elb_arns)))
+            attributes = dict(zip(elb_arns, executor.map(self._get_elbv2_attributes, elb_arns)))
+        return listeners, attributes
+
+    def _get_elbv2_listeners(self, elb_arn) -> List:
+        listeners = []
+        for page in self.aws_elbsv2_client.get_paginator('describe_listeners').paginate(LoadBalancerArn=elb_arn):
+            listeners.extend(page['Listeners'])
+        return listeners
+
+    def _get_elbv2_attributes(self, elb_arn) -> List:
+        response = self.aws_elbsv2_client.describe_load_balancer_attributes(LoadBalancerArn=elb_arn)
+        return response['Attributes']
+
+    def _get_ssl_policies(self) -> Dict:
+        # The predefined policy catalog is loaded in one pass instead of being described listener by listener
+        if len(self.elbsv2) == 0:
+            return {}
+        catalog_key = 'elbv2_ssl_policies/' + self.aws_elbsv2_client.meta.region_name
+        # Copied since policies missing from the shared catalog are added to it during the run
+        return dict(reference_data.default_cache().get(catalog_key, self._describe_ssl_policies))
+
+    def _describe_ssl_policies(self) -> Dict:
+        ssl_policies = {}
+        request_args = {}
+        while True:
+            response = self.aws_elbsv2_client.describe_ssl_policies(**request_args)
+            for policy in response['SslPolicies']:
+                ssl_policies[policy['Name']] = policy
+            if not response.get('NextMarker'):
+                return ssl_policies
+            request_args['Marker'] = response['NextMarker']
+
+    def _get_flow_log_index(self) -> _ElbFlowLogIndex:
+        if self.flow_log_index is None:
+            ec2_client = self.aws_context.client('ec2')
+            network_interfaces = []
+            paginator = ec2_client.get_paginator('describe_network_interfaces')
+            for page in paginator.paginate(Filters=[{'Name': 'description', 'Values': ['ELB *']}]):
+                network_interfaces.extend(page['NetworkInterfaces'])
+            flow_logs = []
+            for page in ec2_client.get_paginator('describe_flow_logs').paginate():
+                flow_logs.extend(page['FlowLogs'])
+            self.flow_log_index = _ElbFlowLogIndex(network_interfaces, flow_logs)
+        return self.flow_log_index
+
+    def _get_ssl_protocol_versions(self, ssl_policy) -> List:
+        if ssl_policy not in self.ssl_protocol_versions:
+            policy_details = self.ssl_policies.get(ssl_policy)
+            if policy_details is None:
+                # Policies missing from the catalog are described on their own
+                response = self.aws_elbsv2_client.describe_ssl_policies(Names=[ssl_policy])
+                policy_details = response['SslPolicies'][0]
+                self.ssl_policies[ssl_policy] = policy_details
+            ssl_protocols = policy_details['SslProtocols']
+            self.ssl_protocol_versions[ssl_policy] = list(map(lambda x: float(x.split('v')[-1]), ssl_protocols))
+        return self.ssl_protocol_versions[ssl_policy]
 
     def _get_aws_latest_security_policies(self) -> List:
         policies = ['ELBSecurityPolicy-2016-08', 'ELBSecurityPolicy-FS-2018-06']
@@ -122,8 +225,7 @@ class Tester(interfaces.TesterInterface):
 
         for elb in elbs:
             load_balancer_name = elb['LoadBalancerName']
-            response = self.aws_elbs_client.describe_load_balancer_attributes(LoadBalancerName=load_balancer_name)
-            if response['LoadBalancerAttributes']['AccessLog']['Enabled']:
+            if self.elb_attributes[load_balancer_name]['AccessLog']['Enabled']:
                 # no issue
                 result.append({
                     "user": self.user_id,
@@ -159,8 +261,7 @@ class Tester(interfaces.TesterInterface):
             # check elbv2 type and only let ALB pass
             if elb['Type'] == "application":
                 load_balancer_arn = elb['LoadBalancerArn']
-                response = self.aws_elbsv2_client.describe_listeners(LoadBalancerArn=load_balancer_arn)
-                listeners = response['Listeners']
+                listeners = self.elbv2_listeners[load_balancer_arn]
                 secure_listener_count = 0
                 for listener in listeners:
                     if listener['Protocol'] == "HTTPS":
@@ -203,8 +304,7 @@ class Tester(interfaces.TesterInterface):
             elb_type = elb['Type']
 
             if elb_type == 'application' or elb_type == 'network':
-                elb_attributes = self.aws_elbsv2_client.describe_load_balancer_attributes(LoadBalancerArn=elb_arn)
-                attributes = elb_attributes['Attributes']
+                attributes = self.elbv2_attributes[elb_arn]
                 for i in attributes:
                     if i['Key'] == 'access_logs.s3.enabled':
                         if i['Value'] == 'false':
@@ -237,18 +337,12 @@ class Tester(interfaces.TesterInterface):
                 temp = arn_split[-1]
                 description_temp = temp.split('loadbalancer/')
                 network_interface_description = 'ELB' + ' ' + description_temp[-1]
-                ec2_client = boto3.client('ec2')
-                response = ec2_client.describe_network_interfaces(Filters=[{'Name' : 'description', 'Values' : [network_interface_description]}])
-                network_interfaces = response['NetworkInterfaces']
-                interface_ids = []
-                for interface in network_interfaces:
-                    interface_ids.append(interface['NetworkInterfaceId'])
+                flow_log_index = self._get_flow_log_index()
+                interface_ids = flow_log_index.interface_ids(network_interface_description)
 
                 has_flow_logs = 0
                 for id in interface_ids:
-                    response = ec2_client.describe_flow_logs(Filters=[{'Name': 'resource-id', 'Values' : [id]}])
-                    flow_logs = response['FlowLogs']
-                    if len(flow_logs) > 0:
+                    if flow_log_index.has_flow_logs(id):
                         has_flow_logs += 1
                     
                 if len(interface_ids) == has_flow_logs:
@@ -495,9 +589,8 @@ class Tester(interfaces.TesterInterface):
         latest_security_policies = self.latest_security_policies
         result = []
         for elb in elbv2:
-            response = self.aws_elbsv2_client.describe_listeners(LoadBalancerArn=elb['LoadBalancerArn'])
-            listeners = response['Listeners']
             elb_arn = elb['LoadBalancerArn']
+            listeners = self.elbv2_listeners[elb_arn]
             elb_type = elb['Type']
 
             if elb_type == 'application' or elb_type == 'network':
@@ -550,9 +643,7 @@ class Tester(interfaces.TesterInterface):
 
         for elb in elbs:
             elb_arn = elb['LoadBalancerArn']
-            response = self.aws_elbsv2_client.describe_load_balancer_attributes(LoadBalancerArn=elb_arn)
-
-            attrs = response['Attributes']
+            attrs = self.elbv2_attributes[elb_arn]
             
             for attr in attrs:
                 if attr['Key'] == 'deletion_protection.enabled':
@@ -590,15 +681,9 @@ class Tester(interfaces.TesterInterface):
 
         for elb in elbs:
             elb_arn = elb['LoadBalancerArn']
-            paginator = self.aws_elbsv2_client.get_paginator('describe_listeners')
-            response_iterator = paginator.paginate(LoadBalancerArn=elb_arn)
-            listerners = []
-            for page in response_iterator:
-                listerners.extend(page['Listeners'])
-            
-            for listerner in listerners:
+            listener_wo_https = False
+            for listerner in self.elbv2_listeners[elb_arn]:
                 protocol = listerner['Protocol']
-                listener_wo_https = False
                 
                 if protocol == 'HTTPS' or protocol == "TLS" or protocol == "GENEVE":
                     pass
@@ -633,7 +718,6 @@ class Tester(interfaces.TesterInterface):
     def get_alb_using_tls12_or_higher(self) -> List:
         result = []
         test_name = "application_load_balancer_should_allow_TLSv1.2_or_higher"
-        hash_map = {}
         elbs = self.elbsv2
         elb_count = len(elbs)
 
@@ -643,38 +727,18 @@ class Tester(interfaces.TesterInterface):
                 elb_type = elb['Type']
 
                 if elb_type == 'application':
-                    paginator = self.aws_elbsv2_client.get_paginator('describe_listeners')
-                    response_iterator = paginator.paginate(LoadBalancerArn=elb_arn)
-                    listerners = []
-                    
-                    for page in response_iterator:
-                        listerners.extend(page['Listeners'])
-
-                    for listener in listerners:
-                        ssl_policy = listener['SslPolicy'] if listener.get('SslPolicy') else 'no_ssl_policy'
-                        ssl_version_12 = hash_map.get(ssl_policy, None)
-                        listener_with_issue = False
-
-                        if ssl_policy != 'no_ssl_policy':
-                            if ssl_version_12 is None:
-                                response = self.aws_elbsv2_client.describe_ssl_policies(
-                                    Names=[ssl_policy]
-                                )
-                                policy_details = response['SslPolicies'][0]
-                                ssl_protocols = policy_details['SslProtocols']
-                                ssl_versions = list(map(lambda x: float(x), list(map(lambda x: x.split('v')[-1], ssl_protocols))))
-                                required_versions = list(filter(lambda x: x >= 1.2, ssl_versions))
-
-                                if len(required_versions) == 0:
-                                    hash_map[ssl_policy] = False
-                                    listener_with_issue = True
-                                    break
-                                else: hash_map[ssl_policy] = True
-                            elif ssl_version_12: listener_with_issue = False
-                            else:
+                    listener_with_issue = False
+                    for listener in self.elbv2_listeners[elb_arn]:
+                        ssl_policy = listener.get('SslPolicy')
+
+                        if ssl_policy:
+                            ssl_versions = self._get_ssl_protocol_versions(ssl_policy)
+                            required_versions = list(filter(lambda x: x >= 1.2, ssl_versions))
+
+                            if len(required_versions) == 0:
                                 listener_with_issue = True
                                 break
-                        else: 
+                        else:
                             listener_with_issue = True
                             break
                     if listener_with_issue:
@@ -729,7 +793,6 @@ class Tester(interfaces.TesterInterface):
     def get_nlb_using_tls12_or_higher(self) -> List:
         result = []
         test_name = "network_load_balancer_should_allow_TLSv1.2_or_higher"
-        hash_map = {}
         elbs = self.elbsv2
         elb_count = len(elbs)
 
@@ -739,34 +802,15 @@ class Tester(interfaces.TesterInterface):
                 elb_type = elb['Type']
 
                 if elb_type == 'network':
-                    paginator = self.aws_elbsv2_client.get_paginator('describe_listeners')
-                    response_iterator = paginator.paginate(LoadBalancerArn=elb_arn)
-                    listerners = []
-                    for page in response_iterator:
-                        listerners.extend(page['Listeners'])
-
-                    for listener in listerners:
-                        ssl_policy = listener['SslPolicy'] if listener.get('SslPolicy') else 'no_ssl_policy'
-                        ssl_version_12 = hash_map.get(ssl_policy, None)
-                        listener_with_issue = False
-
-                        if ssl_policy != 'no_ssl_policy':
-                            if ssl_version_12 is None:
-                                response = self.aws_elbsv2_client.describe_ssl_policies(
-                                    Names=[ssl_policy]
-                                )
-                                policy_details = response['SslPolicies'][0]
-                                ssl_protocols = policy_details['SslProtocols']
-                                ssl_versions = list(map(lambda x: float(x), list(map(lambda x: x.split('v')[-1], ssl_protocols))))
-                                required_versions = list(filter(lambda x: x >= 1.2, ssl_versions))
-
-                                if len(required_versions) == 0:
-                                    hash_map[ssl_policy] = False
-                                    listener_with_issue = True
-                                    break
-                                else: hash_map[ssl_policy] = True
-                            elif ssl_version_12: listener_with_issue = False
-                            else:
+                    listener_with_issue = False
+                    for listener in self.elbv2_listeners[elb_arn]:
+                        ssl_policy = listener.get('SslPolicy')
+
+                        if ssl_policy:
+                            ssl_versions = self._get_ssl_protocol_versions(ssl_policy)
+                            required_versions = list(filter(lambda x: x >= 1.2, ssl_versions))
+
+                            if len(required_versions) == 0:
                                 listener_with_issue = True
                                 break
                         else:
@@ -866,48 +910,23 @@ class Tester(interfaces.TesterInterface):
         test_name = "network_load_balancer_should_not_support_insecure_negotiation_policy"
         result = []
         elbs = self.elbsv2
-        hash_map = {}
         elb_count = len(elbs)
         if elb_count > 0:
             for elb in elbs:
                 elb_arn = elb['LoadBalancerArn']
                 elb_type = elb['Type']
                 if elb_type == 'network':
-                    paginator = self.aws_elbsv2_client.get_paginator('describe_listeners')
-                    response_iterator = paginator.paginate(LoadBalancerArn=elb_arn)
-                    listerners = []
-                    
-                    for page in response_iterator:
-                        listerners.extend(page['Listeners'])
-                    
-                    for listener in listerners:
-                        ssl_policy = listener['SslPolicy'] if listener.get('SslPolicy') else 'no_ssl_policy'
-
-                        if ssl_policy != 'no_ssl_policy':
-                            ssl_version_11 = hash_map.get(ssl_policy, None)
-                            listener_with_issue = False
-
-                            if ssl_version_11 is None:
-                                response = self.aws_elbsv2_client.describe_ssl_policies(
-                                    Names=[ssl_policy]
-                                )
-                                policy_details = response['SslPolicies'][0]
-                                ssl_protocols = policy_details['SslProtocols']
-                                ssl_versions = list(map(lambda x: float(x), list(map(lambda x: x.split('v')[-1], ssl_protocols))))
+                    listener_with_issue = False
+                    for listener in self.elbv2_listeners[elb_arn]:
+                        ssl_policy = listener.get('SslPolicy')
 
-                                required_versions = list(filter(lambda x: x == 1.0 or x == 1.1, ssl_versions))
+                        if ssl_policy:
+                            ssl_versions = self._get_ssl_protocol_versions(ssl_policy)
+                            insecure_versions = list(filter(lambda x: x == 1.0 or x == 1.1, ssl_versions))
 
-                                if len(required_versions) == 0:
-                                    hash_map[ssl_policy] = False
-                                else:
-                                    listener_with_issue = True
-                                    hash_map[ssl_policy] = True
-                                    break
-                            elif ssl_version_11:
+                            if len(insecure_versions) > 0:
                                 listener_with_issue = True
                                 break
-                            else: listener_with_issue = False
-
                         else: 
                             listener_with_issue = True
                             break
@@ -972,16 +991,9 @@ class Tester(interfaces.TesterInterface):
                 elb_type = elb['Type']
                 elb_arn = elb['LoadBalancerArn']
                 if elb_type == 'application':
-                    paginator = self.aws_elbsv2_client.get_paginator('describe_listeners')
-                    response_iterator = paginator.paginate(LoadBalancerArn=elb_arn)
-                    listerners = []
-
-                    for page in response_iterator:
-                        listerners.extend(page['Listeners'])
-                    
                     elb_certificates = []
                     
-                    for listener in listerners:
+                    for listener in self.elbv2_listeners[elb_arn]:
                         certificates = listener.get('Certificates')
                         if certificates is not None:
                             elb_certificates.extend(certificates)
@@ -1,13 +1,107 @@
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
+import requests.adapters
 import interfaces
 
+_GITHUB_API_URL = 'https://api.github.com'
+_GITHUB_PAGE_SIZE = 100
+
+# Pages kept for the lifetime of the Lambda container to send conditional requests, url -> (etag, items, next url).
+# GitHub does not count the 304 answers to conditional requests against the rate limit.
+_etag_cache = {}
+_etag_cache_lock = threading.Lock()
+
+
+class _GithubClient:
+    def __init__(self, request_headers, max_workers, timeout, rate_limit_reserve, max_rate_limit_wait):
+        self.request_headers = request_headers
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.rate_limit_reserve = rate_limit_reserve
+        self.max_rate_limit_wait = max_rate_limit_wait
+        self.rate_limit_remaining = None
+        self.rate_limit_reset = None
+        self._rate_limit_lock = threading.Lock()
+        self._http_sessions = threading.local()
+
+    def get_all(self, path) -> list:
+        # Follows the Link header until the last page
+        url = _GITHUB_API_URL + path + ('&' if '?' in path else '?') + 'per_page=' + str(_GITHUB_PAGE_SIZE)
+        items = []
+        while url:
+            page_items, url = self._get_page(url)
+            items.extend(page_items)
+        return items
+
+    def _get_page(self, url):
+        with _etag_cache_lock:
+            cached_page = _etag_cache.get(url)
+        headers = dict(self.request_headers)
+        if cached_page is not None:
+            headers['If-None-Match'] = cached_page[0]
+        while True:
+            self._wait_for_rate_limit()
+            response = self._get_http_session().get(url, headers=headers, timeout=self.timeout)
+            self._update_rate_limit(response)
+            # Rejected for exhausting the quota, the next wait holds until the reset time
+            if response.status_code in (403, 429) and self.rate_limit_remaining == 0:
+                continue
+            break
+        if response.status_code == 304 and cached_page is not None:
+            return cached_page[1], cached_page[2]
+        response.raise_for_status()
+        items = response.json()
+        next_url = response.links.get('next', {}).get('url')
+        if response.headers.get('ETag'):
+            with _etag_cache_lock:
+                _etag_cache[url] = (response.headers['ETag'], items, next_url)
+        return items, next_url
+
+    def _wait_for_rate_limit(self):
+        # Every request takes one unit of the last known quota, so concurrent workers stay within it
+        with self._rate_limit_lock:
+            if self.rate_limit_remaining is None:
+                return
+            if self.rate_limit_remaining <= self.rate_limit_reserve:
+                wait_seconds = max(self.rate_limit_reset - time.time(), 0) + 1
+                if wait_seconds > self.max_rate_limit_wait:
+                    raise Exception("GitHub rate limit exhausted, it resets in " + str(int(wait_seconds)) + " seconds")
+                print("WARN: GitHub rate limit is low, waiting " + str(int(wait_seconds)) + " seconds for its reset")
+                time.sleep(wait_seconds)
+                self.rate_limit_remaining = None
+                return
+            self.rate_limit_remaining -= 1
+
+    def _update_rate_limit(self, response):
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+        if remaining is not None and reset is not None:
+            with self._rate_limit_lock:
+                self.rate_limit_remaining = int(remaining)
+                self.rate_limit_reset = int(reset)
+
+    def _get_http_session(self):
+        # requests sessions are not thread safe, so every fetching thread keeps its own pooled keep-alive session
+        session = getattr(self._http_sessions, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+            session.mount("https://", adapter)
+            self._http_sessions.session = session
+        return session
+
 
 class Tester(interfaces.TesterInterface):
-    def __init__(self):
+    # Not tied to any AWS account, the organizations are scanned once
+    scope = "external"
+
+    def __init__(self, aws_context):
         self.github_authorization_token = os.environ.get('AUTOPOSTURE_GITHUB_TOKEN')
         self.github_organizations = os.environ.get('AUTOPOSTURE_GITHUB_ORGANIZATIONS')
+        self.max_workers = int(os.environ.get('AUTOPOSTURE_GITHUB_MAX_WORKERS', '8'))
         self.tests = {
             "users_without_mfa": {
                 "method": self.get_users_without_mfa,
@@ -26,6 +120,13 @@ class Tester(interfaces.TesterInterface):
             "Authorization": "token " + self.github_authorization_token,
             "Accept": "application/vnd.github.v3+json"
         }
+        self.github_client = _GithubClient(
+            self.request_headers,
+            self.max_workers,
+            float(os.environ.get('AUTOPOSTURE_GITHUB_TIMEOUT', '10')),
+            int(os.environ.get('AUTOPOSTURE_GITHUB_RATE_LIMIT_RESERVE', '50')),
+            int(os.environ.get('AUTOPOSTURE_GITHUB_MAX_RATE_LIMIT_WAIT', '60'))
+        )
 
     def declare_tested_service(self) -> str:
         return 'github'
@@ -34,52 +135,44 @@ class Tester(interfaces.TesterInterface):
         return 'github'
 
     def run_tests(self) -> list:
-        results = []
+        return [result for batch in self.iter_tests() for result in batch]
+
+    def iter_tests(self):
         organizations_list = self.get_organizations_list(self.github_organizations)
-        for test_name in self.tests.keys():
-            for organization in organizations_list:
-                raw_results = self.tests[test_name]["method"](organization)
-                if len(raw_results) > 0:
-                    for item in raw_results:
-                        if item["issue"]:
-                            results.append({
-                                "timestamp": time.time(),
-                                "account": organization,
-                                "item": item["item"],
-                                "item_type": self.tests[test_name]["result_item_type"],
-                                "test_name": test_name,
-                                "test_result": "issue_found"
-                            })
-                        else:
-                            results.append({
-                                "timestamp": time.time(),
-                                "account": organization,
-                                "item": item["item"],
-                                "item_type": self.tests[test_name]["result_item_type"],
-                                "test_name": test_name,
-                                "test_result": "no_issue_found"})
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for results in executor.map(self._run_organization_tests, organizations_list):
+                yield results
 
+    def _run_organization_tests(self, organization):
+        results = []
+        for test_name in self.tests.keys():
+            raw_results = self.tests[test_name]["method"](organization)
+            for item in raw_results:
+                results.append({
+                    "timestamp": time.time(),
+                    "account": organization,
+                    "item": item["item"],
+                    "item_type": self.tests[test_name]["result_item_type"],
+                    "test_name": test_name,
+                    "test_result": "issue_found" if item["issue"] else "no_issue_found"
+                })
         return results
 
     def get_organizations_list(self, organizations):
         if organizations is not None:
             return str(organizations).split(',')
         else:
-            raw_results = requests.get(headers=self.request_headers, url='https://api.github.com/user/orgs')
-            raw_results_obj = raw_results.json()
             result = []
-            for organization in raw_results_obj:
+            for organization in self.github_client.get_all('/user/orgs'):
                 result.append(organization["login"])
             return result
 
     def get_users_without_mfa(self, organization):
         result = []
-        raw_api_result_all_users = requests.get(headers=self.request_headers, url='https://api.github.com/orgs/' + organization + '/members')
-        raw_api_result_all_users_obj = raw_api_result_all_users.json()
-        raw_api_result_2fa_disabled = requests.get(headers=self.request_headers, url='https://api.github.com/orgs/' + organization + '/members?filter=2fa_disabled')
-        raw_api_result_2fa_disabled_obj = raw_api_result_2fa_disabled.json()
-        for user in raw_api_result_all_users_obj:
-            if user["login"] in [u.login for u in raw_api_result_2fa_disabled_obj]:
+        all_users = self.github_client.get_all('/orgs/' + organization + '/members')
+        users_2fa_disabled = set(u["login"] for u in self.github_client.get_all('/orgs/' + organization + '/members?filter=2fa_disabled'))
+        for user in all_users:
+            if user["login"] in users_2fa_disabled:
                 result.append({"item": user["login"] + "@@" + organization, "issue": True})
             else:
                 result.append({"item": user["login"] + "@@" + organization, "issue": False})
@@ -88,9 +181,7 @@ class Tester(interfaces.TesterInterface):
 
     def get_forkable_repositories(self, organization):
         result = []
-        raw_api_result = requests.get(headers=self.request_headers, url='https://api.github.com/orgs/' + organization + '/repos')
-        raw_api_result_obj = raw_api_result.json()
-        for repo in raw_api_result_obj:
+        for repo in self.github_client.get_all('/orgs/' + organization + '/repos'):
             if repo["allow_forking"]:
                 result.append({"item": repo["name"], "issue": True})
             else:
@@ -101,9 +192,7 @@ class Tester(interfaces.TesterInterface):
     def check_for_too_many_admin_users(self, organization):
         result = []
         org_admins = []
-        raw_api_result = requests.get(headers=self.request_headers, url='https://api.github.com/orgs/' + organization + '/members?role=admin')
-        raw_api_result_obj = raw_api_result.json()
-        for user in raw_api_result_obj:
+        for user in self.github_client.get_all('/orgs/' + organization + '/members?role=admin'):
             org_admins.append(user["login"])
         if len(org_admins) > 15:
             result.append({"item": organization, "issue": True})
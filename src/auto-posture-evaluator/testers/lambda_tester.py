@@ -1,17 +1,36 @@
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 import json
 import re
+import botocore.exceptions
 import interfaces
-import boto3
-import requests
+import reference_data
+
+_THROTTLING_ERROR_CODES = ('TooManyRequestsException', 'ThrottlingException')
+_GET_POLICY_MAX_ATTEMPTS = 5
+
+
+def _is_statement_publicly_accessible(statement):
+    principal = statement.get('Principal')
+    if isinstance(principal, dict):
+        principal = principal.get('AWS')
+    return principal == '*' and 'Condition' not in statement
+
 
 class Tester(interfaces.TesterInterface):
-    def __init__(self) -> None:
-        self.aws_lambda_client = boto3.client('lambda')
-        self.user_id = boto3.client('sts').get_caller_identity().get('UserId')
-        self.account_arn = boto3.client('sts').get_caller_identity().get('Arn')
-        self.account_id = boto3.client('sts').get_caller_identity().get('Account')
+    shardable = True
+
+    def __init__(self, aws_context) -> None:
+        self.aws_context = aws_context
+        self.aws_lambda_client = aws_context.client('lambda')
+        self.user_id = aws_context.user_id
+        self.account_arn = aws_context.account_arn
+        self.account_id = aws_context.account_id
+        # "all" scans every published version, "latest" only the unpublished $LATEST of each function
+        self.function_versions = os.environ.get('AUTOPOSTURE_LAMBDA_FUNCTION_VERSIONS', 'all').lower()
+        self.max_workers = int(os.environ.get('AUTOPOSTURE_LAMBDA_MAX_WORKERS', '8'))
         self.functions = self._get_all_functions()
         self.SUPPORTED_LAMBDA_RUNTIME = "https://cgx-s3-nsm-logshipper-config.s3.eu-west-1.amazonaws.com/acceptable-lambda-runtime-versions.json"
 
@@ -22,26 +41,58 @@ class Tester(interfaces.TesterInterface):
         return 'aws'
 
     def run_tests(self) -> list:
-        return \
-            self.get_lambda_publicly_accessible() + \
-            self.get_lambda_has_access_to_vpc_resources() + \
-            self.get_lambda_uses_latest_runtime()
+        return [result for batch in self.iter_tests() for result in batch]
+
+    def iter_tests(self):
+        yield self.get_lambda_publicly_accessible()
+        yield self.get_lambda_has_access_to_vpc_resources()
+        yield self.get_lambda_uses_latest_runtime()
 
     def _get_all_functions(self) -> List:
         paginator = self.aws_lambda_client.get_paginator('list_functions')
-        response_iterator = paginator.paginate(FunctionVersion='ALL')
+        if self.function_versions == 'latest':
+            response_iterator = paginator.paginate()
+        else:
+            response_iterator = paginator.paginate(FunctionVersion='ALL')
 
         functions = []
         for response in response_iterator:
-            functions.extend(response['Functions'])
+            # Sharded by name so that all the versions of a function are scanned together
+            functions.extend(function for function in response['Functions']
+                             if self.aws_context.in_shard(function['FunctionName']))
         
         return functions
 
+    def _get_function_policy(self, Lambda):
+        # The parsed resource policy of the version, an empty one when it has none and None when it could not be read.
+        # Each published version has its own policy, the unqualified one is the policy of $LATEST
+        function_name = Lambda['FunctionName']
+        version = Lambda.get('Version', '$LATEST')
+        for attempt in range(_GET_POLICY_MAX_ATTEMPTS):
+            try:
+                if version == '$LATEST':
+                    policy = self.aws_lambda_client.get_policy(FunctionName=function_name)
+                else:
+                    policy = self.aws_lambda_client.get_policy(FunctionName=function_name, Qualifier=version)
+                return json.loads(policy['Policy'])
+            except botocore.exceptions.ClientError as ex:
+                error_code = ex.response['Error']['Code']
+                if error_code == 'ResourceNotFoundException':
+                    return {}
+                if error_code in _THROTTLING_ERROR_CODES and attempt < _GET_POLICY_MAX_ATTEMPTS - 1:
+                    time.sleep(0.5 * 2 ** attempt)
+                    continue
+                print("WARN: Could not get the policy of the lambda function " + function_name + " version " +
+                      version + " - " + str(ex))
+                return None
+
+    def _get_supported_runtime_versions(self):
+        return reference_data.default_cache().get_url(self.SUPPORTED_LAMBDA_RUNTIME)
+
     def get_lambda_uses_latest_runtime(self) -> List:
         lambdas = self.functions
         test_name = "lambda_uses_latest_runtime"
-        response = requests.get(self.SUPPORTED_LAMBDA_RUNTIME)
-        supported_versions_repo = response.json()
+        supported_versions_repo = self._get_supported_runtime_versions()
         result = []
         for Lambda in lambdas:
             runtime = Lambda['Runtime']
@@ -73,54 +124,27 @@ class Tester(interfaces.TesterInterface):
         return result
     
     def get_lambda_publicly_accessible(self) -> List:
-        lambdas = self.functions
         test_name = "lambda_function_not_publicly_accessible"
         result = []
-        function_arn_with_issue = []
-        for Lambda in lambdas:
-            try:
-                policy = self.aws_lambda_client.get_policy(FunctionName=Lambda['FunctionName'])
-                policy_json = json.loads(policy['Policy'])
-                policy_statements = policy_json['Statement']
-                for statement in policy_statements:
-                    if (statement['Principal'] == '*' or statement['Principal']['AWS'] == '*') and 'Condition' not in statement:
-
-                        function_arn_with_issue.append(Lambda['FunctionArn'])
-                    else:
-                        result.append({
-                            "user": self.user_id,
-                            "account_arn": self.account_arn,
-                            "account": self.account_id,
-                            "timestamp": time.time(),
-                            "item": Lambda['FunctionArn'],
-                            "item_type": "aws_lambda",
-                            "test_name": test_name,
-                            "test_result": "no_issue_found" 
-                        })
-            except Exception as e:
-                result.append({
-                    "user": self.user_id,
-                    "account_arn": self.account_arn,
-                    "account": self.account_id,
-                    "timestamp": time.time(),
-                    "item": Lambda['FunctionArn'],
-                    "item_type": "aws_lambda",
-                    "test_name": test_name,
-                    "test_result": "no_issue_found"
-                })
-        function_arn_with_issue = set(function_arn_with_issue) 
-        for arn in function_arn_with_issue:
+        # Aliases are not listed by list_functions, their policies are not checked
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            policies = list(executor.map(self._get_function_policy, self.functions))
+
+        for Lambda, policy in zip(self.functions, policies):
+            if policy is None:
+                continue
+            is_public = any(_is_statement_publicly_accessible(statement) for statement in policy.get('Statement', []))
             result.append({
                 "user": self.user_id,
                 "account_arn": self.account_arn,
                 "account": self.account_id,
                 "timestamp": time.time(),
-                "item": arn,
+                "item": Lambda['FunctionArn'],
                 "item_type": "aws_lambda",
                 "test_name": test_name,
-                "test_result": "issue_found"
-            })   
-        
+                "test_result": "issue_found" if is_public else "no_issue_found"
+            })
+
         return result
 
     def get_lambda_has_access_to_vpc_resources(self) -> List:
@@ -1,13 +1,13 @@
 import time
-import boto3
 import interfaces
 
 class Tester(interfaces.TesterInterface):
-    def __init__(self) -> None:
-        self.user_id = boto3.client('sts').get_caller_identity().get('UserId')
-        self.account_arn = boto3.client('sts').get_caller_identity().get('Arn')
-        self.account_id = boto3.client('sts').get_caller_identity().get('Account')
-        self.aws_neptune_client = boto3.client('neptune')
+    def __init__(self, aws_context) -> None:
+        self.aws_context = aws_context
+        self.user_id = aws_context.user_id
+        self.account_arn = aws_context.account_arn
+        self.account_id = aws_context.account_id
+        self.aws_neptune_client = aws_context.client('neptune')
         self.db_clusters = self._get_all_neptune_clusters()
 
     def declare_tested_provider(self) -> str:
@@ -17,9 +17,11 @@ class Tester(interfaces.TesterInterface):
         return "neptune"
 
     def run_tests(self) -> list:
-        return \
-            self.get_database_encryption_disabled() + \
-            self.get_neptune_cluster_audit_logs_disabled()
+        return [result for batch in self.iter_tests() for result in batch]
+
+    def iter_tests(self):
+        yield self.get_database_encryption_disabled()
+        yield self.get_neptune_cluster_audit_logs_disabled()
 
     def _get_all_neptune_clusters(self):
         db_clusters = []
@@ -1,5 +1,4 @@
 import time
-import boto3
 import interfaces
 
 
@@ -16,12 +15,13 @@ def _return_default_port_on_rds_engines(db_engine):
 
 
 class Tester(interfaces.TesterInterface):
-    def __init__(self):
-        self.aws_rds_client = boto3.client('rds')
+    def __init__(self, aws_context):
+        self.aws_context = aws_context
+        self.aws_rds_client = aws_context.client('rds')
         self.cache = {}
-        self.user_id = boto3.client('sts').get_caller_identity().get('UserId')
-        self.account_arn = boto3.client('sts').get_caller_identity().get('Arn')
-        self.account_id = boto3.client('sts').get_caller_identity().get('Account')
+        self.user_id = aws_context.user_id
+        self.account_arn = aws_context.account_arn
+        self.account_id = aws_context.account_id
         self.rds_instances = self.aws_rds_client.describe_db_instances()
         self.rds_snapshots = self.aws_rds_client.describe_db_snapshots()
 
@@ -32,10 +32,13 @@ class Tester(interfaces.TesterInterface):
         return 'aws'
 
     def run_tests(self) -> list:
-        return self.detect_rds_instance_encrypted() + \
-               self.detect_rds_instance_not_publicly_accessible() + \
-               self.detect_rds_instance_not_using_default_port() + \
-               self.detect_rds_snapshot_not_publicly_accessible()
+        return [result for batch in self.iter_tests() for result in batch]
+
+    def iter_tests(self):
+        yield self.detect_rds_instance_encrypted()
+        yield self.detect_rds_instance_not_publicly_accessible()
+        yield self.detect_rds_instance_not_using_default_port()
+        yield self.detect_rds_snapshot_not_publicly_accessible()
 
     def _append_rds_test_result(self, rds, test_name, issue_status):
         return {
@@ -1,5 +1,4 @@
 import time
-import boto3
 import interfaces
 
 
@@ -12,12 +11,13 @@ def _return_default_custom_master_username_on_redshift_engines():
 
 
 class Tester(interfaces.TesterInterface):
-    def __init__(self):
-        self.aws_redshift_client = boto3.client('redshift')
+    def __init__(self, aws_context):
+        self.aws_context = aws_context
+        self.aws_redshift_client = aws_context.client('redshift')
         self.cache = {}
-        self.user_id = boto3.client('sts').get_caller_identity().get('UserId')
-        self.account_arn = boto3.client('sts').get_caller_identity().get('Arn')
-        self.account_id = boto3.client('sts').get_caller_identity().get('Account')
+        self.user_id = aws_context.user_id
+        self.account_arn = aws_context.account_arn
+        self.account_id = aws_context.account_id
         self.redshift_clusters = self.aws_redshift_client.describe_clusters()
 
     def declare_tested_service(self) -> str:
@@ -27,14 +27,17 @@ class Tester(interfaces.TesterInterface):
         return 'aws'
 
     def run_tests(self) -> list:
-        return self.detect_redshift_cluster_encrypted() + \
-               self.detect_redshift_cluster_not_publicly_accessible() + \
-               self.detect_redshift_cluster_not_using_default_port() + \
-               self.detect_redshift_cluster_not_using_custom_master_username() + \
-               self.detect_redshift_cluster_using_logging() + \
-               self.detect_redshift_cluster_allow_version_upgrade() + \
-               self.detect_redshift_cluster_requires_ssl() + \
-               self.detect_redshift_cluster_not_using_ec2_classic()
+        return [result for batch in self.iter_tests() for result in batch]
+
+    def iter_tests(self):
+        yield self.detect_redshift_cluster_encrypted()
+        yield self.detect_redshift_cluster_not_publicly_accessible()
+        yield self.detect_redshift_cluster_not_using_default_port()
+        yield self.detect_redshift_cluster_not_using_custom_master_username()
+        yield self.detect_redshift_cluster_using_logging()
+        yield self.detect_redshift_cluster_allow_version_upgrade()
+        yield self.detect_redshift_cluster_requires_ssl()
+        yield self.detect_redshift_cluster_not_using_ec2_classic()
 
     def _append_redshift_test_result(self, redshift, test_name, issue_status):
         return {
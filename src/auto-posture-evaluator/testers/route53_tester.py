@@ -1,19 +1,28 @@
+import os
 import time
-import boto3
 import re
 import ipaddress
-import botocore.exceptions
+from concurrent.futures import ThreadPoolExecutor
 import interfaces
 
 
 class Tester(interfaces.TesterInterface):
-    def __init__(self):
-        self.aws_route53_client = boto3.client('route53')
-        self.aws_ec2_client = boto3.client('ec2')
-        self.hosted_zones = self.aws_route53_client.list_hosted_zones()
-        self.user_id = boto3.client('sts').get_caller_identity().get('UserId')
-        self.account_arn = boto3.client('sts').get_caller_identity().get('Arn')
-        self.account_id = boto3.client('sts').get_caller_identity().get('Account')
+    # Hosted zones are global, Elastic IPs are looked up in every scanned region
+    scope = "global"
+    shardable = True
+
+    def __init__(self, aws_context):
+        self.aws_context = aws_context
+        self.aws_route53_client = aws_context.client('route53')
+        self.aws_ec2_client = aws_context.client('ec2')
+        self.user_id = aws_context.user_id
+        self.account_arn = aws_context.account_arn
+        self.account_id = aws_context.account_id
+        # Route53 allows 5 requests per second per account, zones are listed by a few workers only
+        self.max_workers = int(os.environ.get('AUTOPOSTURE_ROUTE53_MAX_WORKERS', '4'))
+        self.eip_regions = aws_context.regions
+        self.hosted_zones = self._get_all_hosted_zones()
+        self.elastic_ips = None
 
     def declare_tested_service(self) -> str:
         return 'route53'
@@ -22,70 +31,91 @@ class Tester(interfaces.TesterInterface):
         return 'aws'
 
     def run_tests(self) -> list:
-        if self.hosted_zones is not None and 'HostedZones' in self.hosted_zones:
-            return self.detect_dangling_dns_records()
-        else:
-            raise Exception("No Route53 data could be retrieved.")
+        return [result for batch in self.iter_tests() for result in batch]
 
-    def detect_dangling_dns_records(self):
-        result = []
+    def iter_tests(self):
         # Filtering the list to get the list of public zones only
-        public_zones = [zone for zone in self.hosted_zones['HostedZones'] if not zone['Config']['PrivateZone']]
-        for cur_zone in public_zones:
-            # Get all records in this zone
-            zone_records = self.aws_route53_client.list_resource_record_sets(
-                HostedZoneId=cur_zone['Id'],
-                StartRecordName='.',
-                StartRecordType='A'
-            )['ResourceRecordSets']
+        public_zones = [zone for zone in self.hosted_zones if not zone['Config']['PrivateZone']]
+        if len(public_zones) == 0:
+            return
+        # Loaded before the zones are dispatched so the workers share a single copy
+        self._get_elastic_ips()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for zone_results in executor.map(self._detect_dangling_dns_records_in_zone, public_zones):
+                yield zone_results
+
+    def _get_all_hosted_zones(self) -> list:
+        hosted_zones = []
+        for page in self.aws_route53_client.get_paginator('list_hosted_zones').paginate():
+            hosted_zones.extend(zone for zone in page['HostedZones'] if self.aws_context.in_shard(zone['Id']))
+        return hosted_zones
+
+    def _get_elastic_ips(self) -> set:
+        # All the account Elastic IPs are loaded once, record addresses are then checked against the set
+        if self.elastic_ips is None:
+            elastic_ips = set()
+            for region in self.eip_regions:
+                response = self.aws_context.client('ec2', region_name=region).describe_addresses()
+                elastic_ips.update(address['PublicIp'] for address in response['Addresses'] if 'PublicIp' in address)
+            self.elastic_ips = elastic_ips
+        return self.elastic_ips
 
-            # Extract record names
-            record_names = [record_name["Name"] for record_name in zone_records]
+    def _iter_zone_records(self, zone_id):
+        paginator = self.aws_route53_client.get_paginator('list_resource_record_sets')
+        for page in paginator.paginate(HostedZoneId=zone_id, StartRecordName='.', StartRecordType='A'):
+            for record in page['ResourceRecordSets']:
+                yield record
 
-            # Get public IPs per DNS record
-            for record in zone_records:
-                record_name = record["Name"]
-                dangling_ip_addresses = []
-                registered_addresses = [record["ResourceRecords"] for record in zone_records if record["Name"] == record_name][0]
-                registered_ip_addresses = [resource_record["Value"] for resource_record in registered_addresses if re.match('\\d{1,3}\\.\\d{1,3}\\.\\d{1,3}\\.\\d{1,3}', str(resource_record["Value"]))]
+    def detect_dangling_dns_records(self):
+        return self.run_tests()
+
+    def _detect_dangling_dns_records_in_zone(self, cur_zone):
+        result = []
+        elastic_ips = self._get_elastic_ips()
+        # Record sets are sorted by name, the addresses checked for a name are the ones of its first record set,
+        # so only the first record set of the current name is kept
+        first_record_name = None
+        first_record = None
+        for record in self._iter_zone_records(cur_zone['Id']):
+            record_name = record["Name"]
+            if record_name != first_record_name:
+                first_record_name = record_name
+                first_record = record
+            dangling_ip_addresses = []
+            registered_addresses = first_record.get("ResourceRecords", [])
+            registered_ip_addresses = [resource_record["Value"] for resource_record in registered_addresses if re.match('\\d{1,3}\\.\\d{1,3}\\.\\d{1,3}\\.\\d{1,3}', str(resource_record["Value"]))]
 
-                for registered_ip_address in registered_ip_addresses:
-                    if ipaddress.ip_address(registered_ip_address).is_global:
-                        try:
-                            self.aws_ec2_client.describe_addresses(PublicIps=[registered_ip_address])
-                        except botocore.exceptions.ClientError as ex:
-                            if ex.response['Error']['Code'] == 'InvalidAddress.NotFound':
-                                dangling_ip_addresses.append(registered_ip_address)
-                            else:
-                                raise ex
+            for registered_ip_address in registered_ip_addresses:
+                if ipaddress.ip_address(registered_ip_address).is_global and registered_ip_address not in elastic_ips:
+                    dangling_ip_addresses.append(registered_ip_address)
 
-                if len(dangling_ip_addresses) > 0:
-                    for dangling_ip_address in dangling_ip_addresses:
-                        result.append({
-                            "user": self.user_id,
-                            "account_arn": self.account_arn,
-                            "account": self.account_id,
-                            "item": dangling_ip_address + "@@" + record_name,
-                            "item_type": "dns_record",
-                            "dns_record": record_name,
-                            "record": record,
-                            "test_name": 'dangling_dns_records',
-                            "dangling_ip": dangling_ip_address,
-                            "zone": cur_zone["Id"],
-                            "timestamp": time.time(),
-                            "test_result": "issue_found"
-                        })
-                else:
+            if len(dangling_ip_addresses) > 0:
+                for dangling_ip_address in dangling_ip_addresses:
                     result.append({
                         "user": self.user_id,
                         "account_arn": self.account_arn,
                         "account": self.account_id,
-                        "test_name": 'dangling_dns_records',
-                        "item": record_name,
+                        "item": dangling_ip_address + "@@" + record_name,
                         "item_type": "dns_record",
+                        "dns_record": record_name,
                         "record": record,
+                        "test_name": 'dangling_dns_records',
+                        "dangling_ip": dangling_ip_address,
+                        "zone": cur_zone["Id"],
                         "timestamp": time.time(),
-                        "test_result": "no_issue_found"
+                        "test_result": "issue_found"
                     })
+            else:
+                result.append({
+                    "user": self.user_id,
+                    "account_arn": self.account_arn,
+                    "account": self.account_id,
+                    "test_name": 'dangling_dns_records',
+                    "item": record_name,
+                    "item_type": "dns_record",
+                    "record": record,
+                    "timestamp": time.time(),
+                    "test_result": "no_issue_found"
+                })
 
         return result
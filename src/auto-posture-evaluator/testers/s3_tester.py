@@ -1,21 +1,48 @@
+import collections
 import json
+import os
 import time
-import boto3
+from concurrent.futures import ThreadPoolExecutor
 import botocore.exceptions
+import incremental
 import interfaces
 import requests
+import requests.adapters
 import urllib.parse
 
+# Both protocols are probed in the same pass over the buckets
+_URL_ACCESS_TESTS = [
+    ("http", "publicly_accessible_s3_buckets_by_http_url"),
+    ("https", "publicly_accessible_s3_buckets_by_https_url")
+]
+
 
 class Tester(interfaces.TesterInterface):
-    def __init__(self):
-        self.aws_s3_client = boto3.client('s3')
-        self.aws_s3_resource = boto3.resource('s3')
-        self.cache = {}
-        self.user_id = boto3.client('sts').get_caller_identity().get('UserId')
-        self.account_arn = boto3.client('sts').get_caller_identity().get('Arn')
-        self.account_id = boto3.client('sts').get_caller_identity().get('Account')
-        self.s3_buckets = boto3.client('s3').list_buckets()
+    # Buckets are listed account wide, each one is then read in its own region
+    scope = "global"
+    shardable = True
+
+    def __init__(self, aws_context):
+        self.aws_context = aws_context
+        self.aws_s3_client = aws_context.client('s3')
+        self.user_id = aws_context.user_id
+        self.account_arn = aws_context.account_arn
+        self.account_id = aws_context.account_id
+        self.max_workers = int(os.environ.get('AUTOPOSTURE_S3_MAX_WORKERS', '16'))
+        self.url_probe_workers = int(os.environ.get('AUTOPOSTURE_S3_URL_PROBE_WORKERS', '32'))
+        self.url_probe_timeout = float(os.environ.get('AUTOPOSTURE_S3_URL_PROBE_TIMEOUT', '5'))
+        self.bucket_regions = {}
+        # One session for every probing thread. Each bucket URL is its own host, so connections are hardly reused,
+        # the adapter bounds the pools kept open to one per probing thread
+        self.http_session = requests.Session()
+        http_adapter = requests.adapters.HTTPAdapter(pool_connections=self.url_probe_workers,
+                                                     pool_maxsize=self.url_probe_workers)
+        self.http_session.mount("http://", http_adapter)
+        self.http_session.mount("https://", http_adapter)
+        self.fingerprints = incremental.ResourceFingerprints(aws_context, 's3')
+        self.s3_buckets = self.aws_s3_client.list_buckets()
+        self.s3_buckets["Buckets"] = [bucket_meta for bucket_meta in self.s3_buckets["Buckets"]
+                                      if aws_context.in_shard(bucket_meta["Name"])]
 
     def declare_tested_service(self) -> str:
         return 's3'
@@ -24,569 +51,231 @@ class Tester(interfaces.TesterInterface):
         return 'aws'
 
     def run_tests(self) -> list:
-        return \
-            self.detect_write_enabled_buckets(self.s3_buckets) + \
-            self.detect_publicly_accessible_s3_buckets_by_acl(self.s3_buckets) + \
-            self.detect_non_versioned_s3_buckets(self.s3_buckets) + \
-            self.detect_not_encrypted_s3_buckets(self.s3_buckets) + \
-            self.detect_full_control_allowed_s3_buckets(self.s3_buckets) + \
-            self.detect_buckets_without_mfa_delete_s3_buckets(self.s3_buckets) + \
-            self.detect_buckets_without_block_public_access_set(self.s3_buckets) + \
-            self.detect_publicly_accessible_s3_buckets_by_policy(self.s3_buckets) + \
-            self.detect_bucket_content_listable_by_users(self.s3_buckets) + \
-            self.detect_bucket_content_permissions_viewable_by_users(self.s3_buckets) + \
-            self.detect_bucket_content_permissions_modifiable_by_users(self.s3_buckets) + \
-            self.detect_bucket_content_writable_by_anonymous(self.s3_buckets) + \
-            self.detect_buckets_without_logging_set(self.s3_buckets) + \
-            self.detect_buckets_accessible_by_http_url(self.s3_buckets) + \
-            self.detect_buckets_accessible_by_https_url(self.s3_buckets)
-
-    def detect_write_enabled_buckets(self, buckets_list):
-        return self._detect_buckets_with_permissions_matching(buckets_list, "WRITE", "write_enabled_s3_buckets")
-
-    def detect_publicly_accessible_s3_buckets_by_acl(self, buckets_list):
+        return [result for batch in self.iter_tests() for result in batch]
+
+    def iter_tests(self):
+        # Every bucket configuration is fetched once and all the checks are evaluated against it in memory
+        for bucket in self._iter_bucket_snapshots(self.s3_buckets):
+            self.bucket_regions[bucket["name"]] = bucket["region"]
+            yield self.fingerprints.evaluate(bucket["name"], bucket, lambda: self._evaluate_bucket(bucket))
+        self.fingerprints.save()
+        # The anonymous access depends on more than the bucket configuration, it is always probed
+        for url_access_result in self.detect_buckets_accessible_by_url(self.s3_buckets):
+            yield url_access_result
+
+    def _evaluate_bucket(self, bucket) -> list:
+        return self.detect_write_enabled_buckets(bucket) + \
+            self.detect_publicly_accessible_s3_buckets_by_acl(bucket) + \
+            self.detect_non_versioned_s3_buckets(bucket) + \
+            self.detect_not_encrypted_s3_buckets(bucket) + \
+            self.detect_full_control_allowed_s3_buckets(bucket) + \
+            self.detect_buckets_without_mfa_delete_s3_buckets(bucket) + \
+            self.detect_buckets_without_block_public_access_set(bucket) + \
+            self.detect_publicly_accessible_s3_buckets_by_policy(bucket) + \
+            self.detect_bucket_content_listable_by_users(bucket) + \
+            self.detect_bucket_content_permissions_viewable_by_users(bucket) + \
+            self.detect_bucket_content_permissions_modifiable_by_users(bucket) + \
+            self.detect_bucket_content_writable_by_anonymous(bucket) + \
+            self.detect_buckets_without_logging_set(bucket)
+
+    def _append_s3_test_result(self, bucket_name, test_name, issue_status, **additional_data):
+        result = {
+            "user": self.user_id,
+            "account_arn": self.account_arn,
+            "account": self.account_id,
+            "timestamp": time.time(),
+            "item": bucket_name,
+            "item_type": "s3_bucket",
+            "test_name": test_name,
+        }
+        result.update(additional_data)
+        result["test_result"] = issue_status
+        return result
+
+    def _iter_bucket_snapshots(self, buckets_list):
+        bucket_names = [bucket_meta["Name"] for bucket_meta in buckets_list["Buckets"]]
+        # At most two snapshots per worker are fetched ahead of the consumer, so large accounts are streamed
+        pending = collections.deque()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for bucket_name in bucket_names:
+                if len(pending) >= self.max_workers * 2:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(self._get_bucket_snapshot, bucket_name))
+            while pending:
+                yield pending.popleft().result()
+
+    def _get_bucket_snapshot(self, bucket_name) -> dict:
+        region = self._get_bucket_region(bucket_name)
+        # Read through a client of the bucket region, the global endpoint would redirect the requests
+        s3_client = self.aws_context.client('s3', region_name=region)
+        bucket = {
+            "name": bucket_name,
+            "acl": s3_client.get_bucket_acl(Bucket=bucket_name)["Grants"],
+            # Only the settings, the response metadata changes with every request
+            "versioning": {key: value for key, value in s3_client.get_bucket_versioning(Bucket=bucket_name).items()
+                           if key in ("Status", "MFADelete")},
+            "encryption": self._get_bucket_configuration(
+                s3_client.get_bucket_encryption, bucket_name,
+                'ServerSideEncryptionConfigurationNotFoundError'),
+            "public_access_block": self._get_bucket_configuration(
+                s3_client.get_public_access_block, bucket_name, 'NoSuchPublicAccessBlockConfiguration'),
+            "policy": self._get_bucket_configuration(
+                s3_client.get_bucket_policy, bucket_name, 'NoSuchBucketPolicy'),
+            "policy_status": None,
+            "logging": s3_client.get_bucket_logging(Bucket=bucket_name).get("LoggingEnabled"),
+            "region": region
+        }
+        # A bucket without a policy has no policy status either
+        if bucket["policy"] is not None:
+            bucket["policy_status"] = self._get_bucket_configuration(
+                s3_client.get_bucket_policy_status, bucket_name, 'NoSuchBucketPolicy')
+        return bucket
+
+    def _get_bucket_region(self, bucket_name) -> str:
+        location = self.aws_s3_client.get_bucket_location(Bucket=bucket_name).get("LocationConstraint")
+        if not location:
+            return "us-east-1"
+        if location == "EU":
+            return "eu-west-1"
+        return location
+
+    def _get_bucket_configuration(self, fetch_method, bucket_name, not_found_error_code):
+        try:
+            response = fetch_method(Bucket=bucket_name)
+        except botocore.exceptions.ClientError as ex:
+            if ex.response['Error']['Code'] == not_found_error_code:
+                return None
+            raise ex
+        response.pop("ResponseMetadata", None)
+        return response
+
+    def _get_policy_statements(self, bucket):
+        if bucket["policy"] is None:
+            # No policy means the bucket content is not exposed by policy
+            return []
+        return json.loads(bucket["policy"]['Policy'])['Statement']
+
+    def detect_write_enabled_buckets(self, bucket):
+        return self._detect_buckets_with_permissions_matching(bucket, "WRITE", "write_enabled_s3_buckets")
+
+    def detect_publicly_accessible_s3_buckets_by_acl(self, bucket):
         test_name = "publicly_accessible_s3_buckets_by_acl"
         result = []
-        for bucket_meta in buckets_list["Buckets"]:
-            issue_detected = False
-            bucket_name = bucket_meta["Name"]
-            cur_bucket_permissions = self._get_bucket_acl(bucket_name)
-            for grantee in cur_bucket_permissions.grants:
-                if grantee["Grantee"]["Type"] == "Group" and (
-                        grantee["Grantee"]["URI"] == "http://acs.amazonaws.com/groups/global/AllUsers" or
-                        grantee["Grantee"]["URI"] == "http://acs.amazonaws.com/groups/global/AuthenticatedUsers"):
-                    result.append({
-                        "user": self.user_id,
-                        "account_arn": self.account_arn,
-                        "account": self.account_id,
-                        "timestamp": time.time(),
-                        "item": bucket_name,
-                        "item_type": "s3_bucket",
-                        "test_name": test_name,
-                        "permissions": cur_bucket_permissions.grants,
-                        "test_result": "issue_found"
-                    })
-                    issue_detected = True
-            if not issue_detected:
-                result.append({
-                    "user": self.user_id,
-                    "account_arn": self.account_arn,
-                    "account": self.account_id,
-                    "timestamp": time.time(),
-                    "item": bucket_name,
-                    "item_type": "s3_bucket",
-                    "test_name": test_name,
-                    "test_result": "no_issue_found"})
-
+        for grantee in bucket["acl"]:
+            if grantee["Grantee"]["Type"] == "Group" and (
+                    grantee["Grantee"]["URI"] == "http://acs.amazonaws.com/groups/global/AllUsers" or
+                    grantee["Grantee"]["URI"] == "http://acs.amazonaws.com/groups/global/AuthenticatedUsers"):
+                result.append(self._append_s3_test_result(bucket["name"], test_name, "issue_found",
+                                                          permissions=bucket["acl"]))
+        if not result:
+            result.append(self._append_s3_test_result(bucket["name"], test_name, "no_issue_found"))
         return result
 
-    def detect_non_versioned_s3_buckets(self, buckets_list):
+    def detect_non_versioned_s3_buckets(self, bucket):
         test_name = "non_versioned_s3_buckets"
-        result = []
-        for bucket_meta in buckets_list["Buckets"]:
-            bucket_name = bucket_meta["Name"]
-            cur_bucket_versioning = self._get_bucket_versioning(bucket_name)
-            if not cur_bucket_versioning.status:
-                result.append({
-                    "user": self.user_id,
-                    "account_arn": self.account_arn,
-                    "account": self.account_id,
-                    "timestamp": time.time(),
-                    "item": bucket_name,
-                    "item_type": "s3_bucket",
-                    "test_name": test_name,
-                    "test_result": "issue_found"
-                })
-            else:
-                result.append({
-                    "user": self.user_id,
-                    "account_arn": self.account_arn,
-                    "account": self.account_id,
-                    "timestamp": time.time(),
-                    "item": bucket_name,
-                    "item_type": "s3_bucket",
-                    "test_name": test_name,
-                    "test_result": "no_issue_found"})
+        if not bucket["versioning"].get("Status"):
+            return [self._append_s3_test_result(bucket["name"], test_name, "issue_found")]
+        return [self._append_s3_test_result(bucket["name"], test_name, "no_issue_found")]
 
-        return result
-
-    def detect_not_encrypted_s3_buckets(self, buckets_list):
+    def detect_not_encrypted_s3_buckets(self, bucket):
         test_name = "not_encrypted_s3_buckets"
-        result = []
-        for bucket_meta in buckets_list["Buckets"]:
-            issue_detected = False
-            bucket_name = bucket_meta["Name"]
-            try:
-                self.aws_s3_client.get_bucket_encryption(Bucket=bucket_name)
-            except botocore.exceptions.ClientError as ex:
-                if ex.response['Error']['Code'] == 'ServerSideEncryptionConfigurationNotFoundError':
-                    result.append({
-                        "user": self.user_id,
-                        "account_arn": self.account_arn,
-                        "account": self.account_id,
-                        "timestamp": time.time(),
-                        "item": bucket_name,
-                        "item_type": "s3_bucket",
-                        "test_name": test_name,
-                        "test_result": "issue_found"
-                    })
-                    issue_detected = True
-                else:
-                    raise ex
-
-            if not issue_detected:
-                result.append({
-                    "user": self.user_id,
-                    "account_arn": self.account_arn,
-                    "account": self.account_id,
-                    "timestamp": time.time(),
-                    "item": bucket_name,
-                    "item_type": "s3_bucket",
-                    "test_name": test_name,
-                    "test_result": "no_issue_found"})
+        if bucket["encryption"] is None:
+            return [self._append_s3_test_result(bucket["name"], test_name, "issue_found")]
+        return [self._append_s3_test_result(bucket["name"], test_name, "no_issue_found")]
 
-        return result
-
-    def detect_full_control_allowed_s3_buckets(self, buckets_list):
-        return self._detect_buckets_with_permissions_matching(buckets_list, "FULL_CONTROL", "full_control_allowed_s3_buckets")
+    def detect_full_control_allowed_s3_buckets(self, bucket):
+        return self._detect_buckets_with_permissions_matching(bucket, "FULL_CONTROL", "full_control_allowed_s3_buckets")
 
-    def detect_buckets_without_mfa_delete_s3_buckets(self, buckets_list):
+    def detect_buckets_without_mfa_delete_s3_buckets(self, bucket):
         test_name = "no_delete_mfa_s3_buckets"
-        result = []
-        for bucket_meta in buckets_list["Buckets"]:
-            bucket_name = bucket_meta["Name"]
-            cur_bucket_versioning = self._get_bucket_versioning(bucket_name)
-            if not cur_bucket_versioning.mfa_delete:
-                result.append({
-                    "user": self.user_id,
-                    "account_arn": self.account_arn,
-                    "account": self.account_id,
-                    "timestamp": time.time(),
-                    "item": bucket_name,
-                    "item_type": "s3_bucket",
-                    "test_name": test_name,
-                    "test_result": "issue_found"
-                })
-            else:
-                result.append({
-                    "user": self.user_id,
-                    "account_arn": self.account_arn,
-                    "account": self.account_id,
-                    "timestamp": time.time(),
-                    "item": bucket_name,
-                    "item_type": "s3_bucket",
-                    "test_name": test_name,
-                    "test_result": "no_issue_found"})
-
-        return result
+        if not bucket["versioning"].get("MFADelete"):
+            return [self._append_s3_test_result(bucket["name"], test_name, "issue_found")]
+        return [self._append_s3_test_result(bucket["name"], test_name, "no_issue_found")]
 
-    def detect_buckets_without_block_public_access_set(self, buckets_list):
+    def detect_buckets_without_block_public_access_set(self, bucket):
         test_name = "no_block_public_access_set"
-        result = []
-        for bucket_meta in buckets_list["Buckets"]:
-            issue_detected = False
-            bucket_name = bucket_meta["Name"]
-            try:
-                public_access_block_kill_switch = self.aws_s3_client.get_public_access_block(Bucket=bucket_name)
-                if not public_access_block_kill_switch["PublicAccessBlockConfiguration"]["BlockPublicAcls"] or \
-                    not public_access_block_kill_switch["PublicAccessBlockConfiguration"]["IgnorePublicAcls"] or \
-                    not public_access_block_kill_switch["PublicAccessBlockConfiguration"]["BlockPublicPolicy"] or \
-                    not public_access_block_kill_switch["PublicAccessBlockConfiguration"]["RestrictPublicBuckets"]:
-                    result.append({
-                        "user": self.user_id,
-                        "account_arn": self.account_arn,
-                        "account": self.account_id,
-                        "timestamp": time.time(),
-                        "item": bucket_name,
-                        "item_type": "s3_bucket",
-                        "test_name": test_name,
-                        "public_access_block": public_access_block_kill_switch["PublicAccessBlockConfiguration"],
-                        "test_result": "issue_found"
-                    })
-                    issue_detected = True
-            except botocore.exceptions.ClientError as ex:
-                if ex.response['Error']['Code'] == 'NoSuchPublicAccessBlockConfiguration':
-                    result.append({
-                        "user": self.user_id,
-                        "account_arn": self.account_arn,
-                        "account": self.account_id,
-                        "timestamp": time.time(),
-                        "item": bucket_name,
-                        "item_type": "s3_bucket",
-                        "test_name": test_name,
-                        "public_access_block": {},
-                        "test_result": "issue_found"
-                    })
-                    issue_detected = True
-                else:
-                    raise ex
-
-            if not issue_detected:
-                result.append({
-                    "user": self.user_id,
-                    "account_arn": self.account_arn,
-                    "account": self.account_id,
-                    "timestamp": time.time(),
-                    "item": bucket_name,
-                    "item_type": "s3_bucket",
-                    "test_name": test_name,
-                    "test_result": "no_issue_found"})
-
-        return result
-
-    def detect_publicly_accessible_s3_buckets_by_policy(self, buckets_list):
+        if bucket["public_access_block"] is None:
+            return [self._append_s3_test_result(bucket["name"], test_name, "issue_found", public_access_block={})]
+        public_access_block_kill_switch = bucket["public_access_block"]["PublicAccessBlockConfiguration"]
+        if not public_access_block_kill_switch["BlockPublicAcls"] or \
+                not public_access_block_kill_switch["IgnorePublicAcls"] or \
+                not public_access_block_kill_switch["BlockPublicPolicy"] or \
+                not public_access_block_kill_switch["RestrictPublicBuckets"]:
+            return [self._append_s3_test_result(bucket["name"], test_name, "issue_found",
+                                                public_access_block=public_access_block_kill_switch)]
+        return [self._append_s3_test_result(bucket["name"], test_name, "no_issue_found")]
+
+    def detect_publicly_accessible_s3_buckets_by_policy(self, bucket):
         test_name = "publicly_accessible_s3_buckets_by_policy"
-        result = []
-        for bucket_meta in buckets_list["Buckets"]:
-            issue_detected = False
-            bucket_name = bucket_meta["Name"]
-            try:
-                bucket_policy_status = self.aws_s3_client.get_bucket_policy_status(Bucket=bucket_name)
-                if bucket_policy_status["PolicyStatus"]["IsPublic"]:
-                    bucket_policy = self._get_bucket_policy(bucket_name)["Policy"]
-                    result.append({
-                        "user": self.user_id,
-                        "account_arn": self.account_arn,
-                        "account": self.account_id,
-                        "timestamp": time.time(),
-                        "item": bucket_name,
-                        "item_type": "s3_bucket",
-                        "test_name": test_name,
-                        "policy": bucket_policy,
-                        "test_result": "issue_found"
-                    })
-                    issue_detected = True
-            except botocore.exceptions.ClientError as ex:
-                if ex.response['Error']['Code'] == 'NoSuchBucketPolicy':
-                    # No policy means the bucket is not publicly accessible by policy
-                    pass
-                else:
-                    raise ex
-
-            if not issue_detected:
-                result.append({
-                    "user": self.user_id,
-                    "account_arn": self.account_arn,
-                    "account": self.account_id,
-                    "timestamp": time.time(),
-                    "item": bucket_name,
-                    "item_type": "s3_bucket",
-                    "test_name": test_name,
-                    "test_result": "no_issue_found"})
-
-        return result
+        if bucket["policy_status"] is not None and bucket["policy_status"]["PolicyStatus"]["IsPublic"]:
+            return [self._append_s3_test_result(bucket["name"], test_name, "issue_found",
+                                                policy=bucket["policy"]["Policy"])]
+        return [self._append_s3_test_result(bucket["name"], test_name, "no_issue_found")]
 
-    def detect_bucket_content_listable_by_users(self, buckets_list):
+    def detect_bucket_content_listable_by_users(self, bucket):
         test_name = "s3_bucket_content_listable_by_users"
         result = []
-        for bucket_meta in buckets_list["Buckets"]:
-            issue_detected = False
-            bucket_name = bucket_meta["Name"]
-            try:
-                bucket_policy = self._get_bucket_policy(bucket_name)
-                policy_statements = json.loads(bucket_policy['Policy'])['Statement']
-                for statement in policy_statements:
-                    if str(statement["Resource"]).endswith('*'):
-                        result.append({
-                            "user": self.user_id,
-                            "account_arn": self.account_arn,
-                            "account": self.account_id,
-                            "timestamp": time.time(),
-                            "item": bucket_name,
-                            "item_type": "s3_bucket",
-                            "test_name": test_name,
-                            "policy": bucket_policy,
-                            "test_result": "issue_found"
-                        })
-                        issue_detected = True
-            except botocore.exceptions.ClientError as ex:
-                if ex.response['Error']['Code'] == 'NoSuchBucketPolicy':
-                    # No policy means the bucket content is not listable by policy
-                    pass
-                else:
-                    raise ex
-
-            if not issue_detected:
-                result.append({
-                    "user": self.user_id,
-                    "account_arn": self.account_arn,
-                    "account": self.account_id,
-                    "timestamp": time.time(),
-                    "item": bucket_name,
-                    "item_type": "s3_bucket",
-                    "test_name": test_name,
-                    "test_result": "no_issue_found"})
-
+        for statement in self._get_policy_statements(bucket):
+            if str(statement["Resource"]).endswith('*'):
+                result.append(self._append_s3_test_result(bucket["name"], test_name, "issue_found", policy=bucket["policy"]))
+        if not result:
+            result.append(self._append_s3_test_result(bucket["name"], test_name, "no_issue_found"))
         return result
 
-    def detect_bucket_content_permissions_viewable_by_users(self, buckets_list):
-        test_name = "s3_bucket_content_permissions_viewable_by_users"
-        result = []
-        for bucket_meta in buckets_list["Buckets"]:
-            issue_detected = False
-            bucket_name = bucket_meta["Name"]
-            try:
-                bucket_policy = self._get_bucket_policy(bucket_name)
-                policy_statements = json.loads(bucket_policy['Policy'])['Statement']
-                for statement in policy_statements:
-                    if statement["Principal"] == '*' and "s3:GetObjectAcl" in statement["Action"] and str(statement["Resource"]).endswith('*'):
-                        result.append({
-                            "user": self.user_id,
-                            "account_arn": self.account_arn,
-                            "account": self.account_id,
-                            "timestamp": time.time(),
-                            "item": bucket_name,
-                            "item_type": "s3_bucket",
-                            "test_name": test_name,
-                            "policy": bucket_policy,
-                            "test_result": "issue_found"
-                        })
-                        issue_detected = True
-            except botocore.exceptions.ClientError as ex:
-                if ex.response['Error']['Code'] == 'NoSuchBucketPolicy':
-                    # No policy means the bucket content is not listable by policy
-                    pass
-                else:
-                    raise ex
-
-            if not issue_detected:
-                result.append({
-                    "user": self.user_id,
-                    "account_arn": self.account_arn,
-                    "account": self.account_id,
-                    "timestamp": time.time(),
-                    "item": bucket_name,
-                    "item_type": "s3_bucket",
-                    "test_name": test_name,
-                    "test_result": "no_issue_found"})
+    def detect_bucket_content_permissions_viewable_by_users(self, bucket):
+        return self._detect_buckets_with_public_policy_action(bucket, "s3:GetObjectAcl",
+                                                              "s3_bucket_content_permissions_viewable_by_users")
 
-        return result
+    def detect_bucket_content_permissions_modifiable_by_users(self, bucket):
+        return self._detect_buckets_with_public_policy_action(bucket, "s3:PutObjectAcl",
+                                                              "s3_bucket_content_permissions_modifiable_by_users")
 
-    def detect_bucket_content_permissions_modifiable_by_users(self, buckets_list):
-        test_name = "s3_bucket_content_permissions_modifiable_by_users"
-        result = []
-        for bucket_meta in buckets_list["Buckets"]:
-            issue_detected = False
-            bucket_name = bucket_meta["Name"]
-            try:
-                bucket_policy = self._get_bucket_policy(bucket_name)
-                policy_statements = json.loads(bucket_policy['Policy'])['Statement']
-                for statement in policy_statements:
-                    if statement["Principal"] == '*' and "s3:PutObjectAcl" in statement["Action"] and str(statement["Resource"]).endswith('*'):
-                        result.append({
-                            "user": self.user_id,
-                            "account_arn": self.account_arn,
-                            "account": self.account_id,
-                            "timestamp": time.time(),
-                            "item": bucket_name,
-                            "item_type": "s3_bucket",
-                            "test_name": test_name,
-                            "policy": bucket_policy,
-                            "test_result": "issue_found"
-                        })
-                        issue_detected = True
-            except botocore.exceptions.ClientError as ex:
-                if ex.response['Error']['Code'] == 'NoSuchBucketPolicy':
-                    # No policy means the bucket content is not listable by policy
-                    pass
-                else:
-                    raise ex
-
-            if not issue_detected:
-                result.append({
-                    "user": self.user_id,
-                    "account_arn": self.account_arn,
-                    "account": self.account_id,
-                    "timestamp": time.time(),
-                    "item": bucket_name,
-                    "item_type": "s3_bucket",
-                    "test_name": test_name,
-                    "test_result": "no_issue_found"})
+    def detect_bucket_content_writable_by_anonymous(self, bucket):
+        return self._detect_buckets_with_public_policy_action(bucket, "s3:PutObject",
+                                                              "s3_bucket_content_writable_by_anonymous")
 
-        return result
-
-    def detect_bucket_content_writable_by_anonymous(self, buckets_list):
-        test_name = "s3_bucket_content_writable_by_anonymous"
-        result = []
-        for bucket_meta in buckets_list["Buckets"]:
-            issue_detected = False
-            bucket_name = bucket_meta["Name"]
-            try:
-                bucket_policy = self._get_bucket_policy(bucket_name)
-                policy_statements = json.loads(bucket_policy['Policy'])['Statement']
-                for statement in policy_statements:
-                    if statement["Principal"] == '*' and "s3:PutObject" in statement["Action"] and str(statement["Resource"]).endswith('*'):
-                        result.append({
-                            "user": self.user_id,
-                            "account_arn": self.account_arn,
-                            "account": self.account_id,
-                            "timestamp": time.time(),
-                            "item": bucket_name,
-                            "item_type": "s3_bucket",
-                            "test_name": test_name,
-                            "policy": bucket_policy,
-                            "test_result": "issue_found"
-                        })
-                        issue_detected = True
-            except botocore.exceptions.ClientError as ex:
-                if ex.response['Error']['Code'] == 'NoSuchBucketPolicy':
-                    # No policy means the bucket content is not listable by policy
-                    pass
-                else:
-                    raise ex
-
-            if not issue_detected:
-                result.append({
-                    "user": self.user_id,
-                    "account_arn": self.account_arn,
-                    "account": self.account_id,
-                    "timestamp": time.time(),
-                    "item": bucket_name,
-                    "item_type": "s3_bucket",
-                    "test_name": test_name,
-                    "test_result": "no_issue_found"})
-
-        return result
-
-    def detect_buckets_without_logging_set(self, buckets_list):
+    def detect_buckets_without_logging_set(self, bucket):
         test_name = "no_logging_policy_set"
-        result = []
-        for bucket_meta in buckets_list["Buckets"]:
-            issue_detected = False
-            bucket_name = bucket_meta["Name"]
-            try:
-                raw_logging_policy = self.aws_s3_resource.BucketLogging(bucket_name)
-                if not raw_logging_policy.logging_enabled:
-                    result.append({
-                        "user": self.user_id,
-                        "account_arn": self.account_arn,
-                        "account": self.account_id,
-                        "timestamp": time.time(),
-                        "item": bucket_name,
-                        "item_type": "s3_bucket",
-                        "test_name": test_name,
-                        "test_result": "issue_found"
-                    })
-                    issue_detected = True
-            except botocore.exceptions.ClientError as ex:
-                raise ex
-
-            if not issue_detected:
-                result.append({
-                    "user": self.user_id,
-                    "account_arn": self.account_arn,
-                    "account": self.account_id,
-                    "timestamp": time.time(),
-                    "item": bucket_name,
-                    "item_type": "s3_bucket",
-                    "test_name": test_name,
-                    "test_result": "no_issue_found"})
-
-        return result
-
-    def detect_buckets_accessible_by_http_url(self, buckets_list):
-        test_name = "publicly_accessible_s3_buckets_by_http_url"
-        protocol = "http"
-        result = self._test_bucket_url_access(buckets_list, protocol, test_name)
+        if not bucket["logging"]:
+            return [self._append_s3_test_result(bucket["name"], test_name, "issue_found")]
+        return [self._append_s3_test_result(bucket["name"], test_name, "no_issue_found")]
 
-        return result
-
-    def detect_buckets_accessible_by_https_url(self, buckets_list):
-        test_name = "publicly_accessible_s3_buckets_by_https_url"
-        protocol = "https"
-        result = self._test_bucket_url_access(buckets_list, protocol, test_name)
-
-        return result
+    def detect_buckets_accessible_by_url(self, buckets_list):
+        bucket_names = [bucket_meta["Name"] for bucket_meta in buckets_list["Buckets"]]
+        with ThreadPoolExecutor(max_workers=self.url_probe_workers) as executor:
+            for result in executor.map(self._test_bucket_url_access, bucket_names):
+                yield result
 
-    def _test_bucket_url_access(self, buckets_list, protocol, test_name):
+    def _test_bucket_url_access(self, bucket_name):
         result = []
-        for bucket_meta in buckets_list["Buckets"]:
-            bucket_name = bucket_meta["Name"]
-            issue_detected = False
+        if bucket_name not in self.bucket_regions:
+            self.bucket_regions[bucket_name] = self._get_bucket_region(bucket_name)
+        for protocol, test_name in _URL_ACCESS_TESTS:
+            # The regional virtual-host endpoint answers directly where the global one would redirect
+            url = protocol + "://" + urllib.parse.quote_plus(bucket_name) + ".s3." + \
+                self.bucket_regions[bucket_name] + ".amazonaws.com"
             try:
-                url = protocol + "://" + urllib.parse.quote_plus(bucket_name) + ".s3.amazonaws.com"
-                resp = requests.head(url)
-                if resp.status_code >= 200 and resp.status_code < 300:
-                    result.append({
-                        "user": self.user_id,
-                        "account_arn": self.account_arn,
-                        "account": self.account_id,
-                        "timestamp": time.time(),
-                        "item": bucket_name,
-                        "item_type": "s3_bucket",
-                        "test_name": test_name,
-                        "bucket_url": url,
-                        "test_result": "issue_found"
-                    })
-                    issue_detected = True
-            except:
+                resp = self.http_session.head(url, timeout=self.url_probe_timeout)
+            except requests.exceptions.RequestException:
                 continue
-            if not issue_detected:
-                result.append({
-                    "user": self.user_id,
-                    "account_arn": self.account_arn,
-                    "account": self.account_id,
-                    "timestamp": time.time(),
-                    "item": bucket_name,
-                    "item_type": "s3_bucket",
-                    "test_name": test_name,
-                    "test_result": "no_issue_found"})
+            if resp.status_code >= 200 and resp.status_code < 300:
+                result.append(self._append_s3_test_result(bucket_name, test_name, "issue_found", bucket_url=url))
+            else:
+                result.append(self._append_s3_test_result(bucket_name, test_name, "no_issue_found"))
         return result
 
-    def _get_bucket_policy(self, bucket_name):
-        if "bucket_policy" not in self.cache:
-            self.cache["bucket_policy"] = {}
-        if bucket_name not in self.cache["bucket_policy"]:
-            self.cache["bucket_policy"][bucket_name] = self.aws_s3_client.get_bucket_policy(Bucket=bucket_name)
-
-        return self.cache["bucket_policy"][bucket_name]
-
-    def _get_bucket_versioning(self, bucket_name):
-        if "bucket_versioning" not in self.cache:
-            self.cache["bucket_versioning"] = {}
-        if bucket_name not in self.cache["bucket_versioning"]:
-            self.cache["bucket_versioning"][bucket_name] = self.aws_s3_resource.BucketVersioning(bucket_name)
-        return self.cache["bucket_versioning"][bucket_name]
-
-    def _get_bucket_acl(self, bucket_name):
-        if "bucket_acl" not in self.cache:
-            self.cache["bucket_acl"] = {}
-        if bucket_name not in self.cache["bucket_acl"]:
-            self.cache["bucket_acl"][bucket_name] = self.aws_s3_resource.BucketAcl(bucket_name)
-        return self.cache["bucket_acl"][bucket_name]
-
-    def _detect_buckets_with_permissions_matching(self, buckets_list, permission_to_check, test_name):
+    def _detect_buckets_with_public_policy_action(self, bucket, action, test_name):
         result = []
-        write_enabled_buckets = []
-        for bucket_meta in buckets_list["Buckets"]:
-            bucket_name = bucket_meta["Name"]
-            cur_bucket_permissions = self._get_bucket_acl(bucket_name)
-            issue_detected = False
-            for grantee in cur_bucket_permissions.grants:
-                if grantee["Permission"] == permission_to_check:
-                    if bucket_name not in write_enabled_buckets:
-                        write_enabled_buckets.append(bucket_name)
-                        result.append({
-                            "user": self.user_id,
-                            "account_arn": self.account_arn,
-                            "account": self.account_id,
-                            "timestamp": time.time(),
-                            "item": bucket_name,
-                            "item_type": "s3_bucket",
-                            "test_name": test_name,
-                            "permissions": cur_bucket_permissions.grants,
-                            "test_result": "issue_found"
-                        })
-                        issue_detected = True
-            if not issue_detected:
-                result.append({
-                    "user": self.user_id,
-                    "account_arn": self.account_arn,
-                    "account": self.account_id,
-                    "timestamp": time.time(),
-                    "item": bucket_name,
-                    "item_type": "s3_bucket",
-                    "test_name": test_name,
-                    "test_result": "no_issue_found"
-                })
+        for statement in self._get_policy_statements(bucket):
+            if statement.get("Principal") == '*' and action in statement.get("Action", []) and \
+                    str(statement.get("Resource")).endswith('*'):
+                result.append(self._append_s3_test_result(bucket["name"], test_name, "issue_found", policy=bucket["policy"]))
+        if not result:
+            result.append(self._append_s3_test_result(bucket["name"], test_name, "no_issue_found"))
         return result
+
+    def _detect_buckets_with_permissions_matching(self, bucket, permission_to_check, test_name):
+        for grantee in bucket["acl"]:
+            if grantee["Permission"] == permission_to_check:
+                return [self._append_s3_test_result(bucket["name"], test_name, "issue_found", permissions=bucket["acl"])]
+        return [self._append_s3_test_result(bucket["name"], test_name, "no_issue_found")]
@@ -1,5 +1,7 @@
+import os
 import time
-import boto3
+from concurrent.futures import ThreadPoolExecutor
+import incremental
 import interfaces
 import json
 
@@ -8,9 +10,14 @@ def _format_string_to_json(text):
     return json.loads(text)
 
 
+# Counters that change without any change to the topic configuration
+_VOLATILE_TOPIC_ATTRIBUTES = ('SubscriptionsConfirmed', 'SubscriptionsPending', 'SubscriptionsDeleted')
+
+
 def _check_sns_restriction_enabled(access_policy, is_topic):
-    access_policy = _format_string_to_json(access_policy)
     restricted = True
+    if access_policy is None:
+        return restricted
     if is_topic:
         action_value = "SNS:Publish"
     else:
@@ -28,12 +35,15 @@ def _check_sns_restriction_enabled(access_policy, is_topic):
 
 
 class Tester(interfaces.TesterInterface):
-    def __init__(self):
-        self.aws_sns_client = boto3.client('sns')
+    def __init__(self, aws_context):
+        self.aws_context = aws_context
+        self.aws_sns_client = aws_context.client('sns')
         self.cache = {}
-        self.user_id = boto3.client('sts').get_caller_identity().get('UserId')
-        self.account_arn = boto3.client('sts').get_caller_identity().get('Arn')
-        self.account_id = boto3.client('sts').get_caller_identity().get('Account')
+        self.user_id = aws_context.user_id
+        self.account_arn = aws_context.account_arn
+        self.account_id = aws_context.account_id
+        self.max_workers = int(os.environ.get('AUTOPOSTURE_SNS_MAX_WORKERS', '8'))
+        self.fingerprints = incremental.ResourceFingerprints(aws_context, 'sns')
 
     def declare_tested_service(self) -> str:
         return 'sns'
@@ -42,9 +52,21 @@ class Tester(interfaces.TesterInterface):
         return 'aws'
 
     def run_tests(self) -> list:
-        return self.detect_sns_has_restrictions_set_for_publishing() + \
-               self.detect_sns_has_restrictions_set_for_subscription() + \
-               self.detect_sns_topic_has_encryption_enabled()
+        return [result for batch in self.iter_tests() for result in batch]
+
+    def iter_tests(self):
+        # Topics are evaluated one at a time, so the results of an unchanged topic can be reused
+        for topic in self._get_all_topics():
+            attributes = topic[0]
+            configuration = {key: value for key, value in attributes.items() if key not in _VOLATILE_TOPIC_ATTRIBUTES}
+            yield self.fingerprints.evaluate(attributes['TopicArn'], configuration,
+                                             lambda: self._evaluate_topics([topic]))
+        self.fingerprints.save()
+
+    def _evaluate_topics(self, topics) -> list:
+        return self.detect_sns_has_restrictions_set_for_publishing(topics) + \
+            self.detect_sns_has_restrictions_set_for_subscription(topics) + \
+            self.detect_sns_topic_has_encryption_enabled(topics)
 
     def _append_sns_test_result(self, sns_detail, is_topic, test_name, issue_status):
         return {
@@ -59,16 +81,32 @@ class Tester(interfaces.TesterInterface):
         }
 
     def _return_all_the_topic_arns(self):
-        response = self.aws_sns_client.list_topics()
         topic_arns = []
-        topic_arns.extend(response['Topics'])
-        # The API returns max of 100 topic arns in one call \
-        # and need to paginate it using the next token sent.
-        while len(response['Topics']) >= 100:
-            response = self.aws_sns_client.list_topics(NextToken=response['NextToken'])
-            topic_arns.extend(response['Topics'])
+        for page in self.aws_sns_client.get_paginator('list_topics').paginate():
+            topic_arns.extend(page['Topics'])
         return topic_arns
 
+    def _get_topic_attributes(self, topic_arn):
+        response = self.aws_sns_client.get_topic_attributes(TopicArn=topic_arn)
+        if 'Attributes' in response and response['Attributes']:
+            return response['Attributes']
+        return None
+
+    def _get_all_topics(self):
+        # Topics and their attributes are fetched once for all the checks, the access policy is parsed once per topic
+        if 'topics' not in self.cache:
+            topic_arns = [topic['TopicArn'] for topic in self._return_all_the_topic_arns()]
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                all_attributes = list(executor.map(self._get_topic_attributes, topic_arns))
+            topics = []
+            for attributes in all_attributes:
+                if attributes is None:
+                    continue
+                access_policy = _format_string_to_json(attributes['Policy']) if attributes.get('Policy') else None
+                topics.append((attributes, access_policy))
+            self.cache['topics'] = topics
+        return self.cache['topics']
+
     def _return_all_the_subscription_arns(self):
         response = self.aws_sns_client.list_subscriptions()
         sub_arns = []
@@ -80,43 +118,27 @@ class Tester(interfaces.TesterInterface):
             sub_arns.extend(response['Subscriptions'])
         return sub_arns
 
-    def _restriction_check_on_topics(self, is_topic, test_name):
+    def _restriction_check_on_topics(self, is_topic, test_name, topics=None):
         result = []
-        topic_arns = self._return_all_the_topic_arns()
-        for topic in topic_arns:
-            response = self.aws_sns_client.get_topic_attributes(
-                TopicArn=topic['TopicArn']
-            )
-            if 'Attributes' in response and response['Attributes']:
-                response = response['Attributes']
-            else:
-                continue
-            if not _check_sns_restriction_enabled(response['Policy'], is_topic):
+        for response, access_policy in self._get_all_topics() if topics is None else topics:
+            if not _check_sns_restriction_enabled(access_policy, is_topic):
                 result.append(self._append_sns_test_result(response['DisplayName'], True, test_name, "issue_found"))
             else:
                 result.append(self._append_sns_test_result(response['DisplayName'], True, test_name, "no_issue_found"))
         return result
 
-    def detect_sns_has_restrictions_set_for_publishing(self):
+    def detect_sns_has_restrictions_set_for_publishing(self, topics=None):
         test_name = "sns_has_restrictions_set_for_publishing"
-        return self._restriction_check_on_topics(True, test_name)
+        return self._restriction_check_on_topics(True, test_name, topics)
 
-    def detect_sns_has_restrictions_set_for_subscription(self):
+    def detect_sns_has_restrictions_set_for_subscription(self, topics=None):
         test_name = "sns_has_restrictions_set_for_subscription"
-        return self._restriction_check_on_topics(False, test_name)
+        return self._restriction_check_on_topics(False, test_name, topics)
 
-    def detect_sns_topic_has_encryption_enabled(self):
+    def detect_sns_topic_has_encryption_enabled(self, topics=None):
         test_name = "sns_topic_has_encryption_enabled"
         result = []
-        topic_arns = self._return_all_the_topic_arns()
-        for topic in topic_arns:
-            response = self.aws_sns_client.get_topic_attributes(
-                TopicArn=topic['TopicArn']
-            )
-            if 'Attributes' in response and response['Attributes']:
-                response = response['Attributes']
-            else:
-                continue
+        for response, _ in self._get_all_topics() if topics is None else topics:
             if 'KmsMasterKeyId' in response and not response['KmsMasterKeyId']:
                 result.append(self._append_sns_test_result(response['DisplayName'], True, test_name, "issue_found"))
             elif 'KmsMasterKeyId' not in response:
@@ -1,20 +1,30 @@
+import os
 import time
-import boto3
+from concurrent.futures import ThreadPoolExecutor
+import incremental
 import interfaces
 import json
 
 
+# Counters that change without any change to the queue configuration
+_VOLATILE_QUEUE_ATTRIBUTES = ('ApproximateNumberOfMessages', 'ApproximateNumberOfMessagesNotVisible',
+                              'ApproximateNumberOfMessagesDelayed')
+
+
 def _format_string_to_json(text):
     return json.loads(text)
 
 
 class Tester(interfaces.TesterInterface):
-    def __init__(self):
-        self.aws_sqs_client = boto3.client('sqs')
+    def __init__(self, aws_context):
+        self.aws_context = aws_context
+        self.aws_sqs_client = aws_context.client('sqs')
         self.cache = {}
-        self.user_id = boto3.client('sts').get_caller_identity().get('UserId')
-        self.account_arn = boto3.client('sts').get_caller_identity().get('Arn')
-        self.account_id = boto3.client('sts').get_caller_identity().get('Account')
+        self.user_id = aws_context.user_id
+        self.account_arn = aws_context.account_arn
+        self.account_id = aws_context.account_id
+        self.max_workers = int(os.environ.get('AUTOPOSTURE_SQS_MAX_WORKERS', '8'))
+        self.fingerprints = incremental.ResourceFingerprints(aws_context, 'sqs')
 
     def declare_tested_service(self) -> str:
         return 'sqs'
@@ -23,7 +33,18 @@ class Tester(interfaces.TesterInterface):
         return 'aws'
 
     def run_tests(self) -> list:
-        return self.detect_sqs_server_side_encryption() + self.detect_sqs_public_accessible_queues()
+        return [result for batch in self.iter_tests() for result in batch]
+
+    def iter_tests(self):
+        # Queues are evaluated one at a time, so the results of an unchanged queue can be reused
+        for queue_url, attributes in self._return_all_queues_with_dead_letter_sources():
+            configuration = {key: value for key, value in attributes.items() if key not in _VOLATILE_QUEUE_ATTRIBUTES}
+            yield self.fingerprints.evaluate(queue_url, configuration,
+                                             lambda: self._evaluate_queues([(queue_url, attributes)]))
+        self.fingerprints.save()
+
+    def _evaluate_queues(self, queues) -> list:
+        return self._get_sse_enabled_and_disabled_queue(queues) + self._get_policy_for_queues(queues)
 
     def _append_sqs_test_result(self, sqs_url, test_name, issue_status) -> dict:
         return {
@@ -38,58 +59,66 @@ class Tester(interfaces.TesterInterface):
         }
 
     def _return_all_the_sqs(self):
-        response = self.aws_sqs_client.list_queues(MaxResults=100)
         sqs_urls = []
-        if 'QueueUrls' not in response:
-            return []
-        sqs_urls.extend(response['QueueUrls'])
-        # The API returns max of 100 topic arns in one call \
-        # and need to paginate it using the next token sent.
-        while 'NextToken' in response and response['NextToken']:
-            response = self.aws_sqs_client.list_queues(NextToken=response['NextToken'])
-            sqs_urls.extend(response['QueueUrls'])
-        return sqs_urls
-
-    def _return_all_dead_letter_sqs(self, queue_url):
+        for page in self.aws_sqs_client.get_paginator('list_queues').paginate(PaginationConfig={'PageSize': 1000}):
+            sqs_urls.extend(page.get('QueueUrls', []))
+        return list(dict.fromkeys(sqs_urls))
+
+    def _get_queue_attributes(self, queue_url):
         try:
-            response = self.aws_sqs_client.client.list_dead_letter_source_queues(QueueUrl=queue_url, MaxResults=100)
-            sqs_dead_letter_urls = []
-            if 'queueUrls' not in response:
-                return []
-            sqs_dead_letter_urls.extend(response['queueUrls'])
-            # The API returns max of 100 topic arns in one call \
-            # and need to paginate it using the next token sent.
-            while 'NextToken' in response and response['NextToken']:
-                response = self.aws_sqs_client.list_queues(NextToken=response['NextToken'])
-                sqs_dead_letter_urls.extend(response['QueueUrls'])
-            return sqs_dead_letter_urls
-        except:
-            return []
-
-    def _find_sse_for_all_queues(self, queue_url, test_name):
+            response = self.aws_sqs_client.get_queue_attributes(QueueUrl=queue_url, AttributeNames=['All'])
+            return response.get('Attributes', {})
+        except self.aws_sqs_client.exceptions.QueueDoesNotExist:
+            # The queue was deleted after it was listed
+            return None
+
+    def _get_all_queues(self) -> dict:
+        # Every queue is described once with all of its attributes and shared by all the checks
+        if 'queues' not in self.cache:
+            queue_urls = self._return_all_the_sqs()
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                all_attributes = list(executor.map(self._get_queue_attributes, queue_urls))
+            queues = {}
+            for queue_url, attributes in zip(queue_urls, all_attributes):
+                if attributes is not None:
+                    queues[queue_url] = attributes
+            self.cache['queues'] = queues
+            self.cache['dead_letter_sources'] = self._get_dead_letter_sources(queues)
+        return self.cache['queues']
+
+    def _get_dead_letter_sources(self, queues) -> dict:
+        # Dead-letter queue arn -> urls of the source queues whose RedrivePolicy targets it
+        dead_letter_sources = {}
+        for queue_url, attributes in queues.items():
+            if attributes.get('RedrivePolicy'):
+                redrive_policy = _format_string_to_json(attributes['RedrivePolicy'])
+                dead_letter_sources.setdefault(redrive_policy.get('deadLetterTargetArn'), []).append(queue_url)
+        return dead_letter_sources
+
+    def _return_all_queues_with_dead_letter_sources(self):
+        # Each queue is followed by its dead-letter sources, a queue reached through several edges is evaluated once
+        queues = self._get_all_queues()
+        dead_letter_sources = self.cache['dead_letter_sources']
+        evaluated = set()
+        for queue_url, attributes in queues.items():
+            for url in [queue_url] + dead_letter_sources.get(attributes.get('QueueArn'), []):
+                if url not in evaluated:
+                    evaluated.add(url)
+                    yield url, queues[url]
+
+    def _find_sse_for_all_queues(self, queue_url, attributes, test_name):
         result = []
-        get_queue_attributes_result = self.aws_sqs_client.get_queue_attributes(
-            QueueUrl=queue_url,
-            AttributeNames=['SqsManagedSseEnabled', 'KmsMasterKeyId'])
-        if 'Attributes' in get_queue_attributes_result and ('SqsManagedSseEnabled' in \
-                                                            get_queue_attributes_result['Attributes'] and
-                                                            get_queue_attributes_result['Attributes'][
-                                                                'SqsManagedSseEnabled'] == 'true') or (
-                'KmsMasterKeyId' in get_queue_attributes_result['Attributes'] and
-                get_queue_attributes_result['Attributes'][
-                    'KmsMasterKeyId']):
+        if attributes.get('SqsManagedSseEnabled') == 'true' or attributes.get('KmsMasterKeyId'):
             result.append(self._append_sqs_test_result(queue_url, test_name, "no_issue_found"))
         else:
             result.append(self._append_sqs_test_result(queue_url, test_name, "issue_found"))
         return result
 
-    def _get_all_public_accessibility_for_all_queues(self, queue_url, test_name):
+    def _get_all_public_accessibility_for_all_queues(self, queue_url, attributes, test_name):
         result = []
-        get_attribute_result = self.aws_sqs_client.get_queue_attributes(
-            QueueUrl=queue_url,
-            AttributeNames=['Policy'])
-        policy_dict = _format_string_to_json(get_attribute_result['Attributes']['Policy'])
         restricted = True
+        # A queue without an access policy is only reachable by its owner
+        policy_dict = _format_string_to_json(attributes['Policy']) if attributes.get('Policy') else {'Statement': []}
         for policy_statement_dict in policy_dict['Statement']:
             if policy_statement_dict['Effect'] == 'Allow':
                 if 'Principal' in policy_statement_dict and 'AWS' in policy_statement_dict['Principal'] and \
@@ -105,27 +134,22 @@ class Tester(interfaces.TesterInterface):
             result.append(self._append_sqs_test_result(queue_url, test_name, "issue_found"))
         return result
 
-    def _get_sse_enabled_and_disabled_queue(self, queue_result_dict) -> list:
+    def _get_sse_enabled_and_disabled_queue(self, queues) -> list:
         result = []
         test_name = "sqs_has_server_side_encryption"
-        for queue_url in queue_result_dict:
-            result.extend(self._find_sse_for_all_queues(queue_url, test_name))
-            for dl_queue_url in self._return_all_dead_letter_sqs(queue_url):
-                result.extend(self._find_sse_for_all_queues(dl_queue_url, test_name))
+        for queue_url, attributes in queues:
+            result.extend(self._find_sse_for_all_queues(queue_url, attributes, test_name))
         return result
 
-    def _get_policy_for_queues(self, queue_result_dict) -> list:
+    def _get_policy_for_queues(self, queues) -> list:
         result = []
         test_name = "sqs_public_accessibility"
-        for queue_url in queue_result_dict:
-            result.extend(self._get_all_public_accessibility_for_all_queues(queue_url, test_name))
-            for dl_queue_url in self._return_all_dead_letter_sqs(queue_url):
-                result.extend(self._get_all_public_accessibility_for_all_queues(dl_queue_url, test_name))
+        for queue_url, attributes in queues:
+            result.extend(self._get_all_public_accessibility_for_all_queues(queue_url, attributes, test_name))
         return result
 
     def detect_sqs_server_side_encryption(self) -> list:
-        return self._get_sse_enabled_and_disabled_queue(self._return_all_the_sqs())
+        return self._get_sse_enabled_and_disabled_queue(self._return_all_queues_with_dead_letter_sources())
 
     def detect_sqs_public_accessible_queues(self) -> list:
-        return self._get_policy_for_queues(self._return_all_the_sqs())
-
+        return self._get_policy_for_queues(self._return_all_queues_with_dead_letter_sources())
@@ -0,0 +1,110 @@
+import concurrent.futures
+import datetime
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auto_posture_evaluator
+import execution_plan
+import interfaces
+import state_store
+
+
+class _BatchTester(interfaces.TesterInterface):
+    def __init__(self, batches):
+        self.batches = batches
+
+    def declare_tested_service(self) -> str:
+        return "fake"
+
+    def declare_tested_provider(self) -> str:
+        return "aws"
+
+    def iter_tests(self):
+        for batch in self.batches:
+            yield [{"timestamp": time.time(), "item": item, "item_type": "fake", "test_name": "check",
+                    "test_result": "issue_found"} for item in batch]
+
+
+class CheckpointTest(unittest.TestCase):
+    def _new_evaluator(self):
+        # Only what the checkpoint handling reads, without a channel or an AWS session
+        evaluator = auto_posture_evaluator.AutoPostureEvaluator.__new__(auto_posture_evaluator.AutoPostureEvaluator)
+        evaluator.deadline = None
+        evaluator.state_store = state_store.LocalFileStateStore(tempfile.mkdtemp())
+        evaluator.checkpoint = auto_posture_evaluator._Checkpoint()
+        evaluator.checkpoint_key = execution_plan.get_checkpoint_key("execution")
+        evaluator.checkpoint_saved_at = None
+        evaluator.checkpoint_interval_seconds = 0
+        evaluator.checkpoint_save_lock = threading.Lock()
+        return evaluator
+
+    def test_checkpoint_survives_the_state_store(self):
+        checkpoint = auto_posture_evaluator._Checkpoint()
+        checkpoint.completed.add("a")
+        checkpoint.failed.add("b")
+        shipped_results = execution_plan.ShippedResults()
+        shipped_results.add("i0", "check")
+        checkpoint.cursors["c"] = shipped_results.counts
+        store = state_store.LocalFileStateStore(tempfile.mkdtemp())
+        key = execution_plan.get_checkpoint_key("execution")
+
+        store.put(key, checkpoint.to_state())
+        resumed = auto_posture_evaluator._Checkpoint(store.get(key))
+
+        self.assertEqual(resumed.to_state(), checkpoint.to_state())
+
+    def test_resumed_tester_skips_the_results_already_shipped(self):
+        evaluator = self._new_evaluator()
+        shipped_results = execution_plan.ShippedResults()
+        for item in ("i0", "i1", "i3"):
+            shipped_results.add(item, "check")
+        # The resumed tester lists the same resources in another order
+        tester = _BatchTester([["i4", "i3"], ["i2", "i1", "i0"]])
+
+        test_results = evaluator._iter_test_results(tester, "execution", datetime.datetime.now(),
+                                                    auto_posture_evaluator._TesterResults(),
+                                                    shipped_results=execution_plan.ShippedResults(
+                                                        shipped_results.counts))
+
+        self.assertEqual([test_result.item for test_result in test_results], ["i4", "i2"])
+
+
+    def test_deadline_stops_the_tester_between_batches(self):
+        evaluator = self._new_evaluator()
+        evaluator.deadline = time.monotonic()
+        tester_results = auto_posture_evaluator._TesterResults()
+        tester = _BatchTester([["i0", "i1"], ["i2"]])
+
+        test_results = evaluator._iter_test_results(tester, "execution", datetime.datetime.now(), tester_results)
+
+        self.assertEqual([test_result.item for test_result in test_results], ["i0", "i1"])
+        self.assertTrue(tester_results.interrupted)
+
+    def test_only_the_chunks_sent_move_the_saved_cursor(self):
+        evaluator = self._new_evaluator()
+        sent_chunks = []
+        for result_keys, posted in ([("i0", "check")], True), ([("i1", "check")], False), ([("i2", "check")], None):
+            sent = concurrent.futures.Future()
+            if posted is not None:
+                sent.set_result(posted)
+            sent_chunks.append((result_keys, sent))
+        sent_results = execution_plan.ShippedResults()
+
+        delivered = evaluator._acknowledge_chunks("job", sent_chunks, sent_results)
+
+        self.assertFalse(delivered)
+        self.assertEqual([result_keys for result_keys, _ in sent_chunks], [[("i2", "check")]])
+        # Saved right away, an invocation killed by its hard timeout resumes from there
+        resumed = execution_plan.ShippedResults(
+            evaluator.state_store.get(evaluator.checkpoint_key)["cursors"]["job"])
+        self.assertEqual([resumed.is_shipped(item, "check") for item in ("i0", "i1", "i2")], [True, False, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import execution_plan
+
+
+class ShippedResultsTest(unittest.TestCase):
+    def _ship(self, results, shipped_results, limit=None):
+        shipped = []
+        for item, test_name in results:
+            if shipped_results.is_shipped(item, test_name):
+                continue
+            if limit is not None and len(shipped) == limit:
+                break
+            shipped_results.add(item, test_name)
+            shipped.append((item, test_name))
+        return shipped
+
+    def test_resume_in_another_order_ships_every_result_once(self):
+        # Like the security groups of an instance, which come out of a set in a different order every run
+        results = [("sg-" + str(group), test_name) for group in range(20)
+                   for test_name in ("ingress_open", "egress_open")]
+        results.append(("sg-0", "ingress_open"))
+        first_run = list(results)
+        random.Random(1).shuffle(first_run)
+        shipped = self._ship(first_run, execution_plan.ShippedResults(), limit=15)
+        # The cursor goes through the JSON checkpoint between the invocations
+        cursor = execution_plan.ShippedResults()
+        for item, test_name in shipped:
+            cursor.add(item, test_name)
+
+        second_run = list(results)
+        random.Random(2).shuffle(second_run)
+        shipped += self._ship(second_run, execution_plan.ShippedResults(cursor.counts))
+
+        self.assertEqual(sorted(shipped), sorted(results))
+
+    def test_results_gone_since_the_interruption_are_not_shipped(self):
+        shipped_results = execution_plan.ShippedResults()
+        shipped_results.add("bucket-a", "versioning")
+        shipped_results.add("bucket-b", "versioning")
+
+        resumed = execution_plan.ShippedResults(shipped_results.counts)
+        shipped = self._ship([("bucket-b", "versioning"), ("bucket-c", "versioning")], resumed)
+
+        self.assertEqual(shipped, [("bucket-c", "versioning")])
+        self.assertEqual(resumed.total(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
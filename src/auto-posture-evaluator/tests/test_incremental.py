@@ -0,0 +1,76 @@
+import os
+import sys
+import types
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import incremental
+
+
+class _MemoryStateStore:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def put(self, key, value):
+        self.values[key] = value
+
+
+class ResourceFingerprintsTest(unittest.TestCase):
+    def setUp(self):
+        self.aws_context = types.SimpleNamespace(state_store=_MemoryStateStore(), account_id="111",
+                                                 region_name="eu-west-1", shard_index=0, shard_count=1)
+        self.evaluated = []
+
+    def _scan(self, mode, configurations):
+        with mock.patch.dict(os.environ, {"AUTOPOSTURE_INCREMENTAL": mode}):
+            self.fingerprints = incremental.ResourceFingerprints(self.aws_context, "queues")
+        results = []
+        for name, configuration in configurations.items():
+            results += self.fingerprints.evaluate(name, configuration, lambda name=name: self._evaluate(name))
+        self.fingerprints.save()
+        return results
+
+    def _evaluate(self, name):
+        self.evaluated.append(name)
+        return [{"item": name, "test_name": "encrypted", "timestamp": 1600000000.0}]
+
+    def test_unchanged_resources_are_not_evaluated_again(self):
+        self._scan("reemit", {"a": {"KmsKeyId": "k"}, "b": {"KmsKeyId": None}})
+        self.evaluated.clear()
+
+        results = self._scan("reemit", {"b": {"KmsKeyId": None}, "a": {"KmsKeyId": "k2"}})
+
+        self.assertEqual(self.evaluated, ["a"])
+        self.assertEqual(sorted(result["item"] for result in results), ["a", "b"])
+        self.assertGreater(results[0]["timestamp"], 1600000000.0)
+
+    def test_skip_sends_nothing_for_unchanged_resources(self):
+        self._scan("skip", {"a": {"KmsKeyId": "k"}})
+
+        self.assertEqual(self._scan("skip", {"a": {"KmsKeyId": "k"}, "b": {}}), self._evaluate("b"))
+        self.assertEqual(self.fingerprints.skipped, 1)
+
+    def test_deleted_resources_drop_out_of_the_fingerprints(self):
+        self._scan("skip", {"a": {}, "b": {}})
+        self._scan("skip", {"a": {}})
+        self.evaluated.clear()
+
+        self._scan("skip", {"a": {}, "b": {}})
+
+        self.assertEqual(self.evaluated, ["b"])
+
+    def test_off_evaluates_everything(self):
+        self._scan("off", {"a": {}})
+        self._scan("off", {"a": {}})
+
+        self.assertEqual(self.evaluated, ["a", "a"])
+        self.assertEqual(self.aws_context.state_store.values, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
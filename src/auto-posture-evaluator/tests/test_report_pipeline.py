@@ -0,0 +1,37 @@
+import asyncio
+import concurrent.futures
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auto_posture_evaluator
+
+
+class ReportPipelineTest(unittest.TestCase):
+    def test_reports_are_given_up_once_the_sender_has_failed(self):
+        evaluator = auto_posture_evaluator.AutoPostureEvaluator.__new__(auto_posture_evaluator.AutoPostureEvaluator)
+        evaluator.max_inflight_reports = 2
+
+        def broken_send_report(job_name, chunk_index, report, sent):
+            raise RuntimeError("broken sender")
+        evaluator._send_report = broken_send_report
+        sent_reports = [concurrent.futures.Future() for _ in range(3)]
+
+        async def run():
+            # Smaller than the reports queued, a worker would block on the queue if nothing emptied it
+            reports = asyncio.Queue(maxsize=1)
+            sender = asyncio.ensure_future(evaluator._drain_reports(reports))
+            for chunk_index, sent in enumerate(sent_reports):
+                await reports.put(("job", chunk_index, None, sent))
+            await reports.put(None)
+            await asyncio.wait_for(sender, 5)
+
+        asyncio.run(run())
+
+        self.assertEqual([sent.result(timeout=0) for sent in sent_reports], [False, False, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import incremental
+from testers import s3_tester
+
+
+class _FakeS3Client:
+    # Every response carries new metadata, like the real API
+    def __init__(self):
+        self.requests = 0
+
+    def _response(self, **fields):
+        self.requests += 1
+        fields["ResponseMetadata"] = {"RequestId": str(self.requests), "HTTPHeaders": {"date": str(self.requests)}}
+        return fields
+
+    def list_buckets(self):
+        return self._response(Buckets=[{"Name": "bucket"}])
+
+    def get_bucket_location(self, Bucket):
+        return self._response(LocationConstraint="eu-west-1")
+
+    def get_bucket_acl(self, Bucket):
+        return self._response(Grants=[])
+
+    def get_bucket_versioning(self, Bucket):
+        return self._response(Status="Enabled", MFADelete="Disabled")
+
+    def get_bucket_policy(self, Bucket):
+        return self._response(Policy='{"Statement": []}')
+
+    def get_bucket_policy_status(self, Bucket):
+        return self._response(PolicyStatus={"IsPublic": False})
+
+    def __getattr__(self, name):
+        return lambda **kwargs: self._response()
+
+
+class _FakeAwsContext:
+    user_id = "user"
+    account_arn = "arn:aws:iam::123456789012:root"
+    account_id = "123456789012"
+    region_name = "eu-west-1"
+    shard_index = 0
+    shard_count = 1
+    state_store = None
+
+    def __init__(self):
+        self.s3_client = _FakeS3Client()
+
+    def client(self, service_name, region_name=None):
+        return self.s3_client
+
+    def in_shard(self, resource_key):
+        return True
+
+
+class TestBucketSnapshot(unittest.TestCase):
+    def test_unchanged_bucket_has_a_stable_fingerprint(self):
+        tester = s3_tester.Tester(_FakeAwsContext())
+        first_snapshot = tester._get_bucket_snapshot("bucket")
+        second_snapshot = tester._get_bucket_snapshot("bucket")
+        self.assertEqual(first_snapshot["versioning"], {"Status": "Enabled", "MFADelete": "Disabled"})
+        self.assertEqual(incremental.get_fingerprint(first_snapshot), incremental.get_fingerprint(second_snapshot))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auto_posture_evaluator
+import state_store
+
+
+class _SharedStateStore(state_store.LocalFileStateStore):
+    shared = True
+
+
+class ShardedExecutionTest(unittest.TestCase):
+    def _new_evaluator(self, store):
+        # Only what the coordinator reads before it plans the scan
+        evaluator = auto_posture_evaluator.AutoPostureEvaluator.__new__(auto_posture_evaluator.AutoPostureEvaluator)
+        evaluator.state_store = store
+        evaluator.get_execution_plan = lambda: self.fail("The scan was planned")
+        return evaluator
+
+    def test_local_state_store_is_rejected_before_any_shard_starts(self):
+        state_dir = tempfile.mkdtemp()
+        evaluator = self._new_evaluator(state_store.LocalFileStateStore(state_dir))
+
+        with self.assertRaisesRegex(Exception, "AUTOPOSTURE_STATE_STORE"):
+            evaluator.start_execution("function")
+        with self.assertRaisesRegex(Exception, "AUTOPOSTURE_STATE_STORE"):
+            evaluator.get_execution_status("execution")
+        self.assertEqual(os.listdir(state_dir), [])
+
+    def test_shared_state_store_is_accepted(self):
+        evaluator = self._new_evaluator(_SharedStateStore(tempfile.mkdtemp()))
+
+        with self.assertRaisesRegex(Exception, "The execution execution was not found"):
+            evaluator.get_execution_status("execution")
+
+
+if __name__ == '__main__':
+    unittest.main()